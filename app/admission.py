@@ -0,0 +1,215 @@
+"""
+Ограничение частоты запросов и контроль нагрузки на пул соединений.
+Запросы делятся на группы маршрутов (route_group): чтение, выдачи
+(POST /borrows/...), остальные изменения и поток событий. Для каждой группы
+настраиваются (ADMISSION_<ГРУППА>_<ПАРАМЕТР>, 0 - проверка выключена):
+- RATE и BURST - token bucket на клиента: RATE запросов в секунду,
+  до BURST подряд; сверх лимита - 429;
+- CONCURRENCY - число одновременно выполняемых запросов группы в процессе;
+  сверх него - 503 сразу, а не ожидание в очереди пула;
+- MAX_POOL_WAIT_MS - порог ожидания соединения из пула основной базы
+  (metrics.pool_wait, синхронный или асинхронный пул при DB_ASYNC);
+  выше него новые запросы группы получают 503.
+Ответы 429 и 503 содержат Retry-After. Для чтения порог ожидания по
+умолчанию ниже, чем для изменений: при перегрузке первыми отклоняются чтения.
+Бакеты хранятся в памяти процесса или в Redis (ADMISSION_BACKEND=redis),
+тогда лимит общий для всех процессов приложения.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics, serialization
+
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER")
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "100000"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+EXEMPT_PATHS = ("/metrics", "/cache/stats", "/docs", "/redoc", "/openapi.json")
+
+
+class GroupLimits(NamedTuple):
+    rate: float
+    burst: int
+    concurrency: int
+    max_pool_wait_ms: float
+
+
+def _limits(group: str, rate: float = 0, burst: int = 0, concurrency: int = 0, max_pool_wait_ms: float = 0) -> GroupLimits:
+    prefix = f"ADMISSION_{group.upper()}_"
+    rate = float(os.getenv(prefix + "RATE", rate))
+    return GroupLimits(
+        rate=rate,
+        burst=int(os.getenv(prefix + "BURST", burst or max(1, math.ceil(rate)))),
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        max_pool_wait_ms=float(os.getenv(prefix + "MAX_POOL_WAIT_MS", max_pool_wait_ms)),
+    )
+
+
+GROUPS = {
+    "reads": _limits("reads", max_pool_wait_ms=500),
+    "borrows": _limits("borrows", max_pool_wait_ms=2000),
+    "writes": _limits("writes", max_pool_wait_ms=1000),
+    # Long-poll и SSE не держат соединение из пула, пока ждут событий.
+    "events": _limits("events"),
+}
+
+
+def route_group(method: str, path: str) -> str:
+    """
+    Группа маршрутов запроса для выбора лимитов из GROUPS.
+    """
+    if path == "/events" or path.startswith("/events/"):
+        return "events"
+    if method in ("GET", "HEAD"):
+        return "reads"
+    if method == "POST" and (path == "/borrows" or path.startswith("/borrows/")):
+        return "borrows"
+    return "writes"
+
+
+class MemoryBackend:
+    """
+    Бакеты в памяти процесса (GCRA: для каждого клиента хранится одно
+    число - теоретическое время следующего запроса, что эквивалентно
+    token bucket). Число клиентов ограничено, самые давние вытесняются.
+    """
+
+    def __init__(self, maxsize: int = ADMISSION_MAX_CLIENTS):
+        self.maxsize = maxsize
+        self._tat = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Забирает токен из бакета key.
+        :return: 0, если запрос разрешен, иначе через сколько секунд появится токен.
+        """
+        interval = 1 / rate
+        now = time.monotonic()
+        with self._lock:
+            tat = max(self._tat.get(key, now), now) + interval
+            allow_at = tat - burst * interval
+            if now < allow_at:
+                return allow_at - now
+            self._tat[key] = tat
+            self._tat.move_to_end(key)
+            while len(self._tat) > self.maxsize:
+                self._tat.popitem(last=False)
+        return 0.0
+
+
+# Тот же GCRA в Redis одним атомарным скриптом; время берется с сервера Redis,
+# поэтому расхождение часов процессов приложения на лимит не влияет.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now) + interval
+local allow_at = tat - tonumber(ARGV[2]) * interval
+if now < allow_at then
+    return tostring(allow_at - now)
+end
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+return '0'
+"""
+
+
+class RedisBackend:
+    """
+    Бакеты во внешнем хранилище с интерфейсом Redis: нужен метод
+    eval(script, numkeys, *keys_and_args), как у redis.Redis.
+    """
+    blocking = True
+
+    def __init__(self, client, prefix: str = "library:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        return float(self.client.eval(GCRA_SCRIPT, 1, self.prefix + key, repr(1 / rate), burst))
+
+
+def create_backend(name: str = ADMISSION_BACKEND):
+    """
+    Создает хранилище бакетов по имени из ADMISSION_BACKEND: memory или redis.
+    Пакет redis нужен только для ADMISSION_BACKEND=redis.
+    """
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        import redis
+        return RedisBackend(redis.Redis.from_url(REDIS_URL))
+    raise ValueError(f"Unknown admission backend: {name}")
+
+
+def client_id(scope) -> str:
+    """
+    Идентификатор клиента: значение заголовка ADMISSION_CLIENT_HEADER
+    (например, X-API-Key или X-Forwarded-For за прокси) или адрес подключения.
+    """
+    if ADMISSION_CLIENT_HEADER:
+        name = ADMISSION_CLIENT_HEADER.lower().encode()
+        for header, value in scope.get("headers", ()):
+            if header == name:
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware: отклоняет запрос до обработчика, если пул перегружен,
+    у клиента кончились токены или группа исчерпала лимит параллельности.
+    """
+
+    def __init__(self, app, backend=None, groups: Optional[dict] = None):
+        self.app = app
+        self.backend = backend if backend is not None else create_backend()
+        self.groups = groups if groups is not None else GROUPS
+        self.in_flight = dict.fromkeys(self.groups, 0)
+
+    async def _reject(self, scope, receive, send, group: str, reason: str, status: int, retry_after: float):
+        metrics.ADMISSION_REJECTED.inc(group=group, reason=reason)
+        response = serialization.ORJSONResponse(
+            {"detail": "Too many requests" if status == 429 else "Service overloaded"},
+            status_code=status,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        group = route_group(scope["method"], scope["path"].rstrip("/") or "/")
+        limits = self.groups[group]
+
+        if limits.max_pool_wait_ms and max(metrics.pool_wait(), metrics.pool_wait("async")) * 1000 > limits.max_pool_wait_ms:
+            await self._reject(scope, receive, send, group, "pool_wait", 503, ADMISSION_RETRY_AFTER_SECONDS)
+            return
+        if limits.rate:
+            key = f"{group}:{client_id(scope)}"
+            if getattr(self.backend, "blocking", False):
+                wait = await run_in_threadpool(self.backend.take, key, limits.rate, limits.burst)
+            else:
+                wait = self.backend.take(key, limits.rate, limits.burst)
+            if wait:
+                await self._reject(scope, receive, send, group, "rate_limit", 429, wait)
+                return
+        if limits.concurrency and self.in_flight[group] >= limits.concurrency:
+            await self._reject(scope, receive, send, group, "concurrency", 503, ADMISSION_RETRY_AFTER_SECONDS)
+            return
+
+        self.in_flight[group] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[group] -= 1
@@ -0,0 +1,82 @@
+"""
+Перенос закрытых выдач в архив (models.BorrowArchive).
+Выдачи, возвращенные раньше чем ARCHIVE_AFTER_DAYS дней назад, переносятся
+пачками по ARCHIVE_BATCH_SIZE строк, по одной короткой транзакции на пачку,
+поэтому задание можно запускать на работающей базе. В таблице borrows остаются
+незакрытые и недавние выдачи: списки, каскадные удаления и обслуживание
+индексов работают с ней, не затрагивая историю.
+Счетчики app.stats при переносе не меняются.
+Тем же заданием удаляются опубликованные события outbox старше
+EVENTS_RETENTION_DAYS дней (app.events.purge_events).
+
+Запуск по расписанию (например, из cron):
+    python -m app.archive --older-than 365 --batch-size 1000
+"""
+import argparse
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app import database, events, models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+COLUMNS = ("id", "book_id", "reader_id", "reader_name", "borrow_date", "return_date", "version", "updated_at")
+
+
+def archive_borrows(
+    db: Session,
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    today: Optional[date] = None,
+) -> int:
+    """
+    Переносит закрытые выдачи старше older_than_days дней в borrows_archive.
+    :param db: Сессия базы данных.
+    :param older_than_days: Сколько дней после возврата выдача остается в borrows.
+    :param batch_size: Число строк в одной транзакции.
+    :param today: Текущая дата (для тестов).
+    :return: Число перенесенных выдач.
+    """
+    cutoff = (today or date.today()) - timedelta(days=older_than_days)
+    borrows = models.Borrow.__table__
+    moved = 0
+    while True:
+        ids = db.scalars(
+            select(borrows.c.id).where(borrows.c.return_date < cutoff).order_by(borrows.c.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.execute(insert(models.BorrowArchive).from_select(
+            COLUMNS, select(*(borrows.c[name] for name in COLUMNS)).where(borrows.c.id.in_(ids))
+        ))
+        db.execute(delete(borrows).where(borrows.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than", type=int, default=ARCHIVE_AFTER_DAYS, help="Дней после возврата")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    database.configure()
+    db = database.SessionLocal()
+    try:
+        print(f"archived {archive_borrows(db, args.older_than, args.batch_size)} borrows")
+        print(f"purged {events.purge_events(db)} events")
+    finally:
+        db.close()
+        database.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, Optional, Type
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
+
+from app import pagination
+
+CHUNK_SIZE = 1000
+
+JSON_TYPES = ("application/json",)
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_TYPES = ("text/csv",)
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+async def _lines(request: Request) -> AsyncIterator[str]:
+    """
+    Разбивает тело запроса на строки по мере поступления, не буферизуя его целиком.
+    """
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def read_records(request: Request) -> AsyncIterator[tuple[int, object]]:
+    """
+    Читает записи из тела запроса: JSON-массив, NDJSON или CSV с заголовком.
+    Строки NDJSON и CSV разбираются потоково. Пустые значения CSV опускаются,
+    чтобы сработали значения по умолчанию схемы.
+    :param request: Входящий запрос.
+    :return: Асинхронный генератор пар (номер строки, запись).
+    :raises HTTPException: Если тип содержимого не поддерживается или JSON поврежден.
+    """
+    content_type = request.headers.get("content-type", JSON_TYPES[0]).split(";")[0].strip().lower()
+    if content_type in JSON_TYPES:
+        try:
+            records = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array")
+        for row, record in enumerate(records):
+            yield row, record
+    elif content_type in NDJSON_TYPES:
+        row = 0
+        async for line in _lines(request):
+            if not line.strip():
+                continue
+            try:
+                yield row, json.loads(line)
+            except ValueError:
+                yield row, line
+            row += 1
+    elif content_type in CSV_TYPES:
+        header, pending, row = None, "", 0
+        async for line in _lines(request):
+            pending = f"{pending}\n{line}" if pending else line
+            if pending.count('"') % 2:
+                continue
+            values = next(csv.reader([pending]), [])
+            pending = ""
+            if not values:
+                continue
+            if header is None:
+                header = values
+                continue
+            yield row, {key: value for key, value in zip(header, values) if value != ""}
+            row += 1
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+
+def _write_chunk(db: Session, chunk: list, schema: Type[BaseModel], write: Callable, result: dict):
+    valid = []
+    for row, record in chunk:
+        try:
+            valid.append((row, schema.model_validate(record)))
+        except ValidationError as e:
+            result["errors"].append({
+                "row": row,
+                "detail": "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors()),
+            })
+    if not valid:
+        return
+    rejected = write(db, valid)
+    result["inserted"] += len(valid) - len(rejected)
+    result["errors"].extend({"row": row, "detail": detail} for row, detail in rejected)
+
+
+async def _write_async(db, chunk, schema, write, result):
+    # AsyncSession (DB_ASYNC) пишет через асинхронный драйвер, Session - в потоке пула.
+    if isinstance(db, AsyncSession):
+        await db.run_sync(_write_chunk, chunk, schema, write, result)
+    else:
+        await run_in_threadpool(_write_chunk, db, chunk, schema, write, result)
+
+
+async def import_records(request: Request, db: Session, schema: Type[BaseModel], write: Callable) -> dict:
+    """
+    Импортирует записи пачками по CHUNK_SIZE: каждая пачка валидируется
+    и записывается отдельной транзакцией функцией write из app.crud.
+    Ошибочные строки не прерывают импорт и возвращаются в отчете.
+    :param request: Входящий запрос с данными.
+    :param db: Сессия базы данных (Session или AsyncSession).
+    :param schema: Pydantic-модель для валидации строк.
+    :param write: Функция пакетной записи вида crud.bulk_create_*.
+    :return: Отчет об импорте (Pydantic-модель BulkResult).
+    """
+    result = {"inserted": 0, "errors": []}
+    chunk = []
+    async for row, record in read_records(request):
+        chunk.append((row, record))
+        if len(chunk) >= CHUNK_SIZE:
+            await _write_async(db, chunk, schema, write, result)
+            chunk = []
+    if chunk:
+        await _write_async(db, chunk, schema, write, result)
+    result["errors"].sort(key=lambda error: error["row"])
+    return result
+
+
+def export_records(
+    build_query: Callable[[Session], Query],
+    id_column,
+    schema: Type[BaseModel],
+    fmt: str = "ndjson",
+    after: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Потоковая выгрузка всей таблицы в формате NDJSON или CSV.
+    :param build_query: Функция, строящая запрос по переданной сессии.
+    :param id_column: Столбец первичного ключа модели.
+    :param schema: Pydantic-модель для сериализации строк.
+    :param fmt: Формат выгрузки: ndjson или csv.
+    :param after: Курсор, после которого продолжить выгрузку.
+    :return: Потоковый ответ.
+    """
+    if fmt == "ndjson":
+        return pagination.stream_ndjson(build_query, id_column, schema, after)
+    last_id = pagination.decode_cursor(after) if after is not None else None
+    fields = list(schema.model_fields)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        for row in pagination.iter_rows(build_query, id_column, last_id):
+            writer.writerow(schema.model_validate(row, from_attributes=True).model_dump(mode="json"))
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(generate(), media_type="text/csv")
@@ -0,0 +1,222 @@
+"""
+Кэш чтения для справочных данных (авторы, книги).
+По умолчанию используется LRU-кэш в памяти процесса с TTL и ограничением размера;
+при CACHE_BACKEND=redis - внешнее хранилище с интерфейсом get/set/delete
+(redis.Redis или любой совместимый клиент).
+В кэш кладутся словари ответов; RedisBackend кодирует их через orjson,
+поэтому даты после чтения из Redis возвращаются строками ISO 8601.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import orjson
+
+from app import serialization
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class LRUBackend:
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с TTL.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """
+    Кэш во внешнем хранилище с интерфейсом Redis (get, set с ex, delete).
+    Значения сериализуются в JSON (orjson), ключи получают общий префикс.
+    """
+
+    def __init__(self, client, ttl: float = CACHE_TTL, prefix: str = "library:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else orjson.loads(raw)
+
+    def set(self, key: str, value: Any):
+        self.client.set(self.prefix + key, serialization.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        pass
+
+
+class NullBackend:
+    """
+    Отключенный кэш (CACHE_BACKEND=none).
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def delete(self, *keys: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+class Cache:
+    """
+    Обертка над бэкендом: чтение через кэш, точечная инвалидация и счетчики попаданий.
+    Страницы списков хранятся под ключом с токеном поколения пространства имен;
+    invalidate_namespace меняет токен, и все страницы устаревают разом. Тот же токен
+    защищает отдельные записи от гонки чтения с изменением (get_or_load с namespace),
+    поэтому изменяющий код сбрасывает поколение до ключей записей.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_or_load(
+        self, key: str, load: Callable[[], Optional[Any]], store: bool = True, namespace: Optional[str] = None
+    ) -> Optional[Any]:
+        """
+        Возвращает значение из кэша или загружает и кэширует его.
+        Значение None (запись не найдена) не кэшируется.
+        :param key: Ключ кэша.
+        :param load: Функция загрузки значения из базы данных.
+        :param store: Сохранять ли загруженное значение. Чтения с реплики его не
+            сохраняют: отстающая реплика вернула бы в кэш уже сброшенные данные.
+        :param namespace: Пространство имен записи. Если за время загрузки его
+            поколение сменилось (запись изменили и сбросили), значение не сохраняется:
+            иначе прочитанная до изменения строка жила бы в кэше весь TTL.
+        :return: Закэшированное или загруженное значение.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(True)
+            return value
+        self._count(False)
+        generation = self._generation(namespace) if store and namespace is not None else None
+        value = load()
+        if value is None or not store:
+            return value
+        if namespace is None:
+            self.backend.set(key, value)
+        elif self.backend.get(f"{namespace}:generation") == generation:
+            self.backend.set(key, value)
+            # Поколение сменилось между проверкой и записью: изменяющий код сбрасывает
+            # поколение раньше ключа, поэтому записанное значение удаляется здесь.
+            if self.backend.get(f"{namespace}:generation") != generation:
+                self.backend.delete(key)
+        return value
+
+    def _generation(self, namespace: str) -> str:
+        generation_key = f"{namespace}:generation"
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(generation_key, generation)
+        return generation
+
+    def namespace_key(self, namespace: str, *parts) -> str:
+        """
+        Ключ страницы списка в текущем поколении пространства имен.
+        """
+        return ":".join([namespace, self._generation(namespace), *map(str, parts)])
+
+    def invalidate(self, *keys: str):
+        self.backend.delete(*keys)
+
+    def invalidate_namespace(self, *namespaces: str):
+        self.backend.delete(*(f"{namespace}:generation" for namespace in namespaces))
+
+    def stats(self) -> dict:
+        size = len(self.backend) if hasattr(self.backend, "__len__") else None
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses, "size": size}
+
+    def reset(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    """
+    Создает бэкенд кэша по имени из CACHE_BACKEND: memory, redis или none.
+    Пакет redis нужен только для CACHE_BACKEND=redis.
+    """
+    if name == "memory":
+        return LRUBackend()
+    if name == "redis":
+        import redis
+        return RedisBackend(redis.Redis.from_url(REDIS_URL))
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+cache = Cache(create_backend())
+
+
+def book_key(book_id: int) -> str:
+    return f"book:{book_id}"
+
+
+def author_key(author_id: int) -> str:
+    return f"author:{author_id}"
@@ -0,0 +1,109 @@
+"""
+Условные HTTP-запросы: ETag и Last-Modified для чтения, If-Match для изменения.
+ETag записи строится из ее версии (столбец version) и времени изменения, ETag
+страницы списка - из ID и версий вошедших в нее записей и курсора следующей
+страницы, поэтому страница меняет ETag при любом изменении, удалении или
+вставке в ее диапазоне. Ответ 304 отдается без сериализации данных.
+Развернутые ответы (?expand) не получают ETag: они зависят от вложенных объектов.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+class PreconditionFailed(Exception):
+    """
+    Версия записи не совпадает с переданной в If-Match.
+    """
+
+
+def _as_utc(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _field(item, name):
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+def entity_tag(item) -> str:
+    """
+    Сильный ETag записи.
+    :param item: Объект модели или словарь ответа с полями version и updated_at.
+    """
+    return f'"{_field(item, "version")}-{_as_utc(_field(item, "updated_at")):%Y%m%d%H%M%S%f}"'
+
+
+def page_tag(page: dict) -> str:
+    """
+    Слабый ETag страницы списка (словарь Pydantic-модели Page).
+    """
+    digest = hashlib.sha1(repr((
+        [(item["id"], item["version"]) for item in page["items"]],
+        page["next_cursor"],
+    )).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def last_modified(item) -> datetime:
+    return _as_utc(_field(item, "updated_at")).replace(microsecond=0)
+
+
+def _tags(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _weak_match(tag: str, tags: list[str]) -> bool:
+    return "*" in tags or tag.removeprefix("W/") in {candidate.removeprefix("W/") for candidate in tags}
+
+
+def if_match(request: Request) -> Optional[list[str]]:
+    """
+    ETag из заголовка If-Match или None, если заголовка нет.
+    """
+    header = request.headers.get("if-match")
+    return None if header is None else _tags(header)
+
+
+def check_if_match(tags: Optional[list[str]], item):
+    """
+    Сильное сравнение If-Match с текущим ETag записи.
+    :raises PreconditionFailed: Если ни один ETag не совпадает.
+    """
+    if tags is None or "*" in tags:
+        return
+    if entity_tag(item) not in tags:
+        raise PreconditionFailed()
+
+
+def respond(request: Request, response: Response, etag: str, modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    Проставляет ETag и Last-Modified и проверяет If-None-Match / If-Modified-Since.
+    :param request: Запрос.
+    :param response: Ответ эндпоинта (заголовки переносятся в итоговый ответ).
+    :param etag: ETag представления.
+    :param modified: Время изменения представления, если известно.
+    :return: Ответ 304 Not Modified, если у клиента актуальная версия, иначе None.
+    """
+    headers = {"ETag": etag}
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _weak_match(etag, _tags(if_none_match))
+    elif modified is not None and request.headers.get("if-modified-since"):
+        try:
+            fresh = modified <= parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            fresh = False
+    else:
+        fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
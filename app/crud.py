@@ -1,5 +1,19 @@
+import os
+from collections import Counter
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app import models, schemas
+from sqlalchemy.orm.exc import StaleDataError
+from app import models, schemas, pagination, events, stats
+from app.conditional import PreconditionFailed, check_if_match
+from app.cache import cache, author_key, book_key
+from app.database import is_replica
+from app.expand import (
+    author_options, book_options, borrow_options, dump_author, dump_book, dump_borrow, dump_page,
+)
+
+MAX_ACTIVE_LOANS = int(os.getenv("MAX_ACTIVE_LOANS", "5"))
 
 def create_author(db: Session, author: schemas.AuthorCreate):
     """
@@ -8,12 +22,119 @@ def create_author(db: Session, author: schemas.AuthorCreate):
     :param author: Pydantic-модель AuthorCreate с данными автора.
     :return: Созданная запись автора (объект модели Author).
     """
-    db_author = models.Author(**author.dict())
+    db_author = models.Author(**author.model_dump())
     db.add(db_author)
     db.commit()
     db.refresh(db_author)
+    cache.invalidate_namespace("authors")
+    return db_author
+
+def get_author(db: Session, author_id: int, expand: frozenset[str] = frozenset()):
+    """
+    Чтение автора по ID. Без expand результат берется из кэша.
+    :param db: Сессия базы данных.
+    :param author_id: Идентификатор автора.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Данные автора (словарь Pydantic-модели AuthorExpanded) или None.
+    """
+    def load():
+        author = (
+            db.query(models.Author)
+            .options(*author_options(expand))
+            .filter(models.Author.id == author_id)
+            .first()
+        )
+        return None if author is None else dump_author(author, expand)
+
+    if expand:
+        return load()
+    return cache.get_or_load(author_key(author_id), load, store=not is_replica(db), namespace="authors")
+
+def list_authors(db: Session, limit: int, after=None, expand: frozenset[str] = frozenset()):
+    """
+    Страница авторов (keyset-пагинация). Без expand читаются только столбцы
+    схемы (pagination.paginate_rows), а результат берется из кэша.
+    :param db: Сессия базы данных.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Словарь Pydantic-модели Page[AuthorExpanded].
+    """
+    if expand:
+        query = db.query(models.Author).options(*author_options(expand))
+        return dump_page(pagination.paginate(query, models.Author.id, limit, after), dump_author, expand)
+    return cache.get_or_load(
+        cache.namespace_key("authors", limit, after),
+        lambda: pagination.paginate_rows(db, models.Author, schemas.Author, limit, after),
+        store=not is_replica(db),
+    )
+
+def update_author(db: Session, author_id: int, author: schemas.AuthorCreate, if_match=None):
+    """
+    Обновление данных автора.
+    UPDATE выполняется с условием на версию строки (version_id_col), поэтому
+    изменение, сделанное параллельно после проверки If-Match, не перезаписывается.
+    :param db: Сессия базы данных.
+    :param author_id: Идентификатор автора.
+    :param author: Pydantic-модель AuthorCreate с новыми данными.
+    :param if_match: ETag из заголовка If-Match (app.conditional.if_match) или None.
+    :return: Обновленная запись автора (объект модели Author) или None, если автор не найден.
+    :raises PreconditionFailed: Если версия записи не совпадает с If-Match.
+    """
+    db_author = db.get(models.Author, author_id)
+    if db_author is None:
+        return None
+    check_if_match(if_match, db_author)
+    for key, value in author.model_dump().items():
+        setattr(db_author, key, value)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise PreconditionFailed()
+    db.refresh(db_author)
+    cache.invalidate_namespace("authors")
+    cache.invalidate(author_key(author_id))
     return db_author
 
+def delete_author(db: Session, author_id: int) -> bool:
+    """
+    Удаление автора вместе с его книгами и записями о выдаче (включая архив).
+    Каскад выполняется DELETE по условию, без загрузки строк в сессию,
+    поэтому число запросов не зависит от количества книг и выдач.
+    Пишется одно событие author.deleted со списком удаленных книг.
+    :param db: Сессия базы данных.
+    :param author_id: Идентификатор автора.
+    :return: True, если автор был удален; False, если не найден.
+    """
+    author_books = select(models.Book.id).where(models.Book.author_id == author_id)
+    release_book_loans(db, author_books)
+    db.execute(
+        delete(models.Borrow).where(models.Borrow.book_id.in_(author_books)),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(
+        delete(models.BorrowArchive).where(models.BorrowArchive.book_id.in_(author_books)),
+        execution_options={"synchronize_session": False},
+    )
+    stats.forget_books(db, author_books)
+    book_ids = db.scalars(
+        delete(models.Book).where(models.Book.author_id == author_id).returning(models.Book.id),
+        execution_options={"synchronize_session": False},
+    ).all()
+    deleted = db.execute(
+        delete(models.Author).where(models.Author.id == author_id),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    if not deleted:
+        db.rollback()
+        return False
+    events.record(db, "author.deleted", [{"id": author_id, "book_ids": book_ids}])
+    db.commit()
+    cache.invalidate_namespace("authors", "books")
+    cache.invalidate(author_key(author_id), *map(book_key, book_ids))
+    return True
+
 def create_book(db: Session, book: schemas.BookCreate):
     """
     Создание новой книги в базе данных.
@@ -21,26 +142,673 @@ def create_book(db: Session, book: schemas.BookCreate):
     :param book: Pydantic-модель BookCreate с данными книги.
     :return: Созданная запись книги (объект модели Book).
     """
-    db_book = models.Book(**book.dict())
+    db_book = models.Book(**book.model_dump())
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    cache.invalidate_namespace("books")
+    return db_book
+
+def get_book(db: Session, book_id: int, expand: frozenset[str] = frozenset()):
+    """
+    Чтение книги по ID. Без expand результат берется из кэша.
+    :param db: Сессия базы данных.
+    :param book_id: Идентификатор книги.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Данные книги (словарь Pydantic-модели BookExpanded) или None.
+    """
+    def load():
+        book = (
+            db.query(models.Book)
+            .options(*book_options(expand))
+            .filter(models.Book.id == book_id)
+            .first()
+        )
+        return None if book is None else dump_book(book, expand)
+
+    if expand:
+        return load()
+    return cache.get_or_load(book_key(book_id), load, store=not is_replica(db), namespace="books")
+
+def list_books(db: Session, limit: int, after=None, expand: frozenset[str] = frozenset()):
+    """
+    Страница книг (keyset-пагинация). Без expand читаются только столбцы
+    схемы (pagination.paginate_rows), а результат берется из кэша.
+    :param db: Сессия базы данных.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Словарь Pydantic-модели Page[BookExpanded].
+    """
+    if expand:
+        query = db.query(models.Book).options(*book_options(expand))
+        return dump_page(pagination.paginate(query, models.Book.id, limit, after), dump_book, expand)
+    return cache.get_or_load(
+        cache.namespace_key("books", limit, after),
+        lambda: pagination.paginate_rows(db, models.Book, schemas.Book, limit, after),
+        store=not is_replica(db),
+    )
+
+def update_book(db: Session, book_id: int, book: schemas.BookCreate, if_match=None):
+    """
+    Обновление данных книги.
+    UPDATE выполняется с условием на версию строки (version_id_col), поэтому
+    изменение, сделанное параллельно после проверки If-Match, не перезаписывается.
+    :param db: Сессия базы данных.
+    :param book_id: Идентификатор книги.
+    :param book: Pydantic-модель BookCreate с новыми данными.
+    :param if_match: ETag из заголовка If-Match (app.conditional.if_match) или None.
+    :return: Обновленная запись книги (объект модели Book) или None, если книга не найдена.
+    :raises PreconditionFailed: Если версия записи не совпадает с If-Match.
+    """
+    db_book = db.get(models.Book, book_id)
+    if db_book is None:
+        return None
+    check_if_match(if_match, db_book)
+    for key, value in book.model_dump().items():
+        setattr(db_book, key, value)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise PreconditionFailed()
+    db.refresh(db_book)
+    cache.invalidate_namespace("books")
+    cache.invalidate(book_key(book_id))
     return db_book
 
+def delete_book(db: Session, book_id: int) -> bool:
+    """
+    Удаление книги и связанных записей о выдаче (включая архив) DELETE по условию.
+    Пишется одно событие book.deleted: выдачи книги удаляются вместе с ней.
+    :param db: Сессия базы данных.
+    :param book_id: Идентификатор книги.
+    :return: True, если книга была удалена; False, если не найдена.
+    """
+    release_book_loans(db, [book_id])
+    db.execute(
+        delete(models.Borrow).where(models.Borrow.book_id == book_id),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(
+        delete(models.BorrowArchive).where(models.BorrowArchive.book_id == book_id),
+        execution_options={"synchronize_session": False},
+    )
+    stats.forget_books(db, [book_id])
+    deleted = db.execute(
+        delete(models.Book).where(models.Book.id == book_id),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    if not deleted:
+        db.rollback()
+        return False
+    events.record(db, "book.deleted", [{"id": book_id}])
+    db.commit()
+    cache.invalidate_namespace("books")
+    cache.invalidate(book_key(book_id))
+    return True
+
 def create_borrow(db: Session, borrow: schemas.BorrowCreate):
     """
     Создание записи о выдаче книги.
+    Копия резервируется одним условным UPDATE (available_copies > 0),
+    поэтому параллельные запросы не могут выдать больше копий, чем есть.
+    Незакрытая выдача учитывается в счетчике читателя (reserve_loans),
+    лимит выдач проверяется тем же UPDATE. Закрытая выдача (с return_date)
+    записывается как история, как в bulk_create_borrows, и остатки не меняет.
+    Резервирование, вставка выдачи, счетчики статистики (app.stats)
+    и событие borrow.created (app.events) фиксируются одной транзакцией.
     :param db: Сессия базы данных.
     :param borrow: Pydantic-модель BorrowCreate с данными о выдаче.
     :return: Созданная запись о выдаче (объект модели Borrow).
-    :raises ValueError: Если нет доступных копий книги.
+    :raises ValueError: Если нет доступных копий книги (для закрытой выдачи -
+        если книга не найдена), читатель не найден или у читателя уже максимум
+        незакрытых выдач.
+    """
+    is_open = borrow.return_date is None
+    if is_open:
+        reserved = db.execute(
+            update(models.Book)
+            .where(models.Book.id == borrow.book_id, models.Book.available_copies > 0)
+            .values(available_copies=models.Book.available_copies - 1)
+            .returning(models.Book.id)
+        ).scalar_one_or_none()
+        if reserved is None:
+            db.rollback()
+            raise ValueError("No available copies")
+    elif db.scalar(select(models.Book.id).where(models.Book.id == borrow.book_id)) is None:
+        db.rollback()
+        raise ValueError("Book not found")
+    (reader,) = resolve_readers(db, [borrow])
+    if reader is None:
+        db.rollback()
+        raise ValueError("Reader not found")
+    if is_open and not reserve_loans(db, {reader[0]: 1}):
+        db.rollback()
+        raise ValueError("Loan limit reached")
+    db_borrow = models.Borrow(**_borrow_row(borrow, reader))
+    db.add(db_borrow)
+    db.flush()
+    stats.record_borrows(db, [(borrow.book_id, borrow.borrow_date, is_open)])
+    events.record(db, "borrow.created", [events.borrow_payload(db_borrow)])
+    db.commit()
+    cache.invalidate_namespace("books")
+    cache.invalidate(book_key(borrow.book_id))
+    return db_borrow
+
+def return_borrow(db: Session, borrow_id: int, return_date):
+    """
+    Возврат книги одной транзакцией.
+    Выдача закрывается условным UPDATE (return_date IS NULL), и только в этом
+    случае копия атомарно возвращается на полку, поэтому параллельные и
+    повторные запросы не могут вернуть одну выдачу дважды. Повтор с той же
+    датой возврата считается успешным и остатки не меняет.
+    Событие borrow.returned пишется только при фактическом закрытии выдачи.
+    :param db: Сессия базы данных.
+    :param borrow_id: Идентификатор выдачи.
+    :param return_date: Дата возврата.
+    :return: Закрытая запись о выдаче (объект модели Borrow) или None, если выдача не найдена.
+    :raises ValueError: Если выдача уже закрыта с другой датой возврата.
+    """
+    borrow = db.scalars(
+        update(models.Borrow)
+        .where(models.Borrow.id == borrow_id, models.Borrow.return_date.is_(None))
+        .values(return_date=return_date)
+        .returning(models.Borrow)
+    ).one_or_none()
+    if borrow is None:
+        db.rollback()
+        borrow = db.get(models.Borrow, borrow_id)
+        if borrow is not None and borrow.return_date != return_date:
+            raise ValueError("Borrow already returned")
+        return borrow
+    release_copies(db, {borrow.book_id: 1})
+    release_loans(db, {borrow.reader_id: 1})
+    stats.record_returns(db, {borrow.book_id: 1})
+    events.record(db, "borrow.returned", [events.borrow_payload(borrow)])
+    db.commit()
+    cache.invalidate_namespace("books")
+    cache.invalidate(book_key(borrow.book_id))
+    return borrow
+
+def get_borrow(db: Session, borrow_id: int, expand: frozenset[str] = frozenset()):
+    """
+    Чтение записи о выдаче по ID.
+    Выдача, не найденная в borrows, без expand ищется в архиве (app.archive).
+    :param db: Сессия базы данных.
+    :param borrow_id: Идентификатор выдачи.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Данные выдачи (словарь Pydantic-модели BorrowExpanded) или None.
+    """
+    borrow = (
+        db.query(models.Borrow)
+        .options(*borrow_options(expand))
+        .filter(models.Borrow.id == borrow_id)
+        .first()
+    )
+    if borrow is None and not expand:
+        borrow = db.get(models.BorrowArchive, borrow_id)
+    return None if borrow is None else dump_borrow(borrow, expand)
+
+def list_borrows(db: Session, limit: int, after=None, expand: frozenset[str] = frozenset()):
+    """
+    Страница записей о выдаче (keyset-пагинация).
+    Без expand читаются только столбцы схемы (pagination.paginate_rows).
+    :param db: Сессия базы данных.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :param expand: Встраиваемые связи (см. app.expand).
+    :return: Словарь Pydantic-модели Page[BorrowExpanded].
+    """
+    if not expand:
+        return pagination.paginate_rows(db, models.Borrow, schemas.Borrow, limit, after)
+    query = db.query(models.Borrow).options(*borrow_options(expand))
+    return dump_page(pagination.paginate(query, models.Borrow.id, limit, after), dump_borrow, expand)
+
+def list_archived_borrows(db: Session, limit: int, after=None):
+    """
+    Страница архивных выдач (keyset-пагинация, см. app.archive).
+    :param db: Сессия базы данных.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь Pydantic-модели Page[Borrow].
+    """
+    return pagination.paginate_rows(db, models.BorrowArchive, schemas.Borrow, limit, after)
+
+def create_reader(db: Session, reader: schemas.ReaderCreate):
     """
-    book = db.query(models.Book).filter(models.Book.id == borrow.book_id).first()
-    if book and book.available_copies > 0:
-        book.available_copies -= 1
-        db_borrow = models.Borrow(**borrow.dict())
-        db.add(db_borrow)
+    Создание читателя.
+    :param db: Сессия базы данных.
+    :param reader: Pydantic-модель ReaderCreate с данными читателя.
+    :return: Созданная запись читателя (объект модели Reader).
+    :raises ValueError: Если читатель с таким именем уже есть.
+    """
+    db_reader = models.Reader(**reader.model_dump())
+    db.add(db_reader)
+    try:
         db.commit()
-        db.refresh(db_borrow)
-        return db_borrow
-    raise ValueError("No available copies")
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("Reader already exists")
+    db.refresh(db_reader)
+    return db_reader
+
+def get_reader(db: Session, reader_id: int):
+    """
+    Чтение читателя по ID.
+    :param db: Сессия базы данных.
+    :param reader_id: Идентификатор читателя.
+    :return: Запись читателя (объект модели Reader) или None.
+    """
+    return db.get(models.Reader, reader_id)
+
+def list_readers(db: Session, limit: int, after=None):
+    """
+    Страница читателей (keyset-пагинация).
+    :param db: Сессия базы данных.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь Pydantic-модели Page[Reader].
+    """
+    return pagination.paginate_rows(db, models.Reader, schemas.Reader, limit, after)
+
+def update_reader(db: Session, reader_id: int, reader: schemas.ReaderCreate, if_match=None):
+    """
+    Обновление имени и лимита выдач читателя. Сниженный лимит не закрывает
+    уже выданные книги, а только запрещает новые выдачи.
+    Счетчик active_loans меняют только выдачи и возвраты, а reader_name
+    в выдачах остается именем на момент выдачи.
+    :param db: Сессия базы данных.
+    :param reader_id: Идентификатор читателя.
+    :param reader: Pydantic-модель ReaderCreate с новыми данными.
+    :param if_match: ETag из заголовка If-Match (app.conditional.if_match) или None.
+    :return: Обновленная запись читателя (объект модели Reader) или None, если читатель не найден.
+    :raises PreconditionFailed: Если версия записи не совпадает с If-Match.
+    :raises ValueError: Если читатель с таким именем уже есть.
+    """
+    db_reader = db.get(models.Reader, reader_id)
+    if db_reader is None:
+        return None
+    check_if_match(if_match, db_reader)
+    for key, value in reader.model_dump().items():
+        setattr(db_reader, key, value)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise PreconditionFailed()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("Reader already exists")
+    db.refresh(db_reader)
+    return db_reader
+
+def list_reader_borrows(db: Session, reader_id: int, active: bool, limit: int, after=None):
+    """
+    Страница выдач читателя (keyset-пагинация). Выборка идет по индексу
+    ix_borrows_reader_id (reader_id, id), незакрытые выдачи - по частичному
+    ix_borrows_open_reader_id, поэтому не зависит от размера таблицы borrows.
+    Выдачи, перенесенные в архив (app.archive), в список не входят.
+    :param db: Сессия базы данных.
+    :param reader_id: Идентификатор читателя.
+    :param active: Только незакрытые выдачи.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь Pydantic-модели Page[Borrow] или None, если читатель не найден.
+    """
+    if db.get(models.Reader, reader_id) is None:
+        return None
+    query = db.query(models.Borrow).filter(models.Borrow.reader_id == reader_id)
+    if active:
+        query = query.filter(models.Borrow.return_date.is_(None))
+    return pagination.paginate(query, models.Borrow.id, limit, after)
+
+def reserve_copies(db: Session, counts: dict[int, int]) -> set[int]:
+    """
+    Резервирует копии сразу нескольких книг одним UPDATE.
+    Книга резервируется, только если доступно не меньше запрошенного
+    количества копий; изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param counts: Количество копий по ID книги.
+    :return: ID книг, для которых копии зарезервированы.
+    """
+    if not counts:
+        return set()
+    requested = case(counts, value=models.Book.id)
+    stmt = (
+        update(models.Book)
+        .where(models.Book.id.in_(counts), models.Book.available_copies >= requested)
+        .values(available_copies=models.Book.available_copies - requested)
+        .returning(models.Book.id)
+        .execution_options(synchronize_session=False)
+    )
+    return set(db.scalars(stmt))
+
+def reserve_available_copies(db: Session, counts: dict[int, int]) -> dict[int, int]:
+    """
+    Резервирует по каждой книге столько копий, сколько доступно, но не больше
+    запрошенного. Остатки читаются с блокировкой строк (SELECT ... FOR UPDATE),
+    поэтому следующий UPDATE резервирует ровно прочитанное количество; в SQLite
+    блокировку на запись транзакция уже получила первым UPDATE (reserve_copies).
+    Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param counts: Количество копий по ID книги.
+    :return: Число зарезервированных копий по ID книги (книги без копий не входят).
+    """
+    if not counts:
+        return {}
+    available = db.execute(
+        select(models.Book.id, models.Book.available_copies)
+        .where(models.Book.id.in_(counts), models.Book.available_copies > 0)
+        .with_for_update()
+    )
+    granted = {book_id: min(counts[book_id], copies) for book_id, copies in available}
+    reserve_copies(db, granted)
+    return granted
+
+def release_copies(db: Session, counts: dict[int, int]):
+    """
+    Возвращает на полку копии нескольких книг одним UPDATE.
+    Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param counts: Количество копий по ID книги.
+    """
+    if not counts:
+        return
+    db.execute(
+        update(models.Book)
+        .where(models.Book.id.in_(counts))
+        .values(available_copies=models.Book.available_copies + case(counts, value=models.Book.id))
+        .execution_options(synchronize_session=False)
+    )
+
+def resolve_readers(db: Session, items) -> list:
+    """
+    Находит читателей выдач: по reader_id, а если он не задан - по имени
+    reader_name. Читатели с новыми именами создаются одним
+    INSERT ... ON CONFLICT DO NOTHING, поэтому параллельные выдачи
+    новому читателю не создают дубликатов. Изменения не фиксируются,
+    транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param items: Pydantic-модели BorrowCreate или BorrowBatchCreate.
+    :return: Пары (ID, имя читателя) в порядке items; None, если читателя с reader_id нет.
+    """
+    ids = {item.reader_id for item in items if item.reader_id is not None}
+    names = {item.reader_name for item in items if item.reader_id is None}
+    names_by_id, ids_by_name = {}, {}
+    if ids:
+        names_by_id = dict(db.execute(select(models.Reader.id, models.Reader.name).where(models.Reader.id.in_(ids))).all())
+    if names:
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        db.execute(
+            dialect.insert(models.Reader).on_conflict_do_nothing(index_elements=["name"]),
+            [{"name": name} for name in sorted(names)],
+        )
+        ids_by_name = dict(db.execute(select(models.Reader.name, models.Reader.id).where(models.Reader.name.in_(names))).all())
+    return [
+        (ids_by_name[item.reader_name], item.reader_name) if item.reader_id is None
+        else (item.reader_id, names_by_id[item.reader_id]) if item.reader_id in names_by_id
+        else None
+        for item in items
+    ]
+
+def _borrow_row(borrow: schemas.BorrowCreate, reader: tuple[int, str]) -> dict:
+    return {**borrow.model_dump(exclude={"reader_id", "reader_name"}), "reader_id": reader[0], "reader_name": reader[1]}
+
+def reserve_loans(db: Session, counts: dict[int, int]) -> set[int]:
+    """
+    Учитывает новые незакрытые выдачи в счетчиках читателей одним UPDATE.
+    Счетчик увеличивается, только если не превысит лимит читателя
+    (max_active_loans, по умолчанию MAX_ACTIVE_LOANS): параллельные выдачи
+    не могут превысить лимит, а выдачи читателя не пересчитываются COUNT(*).
+    Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param counts: Число новых выдач по ID читателя.
+    :return: ID читателей, для которых выдачи учтены.
+    """
+    if not counts:
+        return set()
+    requested = case(counts, value=models.Reader.id)
+    limit = func.coalesce(models.Reader.max_active_loans, MAX_ACTIVE_LOANS)
+    stmt = (
+        update(models.Reader)
+        .where(models.Reader.id.in_(counts), models.Reader.active_loans + requested <= limit)
+        .values(active_loans=models.Reader.active_loans + requested)
+        .returning(models.Reader.id)
+        .execution_options(synchronize_session=False)
+    )
+    return set(db.scalars(stmt))
+
+def release_loans(db: Session, counts: dict[int, int]):
+    """
+    Уменьшает счетчики незакрытых выдач читателей одним UPDATE.
+    Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param counts: Число закрытых выдач по ID читателя.
+    """
+    if not counts:
+        return
+    db.execute(
+        update(models.Reader)
+        .where(models.Reader.id.in_(counts))
+        .values(active_loans=models.Reader.active_loans - case(counts, value=models.Reader.id))
+        .execution_options(synchronize_session=False)
+    )
+
+def release_book_loans(db: Session, book_ids):
+    """
+    Уменьшает счетчики читателей на число их незакрытых выдач книг перед
+    удалением этих выдач; один UPDATE с коррелированным подзапросом.
+    :param db: Сессия базы данных.
+    :param book_ids: ID книг или подзапрос, возвращающий ID.
+    """
+    open_borrows = (models.Borrow.book_id.in_(book_ids), models.Borrow.return_date.is_(None))
+    loans = select(func.count()).where(models.Borrow.reader_id == models.Reader.id, *open_borrows).scalar_subquery()
+    db.execute(
+        update(models.Reader)
+        .where(models.Reader.id.in_(select(models.Borrow.reader_id).where(*open_borrows)))
+        .values(active_loans=models.Reader.active_loans - loans)
+        .execution_options(synchronize_session=False)
+    )
+
+def rebuild_loans(db: Session):
+    """
+    Пересчитывает счетчики active_loans по незакрытым выдачам (после импорта
+    данных в обход API). Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    """
+    loans = select(func.count()).where(
+        models.Borrow.reader_id == models.Reader.id, models.Borrow.return_date.is_(None)
+    ).scalar_subquery()
+    db.execute(update(models.Reader).values(active_loans=loans).execution_options(synchronize_session=False))
+
+def _batch_failed(db: Session, ids: list[int], failures: dict[int, str]) -> dict:
+    db.rollback()
+    return {"committed": False, "items": [{"id": item_id, "detail": failures.get(item_id)} for item_id in ids]}
+
+def create_borrows_batch(db: Session, batch: schemas.BorrowBatchCreate) -> dict:
+    """
+    Выдача нескольких книг одному читателю одной транзакцией:
+    резервирование копий (reserve_copies), проверка отказов, вставка выдач
+    одним INSERT ... RETURNING и счетчики статистики - число запросов
+    не зависит от размера пакета.
+    Повтор ID книги означает выдачу нескольких копий. Если их не хватает на все
+    повторы, в режиме partial выдаются доступные копии (первые повторы,
+    reserve_available_copies), а остальные повторы отклоняются.
+    Если читатель не найден или выданные книги превысили бы его лимит
+    (reserve_loans), пакет отклоняется целиком в обоих режимах.
+    :param db: Сессия базы данных.
+    :param batch: Pydantic-модель BorrowBatchCreate.
+    :return: Словарь Pydantic-модели BatchResult; при отказе в режиме
+        all_or_nothing изменения откатываются и committed равен False.
+    """
+    requested = Counter(batch.book_ids)
+    granted = {book_id: requested[book_id] for book_id in reserve_copies(db, requested)}
+    if batch.mode == "partial" and len(granted) < len(requested):
+        granted.update(reserve_available_copies(db, {
+            book_id: count for book_id, count in requested.items() if book_id not in granted
+        }))
+    missing = set(requested) - granted.keys()
+    existing = set(db.scalars(select(models.Book.id).where(models.Book.id.in_(missing)))) if missing else set()
+    failures = {
+        book_id: "Book not found" if book_id in missing and book_id not in existing else "No available copies"
+        for book_id, count in requested.items() if granted.get(book_id, 0) < count
+    }
+    if failures and batch.mode == "all_or_nothing":
+        return _batch_failed(db, batch.book_ids, failures)
+    (reader,) = resolve_readers(db, [batch])
+    if reader is None:
+        return _batch_failed(db, batch.book_ids, dict.fromkeys(batch.book_ids, "Reader not found"))
+
+    remaining = Counter(granted)
+    served = []
+    for book_id in batch.book_ids:
+        served.append(remaining[book_id] > 0)
+        remaining[book_id] -= 1
+    rows = [
+        {"book_id": book_id, "reader_id": reader[0], "reader_name": reader[1], "borrow_date": batch.borrow_date}
+        for book_id, is_served in zip(batch.book_ids, served) if is_served
+    ]
+    if rows and not reserve_loans(db, {reader[0]: len(rows)}):
+        return _batch_failed(db, batch.book_ids, {**dict.fromkeys(batch.book_ids, "Loan limit reached"), **failures})
+    # Порядок RETURNING не запрашивается: с sort_by_parameter_order SQLAlchemy
+    # вставляет строки в SQLite по одной. Выдачи одной книги в пакете
+    # взаимозаменяемы, поэтому строки сопоставляются с позициями по ID книги.
+    created = db.scalars(insert(models.Borrow).returning(models.Borrow), rows).all() if rows else []
+    stats.record_borrows(db, ((row["book_id"], row["borrow_date"], True) for row in rows))
+    events.record(db, "borrow.created", map(events.borrow_payload, created))
+    by_book = {}
+    for borrow in sorted(created, key=lambda borrow: borrow.id):
+        by_book.setdefault(borrow.book_id, []).append(borrow)
+    by_book = {book_id: iter(borrows) for book_id, borrows in by_book.items()}
+    db.commit()
+    if granted:
+        cache.invalidate_namespace("books")
+        cache.invalidate(*map(book_key, granted))
+    items = [
+        {"id": book_id, "borrow": next(by_book[book_id])} if is_served else {"id": book_id, "detail": failures[book_id]}
+        for book_id, is_served in zip(batch.book_ids, served)
+    ]
+    return {"committed": True, "items": items}
+
+def return_borrows_batch(db: Session, batch: schemas.BorrowBatchReturn) -> dict:
+    """
+    Возврат нескольких выдач одной транзакцией: закрытие открытых выдач
+    одним UPDATE ... RETURNING и возврат копий на полку (release_copies).
+    Уже закрытые выдачи не изменяются и попадают в отказы.
+    :param db: Сессия базы данных.
+    :param batch: Pydantic-модель BorrowBatchReturn.
+    :return: Словарь Pydantic-модели BatchResult; при отказе в режиме
+        all_or_nothing изменения откатываются и committed равен False.
+    """
+    closed = {
+        borrow.id: borrow
+        for borrow in db.scalars(
+            update(models.Borrow)
+            .where(models.Borrow.id.in_(batch.borrow_ids), models.Borrow.return_date.is_(None))
+            .values(return_date=batch.return_date)
+            .returning(models.Borrow)
+        )
+    }
+    missing = set(batch.borrow_ids) - closed.keys()
+    existing = set(db.scalars(select(models.Borrow.id).where(models.Borrow.id.in_(missing)))) if missing else set()
+    failures = {borrow_id: "Borrow already returned" if borrow_id in existing else "Borrow not found" for borrow_id in missing}
+    if failures and batch.mode == "all_or_nothing":
+        return _batch_failed(db, batch.borrow_ids, failures)
+
+    restocked = Counter(borrow.book_id for borrow in closed.values())
+    release_copies(db, restocked)
+    release_loans(db, Counter(borrow.reader_id for borrow in closed.values()))
+    stats.record_returns(db, restocked)
+    events.record(db, "borrow.returned", map(events.borrow_payload, closed.values()))
+    db.commit()
+    if restocked:
+        cache.invalidate_namespace("books")
+        cache.invalidate(*map(book_key, restocked))
+    items = [
+        {"id": borrow_id, "borrow": closed[borrow_id]} if borrow_id in closed else {"id": borrow_id, "detail": failures[borrow_id]}
+        for borrow_id in batch.borrow_ids
+    ]
+    return {"committed": True, "items": items}
+
+def bulk_create_authors(db: Session, authors: list[tuple[int, schemas.AuthorCreate]]) -> list[tuple[int, str]]:
+    """
+    Пакетная вставка авторов одной транзакцией (executemany).
+    :param db: Сессия базы данных.
+    :param authors: Пары (номер строки, Pydantic-модель AuthorCreate).
+    :return: Отклоненные строки в виде пар (номер строки, причина).
+    """
+    db.execute(insert(models.Author), [author.model_dump() for _, author in authors])
+    db.commit()
+    cache.invalidate_namespace("authors")
+    return []
+
+def bulk_create_books(db: Session, books: list[tuple[int, schemas.BookCreate]]) -> list[tuple[int, str]]:
+    """
+    Пакетная вставка книг одной транзакцией.
+    Существование авторов проверяется одним запросом на всю пачку.
+    :param db: Сессия базы данных.
+    :param books: Пары (номер строки, Pydantic-модель BookCreate).
+    :return: Отклоненные строки в виде пар (номер строки, причина).
+    """
+    author_ids = {book.author_id for _, book in books}
+    existing = set(db.scalars(select(models.Author.id).where(models.Author.id.in_(author_ids))))
+    rejected = [(row, "Author not found") for row, book in books if book.author_id not in existing]
+    accepted = [book.model_dump() for _, book in books if book.author_id in existing]
+    if accepted:
+        db.execute(insert(models.Book), accepted)
+    db.commit()
+    cache.invalidate_namespace("books")
+    return rejected
+
+def bulk_create_borrows(db: Session, borrows: list[tuple[int, schemas.BorrowCreate]]) -> list[tuple[int, str]]:
+    """
+    Пакетная вставка записей о выдаче одной транзакцией.
+    Незакрытые выдачи (без return_date) резервируют копии через reserve_copies;
+    если копий книги не хватает на все ее строки в пачке, эти строки отклоняются.
+    Закрытые выдачи импортируются как история и остатки не меняют.
+    Незакрытые выдачи учитываются в счетчиках читателей (reserve_loans) так же:
+    если лимит читателя не вмещает все его строки пачки, они отклоняются,
+    а зарезервированные для них копии возвращаются.
+    :param db: Сессия базы данных.
+    :param borrows: Пары (номер строки, Pydantic-модель BorrowCreate).
+    :return: Отклоненные строки в виде пар (номер строки, причина).
+    """
+    book_ids = {borrow.book_id for _, borrow in borrows}
+    existing = set(db.scalars(select(models.Book.id).where(models.Book.id.in_(book_ids))))
+    reserved = reserve_copies(db, Counter(
+        borrow.book_id for _, borrow in borrows
+        if borrow.return_date is None and borrow.book_id in existing
+    ))
+    readers = resolve_readers(db, [borrow for _, borrow in borrows])
+    loaned = reserve_loans(db, Counter(
+        reader[0] for (_, borrow), reader in zip(borrows, readers)
+        if reader is not None and borrow.return_date is None and borrow.book_id in reserved
+    ))
+    rejected, accepted, unused = [], [], Counter()
+    for (row, borrow), reader in zip(borrows, readers):
+        is_open = borrow.return_date is None
+        if borrow.book_id not in existing:
+            rejected.append((row, "Book not found"))
+        elif is_open and borrow.book_id not in reserved:
+            rejected.append((row, "No available copies"))
+        elif reader is None or (is_open and reader[0] not in loaned):
+            rejected.append((row, "Reader not found" if reader is None else "Loan limit reached"))
+            unused[borrow.book_id] += is_open
+        else:
+            accepted.append(_borrow_row(borrow, reader))
+    release_copies(db, +unused)
+    if accepted:
+        created = db.execute(
+            insert(models.Borrow).returning(
+                *(models.Borrow.__table__.c[name] for name in events.BORROW_FIELDS), sort_by_parameter_order=True
+            ),
+            accepted,
+        ).all()
+        stats.record_borrows(db, ((row["book_id"], row["borrow_date"], row["return_date"] is None) for row in accepted))
+        events.record(db, "borrow.created", map(events.borrow_payload, created))
+    db.commit()
+    if reserved:
+        cache.invalidate_namespace("books")
+        cache.invalidate(*map(book_key, reserved))
+    return rejected
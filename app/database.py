@@ -1,8 +1,18 @@
+import asyncio
 import os
+import threading
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, register_engine
 
 load_dotenv()
 
@@ -12,8 +22,325 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
-DATABASE_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Основные чтения и записи авторов, книг и выдач идут через AsyncSession (app.routers.async_api).
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+DATABASE_URL = os.getenv("DATABASE_URL") or f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+# Реплика для чтения (GET): без DATABASE_REPLICA_URL все запросы идут в основную базу.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+READ_PRIMARY_COOKIE = "read_primary"
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+class SerializedStaticPool(StaticPool):
+    """
+    Единственное соединение базы SQLite в памяти, которое выдается одному
+    пользователю за раз: остальные потоки (запросы, публикация событий) ждут
+    его возврата не дольше DB_POOL_TIMEOUT, иначе их транзакции перемешались бы
+    в одном соединении. Соединение может вернуть не тот поток, что его взял
+    (завершение зависимости FastAPI), поэтому используется семафор, а не RLock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checkout = threading.Semaphore()
+
+    def _do_get(self):
+        if not self._checkout.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolTimeoutError(f"In-memory SQLite connection not returned within {DB_POOL_TIMEOUT} s")
+        try:
+            return super()._do_get()
+        except BaseException:
+            self._checkout.release()
+            raise
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._checkout.release()
+
+
+def _engine_options(url, is_async: bool = False) -> dict:
+    """
+    Параметры пула и подключения, общие для синхронного и асинхронного движков.
+    statement_timeout передается только в PostgreSQL: psycopg2 принимает его
+    через options, asyncpg - через server_settings.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if backend == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # База в памяти живет, пока открыто соединение: одно соединение на все потоки по очереди.
+            options.update(poolclass=SerializedStaticPool, connect_args={"check_same_thread": False})
+        return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if DB_STATEMENT_TIMEOUT_MS and backend == "postgresql":
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def async_url(url) -> str:
+    """
+    Переводит URL синхронного драйвера на асинхронный (asyncpg, aiosqlite).
+    """
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Асинхронный движок открыл бы свою, пустую базу в памяти.
+        raise ValueError("In-memory SQLite cannot be shared with the async engine")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def _sqlite_transactions(sync_engine):
+    """
+    pysqlite сам открывает транзакцию только перед изменением данных,
+    из-за чего не работают SAVEPOINT (в том числе откат тестовых транзакций);
+    транзакции открывает SQLAlchemy.
+    Транзакция, которая сначала читает, а затем пишет, должна открываться
+    с execution_options(sqlite_begin="IMMEDIATE"): блокировка на запись берется
+    сразу (с ожиданием busy timeout), а не при первом изменении, когда SQLite
+    при занятой базе сразу отвечает "database is locked".
+    """
+    @event.listens_for(sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sync_engine, "begin")
+    def _begin(connection):
+        mode = connection.get_execution_options().get("sqlite_begin")
+        connection.exec_driver_sql(f"BEGIN {mode}" if mode else "BEGIN")
+
+
+def make_engine(url):
+    """
+    Синхронный движок с параметрами пула приложения.
+    """
+    new_engine = create_engine(url, **_engine_options(url))
+    if new_engine.dialect.name == "sqlite":
+        _sqlite_transactions(new_engine)
+    return new_engine
+
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Движки создаются в configure (при запуске приложения, в заданиях и тестах),
+# а не при импорте: импорт модулей не требует доступной базы и драйвера.
+engine = None
+replica_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+ReplicaSessionLocal = None
+
+
+def configure(url=None, replica_url=None):
+    """
+    Создает движки основной базы и реплики и привязывает к ним фабрики сессий.
+    Повторный вызов заменяет движки (предыдущие закрываются).
+    :param url: URL основной базы; по умолчанию DATABASE_URL.
+    :param replica_url: URL реплики; по умолчанию DATABASE_REPLICA_URL.
+    """
+    global engine, replica_engine, ReplicaSessionLocal
+    dispose()
+    engine = make_engine(url or DATABASE_URL)
+    register_engine("primary", engine)
+    SessionLocal.configure(bind=engine)
+    replica_url = replica_url or DATABASE_REPLICA_URL
+    if replica_url:
+        replica_engine = make_engine(replica_url)
+        register_engine("replica", replica_engine)
+        ReplicaSessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_engine, info={"replica": True}
+        )
+    return engine
+
+
+def dispose():
+    """
+    Закрывает пулы соединений всех движков и отвязывает фабрики сессий.
+    """
+    global engine, replica_engine, ReplicaSessionLocal
+    for configured in (engine, replica_engine):
+        if configured is not None:
+            configured.dispose()
+    forget_async_engines()
+    engine = replica_engine = ReplicaSessionLocal = None
+    SessionLocal.configure(bind=None)
+
+# Отставание реплики PostgreSQL; 0, если все полученные изменения уже применены
+# (иначе простаивающая основная база выглядела бы как отставание).
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_replica_lag = (0.0, float("-inf"))
+_replica_lag_lock = threading.Lock()
+
+
+def measure_replica_lag(bind) -> float:
+    """
+    Отставание реплики в секундах: 0 для СУБД без потоковой репликации,
+    бесконечность, если реплика недоступна.
+    """
+    if bind.dialect.name != "postgresql":
+        return 0.0
+    try:
+        with bind.connect() as conn:
+            lag = conn.scalar(REPLICA_LAG_SQL)
+    except SQLAlchemyError:
+        return float("inf")
+    return float(lag or 0)
+
+
+def replica_lag() -> float:
+    """
+    Отставание реплики, измеряемое не чаще раза в REPLICA_LAG_CHECK_SECONDS.
+    """
+    global _replica_lag
+    lag, measured_at = _replica_lag
+    if time.monotonic() - measured_at < REPLICA_LAG_CHECK_SECONDS:
+        return lag
+    with _replica_lag_lock:
+        lag, measured_at = _replica_lag
+        if time.monotonic() - measured_at >= REPLICA_LAG_CHECK_SECONDS:
+            lag = measure_replica_lag(replica_engine)
+            _replica_lag = (lag, time.monotonic())
+    return lag
+
+
+def is_replica(db) -> bool:
+    return db.info.get("replica", False)
+
+
+_async_engines = {}
+
+
+def get_async_engine(replica: bool = False):
+    """
+    Асинхронный движок основной базы или реплики создается при первом обращении,
+    чтобы синхронный режим не требовал установленного asyncpg.
+    """
+    async_engine = _async_engines.get(replica)
+    if async_engine is None:
+        source = replica_engine if replica else engine
+        url = async_url(source.url if source is not None else DATABASE_URL)
+        async_engine = create_async_engine(url, **_engine_options(url, is_async=True))
+        register_engine("async_replica" if replica else "async", async_engine.sync_engine)
+        _async_engines[replica] = async_engine
+    return async_engine
+
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker(replica: bool = False):
+    return async_sessionmaker(
+        get_async_engine(replica), autoflush=False, expire_on_commit=False, info={"replica": replica}
+    )
+
+
+def forget_async_engines():
+    """
+    Отпускает асинхронные движки: их соединения закрываются только в цикле
+    событий (dispose_async), поэтому пулы просто забываются. Следующее
+    обращение создаст движки по текущим URL.
+    """
+    for async_engine in _async_engines.values():
+        async_engine.sync_engine.dispose(close=False)
+    _async_engines.clear()
+    get_async_sessionmaker.cache_clear()
+
+
+async def dispose_async():
+    """
+    Закрывает соединения асинхронных движков в текущем цикле событий.
+    """
+    for async_engine in _async_engines.values():
+        await async_engine.dispose()
+    _async_engines.clear()
+    get_async_sessionmaker.cache_clear()
+
+
+async def async_replica_lag() -> float:
+    """
+    replica_lag для цикла событий: устаревшее значение измеряется в потоке пула.
+    """
+    lag, measured_at = _replica_lag
+    if time.monotonic() - measured_at < REPLICA_LAG_CHECK_SECONDS:
+        return lag
+    return await asyncio.to_thread(replica_lag)
+
+
+def get_db(response: Response):
+    """
+    Создает сессию базы данных для работы с запросами.
+    Сессия автоматически закрывается после выполнения запроса.
+    Если настроена реплика, клиент получает cookie read_primary: пока она
+    действует, его запросы на чтение идут в основную базу и видят его изменения.
+    """
+    if ReplicaSessionLocal is not None:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """
+    Сессия для запросов на чтение: реплика, если она настроена, отстает
+    не больше REPLICA_MAX_LAG_SECONDS и у клиента нет cookie read_primary;
+    иначе основная база.
+    """
+    use_replica = (
+        ReplicaSessionLocal is not None
+        and READ_PRIMARY_COOKIE not in request.cookies
+        and replica_lag() <= REPLICA_MAX_LAG_SECONDS
+    )
+    db = (ReplicaSessionLocal if use_replica else SessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db(response: Response):
+    """
+    Асинхронный аналог get_db: сессия AsyncSession из общего пула основной базы,
+    закрывается после выполнения запроса; cookie read_primary ставится так же.
+    """
+    if ReplicaSessionLocal is not None:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    """
+    Асинхронный аналог get_read_db: реплика по тем же условиям, иначе основная база.
+    """
+    use_replica = (
+        ReplicaSessionLocal is not None
+        and READ_PRIMARY_COOKIE not in request.cookies
+        and await async_replica_lag() <= REPLICA_MAX_LAG_SECONDS
+    )
+    async with get_async_sessionmaker(use_replica)() as db:
+        yield db
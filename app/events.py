@@ -0,0 +1,299 @@
+"""
+События выдач и удалений для внешних систем (transactional outbox).
+app.crud записывает события в таблицу outbox_events в той же транзакции,
+что и само изменение (record), поэтому событие появляется тогда и только
+тогда, когда изменение зафиксировано.
+Фоновая задача Dispatcher пачками публикует новые события в приемник
+(EVENTS_SINK) и присваивает им position - сквозной номер в порядке
+публикации. Номера выдаются под блокировкой, без пропусков, поэтому
+потребитель GET /events, продолжающий чтение с последнего номера, не теряет
+события, зафиксированные позже событий с меньшим ID. Доставка в приемник -
+не менее одного раза: при сбое фиксации пачка публикуется повторно.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+
+from app import models, serialization
+from app.database import SessionLocal
+
+EVENTS_SINK = os.getenv("EVENTS_SINK", "log")
+EVENTS_DISPATCH = os.getenv("EVENTS_DISPATCH", "true").lower() in ("1", "true", "yes")
+EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", "500"))
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "1"))
+EVENTS_RETENTION_DAYS = int(os.getenv("EVENTS_RETENTION_DAYS", "30"))
+EVENTS_WAIT_SECONDS = float(os.getenv("EVENTS_WAIT_SECONDS", "25"))
+EVENTS_MAX_WAIT_SECONDS = float(os.getenv("EVENTS_MAX_WAIT_SECONDS", "300"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# Ключ pg_advisory_xact_lock: номера position выдает один диспетчер за раз.
+DISPATCH_LOCK_KEY = 0x6576656E7473
+
+BORROW_FIELDS = ("id", "book_id", "reader_id", "reader_name", "borrow_date", "return_date")
+
+logger = logging.getLogger("app.events")
+
+
+def borrow_payload(borrow) -> dict:
+    """
+    Данные выдачи для события: объект модели Borrow или строка с теми же столбцами.
+    """
+    payload = {}
+    for name in BORROW_FIELDS:
+        value = getattr(borrow, name)
+        payload[name] = value.isoformat() if isinstance(value, date) else value
+    return payload
+
+
+def record(db: Session, event_type: str, payloads: Iterable[dict]):
+    """
+    Добавляет события в outbox. Изменения не фиксируются,
+    транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param event_type: Тип события (borrow.created, borrow.returned, book.deleted, author.deleted).
+    :param payloads: Данные событий.
+    """
+    rows = [{"type": event_type, "payload": payload} for payload in payloads]
+    if not rows:
+        return
+    db.execute(models.OutboxEvent.__table__.insert(), rows)
+    db.info["outbox"] = True
+
+
+def as_dict(outbox_event: models.OutboxEvent) -> dict:
+    return {
+        "offset": outbox_event.position,
+        "type": outbox_event.type,
+        "payload": outbox_event.payload,
+        "created_at": outbox_event.created_at,
+    }
+
+
+class Signal:
+    """
+    Пробуждение ожидающих корутин из любого потока (эндпоинты crud
+    выполняются в пуле потоков, потребители ждут в цикле событий).
+    """
+
+    def __init__(self):
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass
+
+    async def wait(self, timeout: float):
+        """
+        Ждет notify не дольше timeout секунд.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# pending - появились новые события (будит диспетчер), published - события опубликованы (будит потребителей).
+# Другие процессы сигналов не получают и замечают события опросом раз в EVENTS_POLL_SECONDS.
+pending = Signal()
+published = Signal()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_pending(session: Session):
+    if session.info.pop("outbox", False):
+        pending.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session):
+    session.info.pop("outbox", None)
+
+
+class LogSink:
+    """
+    Приемник по умолчанию: пишет события в лог app.events.
+    """
+
+    def publish(self, events: list[dict]):
+        for item in events:
+            logger.info("%s", serialization.dumps(item).decode())
+
+
+class NullSink:
+    """
+    Без приемника (EVENTS_SINK=none): события доступны только через GET /events.
+    """
+
+    def publish(self, events: list[dict]):
+        pass
+
+
+def create_sink(name: str = EVENTS_SINK):
+    """
+    Создает приемник по имени из EVENTS_SINK: log, none или путь
+    "package.module:factory" к фабрике объекта с методом publish(events).
+    publish вызывается в потоке пула и должен выбросить исключение,
+    если пачку не удалось доставить.
+    """
+    if name == "log":
+        return LogSink()
+    if name == "none":
+        return NullSink()
+    if ":" in name:
+        module, factory = name.split(":", 1)
+        return getattr(importlib.import_module(module), factory)()
+    raise ValueError(f"Unknown events sink: {name}")
+
+
+def _lock_dispatch(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return db.scalar(select(func.pg_try_advisory_xact_lock(DISPATCH_LOCK_KEY)))
+
+
+def publish_pending(db: Session, sink, batch_size: int = EVENTS_BATCH_SIZE) -> int:
+    """
+    Публикует пачку неопубликованных событий одной транзакцией: присваивает
+    номера position, передает события приемнику и фиксирует результат.
+    Если приемник выбросил исключение, транзакция откатывается и пачка
+    будет опубликована повторно.
+    :param db: Сессия базы данных.
+    :param sink: Приемник событий.
+    :param batch_size: Наибольшее число событий в пачке.
+    :return: Число опубликованных событий (0, если публикует другой процесс).
+    """
+    # Пачка читается, а затем обновляется: в SQLite блокировка на запись берется при BEGIN.
+    db.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+    try:
+        if not _lock_dispatch(db):
+            db.rollback()
+            return 0
+        batch = db.scalars(
+            select(models.OutboxEvent)
+            .where(models.OutboxEvent.position.is_(None))
+            .order_by(models.OutboxEvent.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            db.rollback()
+            return 0
+        last = db.scalar(select(func.coalesce(func.max(models.OutboxEvent.position), 0)))
+        now = datetime.now(timezone.utc)
+        for position, outbox_event in enumerate(batch, last + 1):
+            outbox_event.position = position
+            outbox_event.published_at = now
+        db.flush()
+        sink.publish([as_dict(outbox_event) for outbox_event in batch])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    published.notify()
+    return len(batch)
+
+
+def read_events(db: Session, after: int, limit: int) -> list[dict]:
+    """
+    Опубликованные события после номера after в порядке публикации.
+    :param db: Сессия базы данных.
+    :param after: Номер (offset) последнего полученного события.
+    :param limit: Наибольшее число событий.
+    :return: Список словарей Pydantic-модели Event.
+    """
+    rows = db.scalars(
+        select(models.OutboxEvent)
+        .where(models.OutboxEvent.position > after)
+        .order_by(models.OutboxEvent.position)
+        .limit(limit)
+    )
+    return [as_dict(outbox_event) for outbox_event in rows]
+
+
+def purge_events(db: Session, older_than_days: int = EVENTS_RETENTION_DAYS, today: Optional[date] = None) -> int:
+    """
+    Удаляет опубликованные события старше older_than_days дней.
+    Изменения фиксируются; продолжить поток с удаленного номера уже нельзя.
+    :param db: Сессия базы данных.
+    :param older_than_days: Срок хранения опубликованных событий в днях.
+    :param today: Текущая дата (для тестов).
+    :return: Число удаленных событий.
+    """
+    cutoff = datetime.combine(
+        (today or date.today()) - timedelta(days=older_than_days), datetime.min.time(), timezone.utc
+    )
+    deleted = db.execute(
+        delete(models.OutboxEvent).where(
+            models.OutboxEvent.position.is_not(None), models.OutboxEvent.published_at < cutoff
+        )
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+class Dispatcher:
+    """
+    Фоновая задача публикации: пачки идут подряд, пока очередь не опустеет,
+    затем задача ждет новых событий (pending) или EVENTS_POLL_SECONDS.
+    """
+
+    def __init__(self, sink, batch_size: int = EVENTS_BATCH_SIZE, poll_seconds: float = EVENTS_POLL_SECONDS):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def _publish(self) -> int:
+        db = SessionLocal()
+        try:
+            return publish_pending(db, self.sink, self.batch_size)
+        finally:
+            db.close()
+
+    async def run(self):
+        while True:
+            try:
+                count = await asyncio.to_thread(self._publish)
+            except Exception:
+                logger.exception("event dispatch failed")
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            if count < self.batch_size:
+                await pending.wait(self.poll_seconds)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
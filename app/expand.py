@@ -0,0 +1,100 @@
+"""
+Встраивание связанных объектов в ответы (?expand=...).
+Связи подгружаются через selectinload/joinedload: число запросов на страницу
+постоянно (по одному на связь) и не зависит от ее размера.
+Развернутые ответы не кэшируются: их пришлось бы сбрасывать при изменении
+любого вложенного объекта.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import models, schemas
+
+AUTHOR_EXPAND = {"books", "borrows"}
+BOOK_EXPAND = {"author", "borrows"}
+BORROW_EXPAND = {"book", "author"}
+
+
+def parse_expand(expand: Optional[str], allowed: set[str]) -> frozenset[str]:
+    """
+    Разбирает параметр expand вида "books,borrows".
+    :param expand: Значение параметра запроса.
+    :param allowed: Допустимые связи ресурса.
+    :return: Множество запрошенных связей.
+    :raises HTTPException: Если запрошена неизвестная связь.
+    """
+    if not expand:
+        return frozenset()
+    fields = frozenset(field.strip() for field in expand.split(",") if field.strip())
+    unknown = fields - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown expand field(s): {', '.join(sorted(unknown))}; allowed: {', '.join(sorted(allowed))}",
+        )
+    return fields
+
+
+def author_options(fields: frozenset[str]) -> list:
+    """
+    Опции загрузки для авторов; borrows встраиваются в книги и подразумевают books.
+    """
+    if "borrows" in fields:
+        return [selectinload(models.Author.books).selectinload(models.Book.borrows)]
+    if "books" in fields:
+        return [selectinload(models.Author.books)]
+    return []
+
+
+def book_options(fields: frozenset[str]) -> list:
+    options = []
+    if "author" in fields:
+        options.append(joinedload(models.Book.author))
+    if "borrows" in fields:
+        options.append(selectinload(models.Book.borrows))
+    return options
+
+
+def borrow_options(fields: frozenset[str]) -> list:
+    """
+    Опции загрузки для выдач; author встраивается в книгу и подразумевает book.
+    """
+    if "author" in fields:
+        return [joinedload(models.Borrow.book).joinedload(models.Book.author)]
+    if "book" in fields:
+        return [joinedload(models.Borrow.book)]
+    return []
+
+
+def _dump(obj, schema) -> dict:
+    return schema.model_validate(obj, from_attributes=True).model_dump(mode="json")
+
+
+def dump_book(book, fields: frozenset[str]) -> dict:
+    data = _dump(book, schemas.Book)
+    if "author" in fields:
+        data["author"] = _dump(book.author, schemas.Author)
+    if "borrows" in fields:
+        data["borrows"] = [_dump(borrow, schemas.Borrow) for borrow in book.borrows]
+    return data
+
+
+def dump_author(author, fields: frozenset[str]) -> dict:
+    data = _dump(author, schemas.Author)
+    if fields:
+        book_fields = frozenset({"borrows"} & fields)
+        data["books"] = [dump_book(book, book_fields) for book in author.books]
+    return data
+
+
+def dump_borrow(borrow, fields: frozenset[str]) -> dict:
+    data = _dump(borrow, schemas.Borrow)
+    if fields:
+        data["book"] = dump_book(borrow.book, frozenset({"author"} & fields))
+    return data
+
+
+def dump_page(page: dict, dump, fields: frozenset[str]) -> dict:
+    return {"items": [dump(item, fields) for item in page["items"]], "next_cursor": page["next_cursor"]}
@@ -1,21 +1,84 @@
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
-from app.database import Base, engine
-from app.routers import authors, books, borrows
+from fastapi.responses import PlainTextResponse
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 
-app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+def create_app(database_url: Optional[str] = None, replica_url: Optional[str] = None) -> FastAPI:
+    """
+    Создает приложение. Модули приложения и роутеры импортируются здесь,
+    а движки базы создаются при запуске (lifespan), поэтому импорт app.main
+    не подключается к базе. Если база уже настроена (database.configure
+    в тестах или заданиях), приложение использует ее и не закрывает.
+    :param database_url: URL основной базы; по умолчанию DATABASE_URL.
+    :param replica_url: URL реплики для чтения; по умолчанию DATABASE_REPLICA_URL.
+    :return: Приложение FastAPI.
+    """
+    from app import admission, database, events, metrics, serialization
+    from app.cache import cache
+    from app.routers import async_api, authors, books, borrows, readers, stats, events as events_router
 
-@app.get("/docs", include_in_schema=False)
-def custom_swagger_ui_html():
-    return get_swagger_ui_html(openapi_url="/openapi.json", title="Library API Docs")
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """
+        Движки базы и фоновая публикация событий outbox (отключается
+        EVENTS_DISPATCH=false, например на экземплярах, которые только читают поток).
+        Асинхронный движок закрывается в цикле событий, в котором работал.
+        """
+        owns_database = database.engine is None
+        if owns_database:
+            database.configure(database_url, replica_url)
+        dispatcher = events.Dispatcher(events.create_sink()) if events.EVENTS_DISPATCH else None
+        if dispatcher is not None:
+            dispatcher.start()
+        try:
+            yield
+        finally:
+            if dispatcher is not None:
+                await dispatcher.stop()
+            await database.dispose_async()
+            if owns_database:
+                database.dispose()
 
-@app.get("/redoc", include_in_schema=False)
-def redoc_ui_html():
-    return get_redoc_html(openapi_url="/openapi.json", title="Library API Docs")
+    app = FastAPI(default_response_class=serialization.ORJSONResponse, lifespan=lifespan)
+    # MetricsMiddleware добавляется последним и оборачивает AdmissionMiddleware: отклоненные запросы тоже попадают в метрики.
+    app.add_middleware(admission.AdmissionMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
 
+    @app.get("/docs", include_in_schema=False)
+    def custom_swagger_ui_html():
+        return get_swagger_ui_html(openapi_url="/openapi.json", title="Library API Docs")
 
-app.include_router(authors.router, prefix="/authors", tags=["Authors"])
-app.include_router(books.router, prefix="/books", tags=["Books"])
-app.include_router(borrows.router, prefix="/borrows", tags=["Borrows"])
+    @app.get("/redoc", include_in_schema=False)
+    def redoc_ui_html():
+        return get_redoc_html(openapi_url="/openapi.json", title="Library API Docs")
+
+    @app.get("/cache/stats", include_in_schema=False)
+    def cache_stats():
+        return cache.stats()
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render(cache.stats()), media_type="text/plain; version=0.0.4")
+
+    def mount(router):
+        # DB_ASYNC=true: маршруты с сессией базы получают AsyncSession (app.routers.async_api).
+        return async_api.convert(router) if database.DB_ASYNC else router
+
+    app.include_router(mount(authors.router), prefix="/authors", tags=["Authors"])
+    app.include_router(mount(books.router), prefix="/books", tags=["Books"])
+    app.include_router(mount(borrows.router), prefix="/borrows", tags=["Borrows"])
+    app.include_router(mount(readers.router), prefix="/readers", tags=["Readers"])
+    app.include_router(mount(stats.router), prefix="/stats", tags=["Stats"])
+    app.include_router(events_router.router, prefix="/events", tags=["Events"])
+    return app
+
+
+def __getattr__(name):
+    # app.main:app (uvicorn, тесты) создается при первом обращении.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,350 @@
+"""
+Метрики производительности: время обработки запросов по маршрутам, число и время
+SQL-запросов на запрос, ожидание соединения из пула и его заполненность.
+Данные отдаются в текстовом формате Prometheus (GET /metrics) и в заголовке
+Server-Timing каждого ответа. Медленные SQL-запросы (дольше SLOW_QUERY_MS)
+пишутся в лог app.slow_query.
+"""
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+POOL_WAIT_HALF_LIFE_SECONDS = float(os.getenv("POOL_WAIT_HALF_LIFE_SECONDS", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+slow_query_logger = logging.getLogger("app.slow_query")
+
+
+class Histogram:
+    """
+    Гистограмма Prometheus с произвольными метками.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return 0 if series is None else series[2]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(buckets), total, count) for key, (buckets, total, count) in self._series.items()]
+        for key, buckets, total, count in sorted(series):
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{self.name}_bucket{_labels(key, le=_number(bound))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """
+    Счетчик Prometheus с произвольными метками.
+    """
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + 1
+
+    def count(self, **labels) -> int:
+        return self._series.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines += [f"{self.name}{_labels(key)} {count}" for key, count in series]
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key, **extra) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Request latency by route.")
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "SQL statements executed per request.", COUNT_BUCKETS)
+REQUEST_DB_DURATION = Histogram("http_request_db_duration_seconds", "Time spent in SQL statements per request.")
+QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement latency.")
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.")
+
+HISTOGRAMS = (REQUEST_DURATION, REQUEST_DB_QUERIES, REQUEST_DB_DURATION, QUERY_DURATION, POOL_WAIT)
+
+ADMISSION_REJECTED = Counter("http_requests_rejected_total", "Requests rejected by admission control.")
+COUNTERS = (ADMISSION_REJECTED,)
+
+
+@dataclass
+class RequestStats:
+    """
+    Счетчики текущего запроса; передаются в обработчики через contextvars
+    (в том числе в пул потоков, где выполняются синхронные эндпоинты).
+    """
+    queries: int = 0
+    db_time: float = 0.0
+    pool_wait: float = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+# Время начала хранится в контексте выполнения, а не в соединении: у запроса,
+# завершившегося ошибкой, after_cursor_execute не вызывается, и отметка
+# уходит вместе с контекстом, не оставаясь в соединении пула.
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    QUERY_DURATION.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+
+class PoolPressure:
+    """
+    Текущее ожидание соединения из пула: затухающее среднее завершенных
+    ожиданий (половина веса теряется за POOL_WAIT_HALF_LIFE_SECONDS без новых
+    соединений) или возраст самого долгого ожидания, которое еще идет, -
+    пока запросы стоят в очереди пула, завершенных ожиданий нет.
+    """
+
+    def __init__(self, half_life: float = POOL_WAIT_HALF_LIFE_SECONDS, weight: float = 0.2):
+        self.half_life = half_life
+        self.weight = weight
+        self._average = 0.0
+        self._updated = time.monotonic()
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, now: float) -> float:
+        return self._average * 0.5 ** ((now - self._updated) / self.half_life)
+
+    def started(self, token, now: float):
+        with self._lock:
+            self._waiting[token] = now
+
+    def finished(self, token, elapsed: float, now: float):
+        with self._lock:
+            self._waiting.pop(token, None)
+            self._average = self._decayed(now) * (1 - self.weight) + elapsed * self.weight
+            self._updated = now
+
+    def wait(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(self._waiting.values(), default=now)
+            return max(self._decayed(now), now - oldest)
+
+
+_pool_pressure = {}
+
+
+def pool_wait(name: str = "primary") -> float:
+    """
+    Текущее ожидание соединения из пула движка name в секундах (PoolPressure).
+    """
+    pressure = _pool_pressure.get(name)
+    return 0.0 if pressure is None else pressure.wait()
+
+
+class _TimedCheckout:
+    def _do_get(self):
+        name = getattr(self, "metrics_name", "default")
+        pressure = _pool_pressure.setdefault(name, PoolPressure())
+        token = object()
+        started = time.perf_counter()
+        pressure.started(token, time.monotonic())
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            pressure.finished(token, elapsed, time.monotonic())
+            POOL_WAIT.observe(elapsed, pool=name)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += elapsed
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    """
+    QueuePool, измеряющий время ожидания свободного соединения.
+    """
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """
+    Асинхронный вариант InstrumentedQueuePool.
+    """
+
+
+_engines = {}
+
+
+def register_engine(name: str, engine: Engine):
+    """
+    Подключает пул движка к метрикам заполненности (db_pool_*).
+    """
+    engine.pool.metrics_name = name
+    _engines[name] = engine
+
+
+def _pool_lines() -> list[str]:
+    lines = [
+        "# HELP db_pool_size Configured pool size.",
+        "# TYPE db_pool_size gauge",
+    ]
+    states = []
+    for name, engine in sorted(_engines.items()):
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        lines.append(f"db_pool_size{_labels((('pool', name),))} {pool.size()}")
+        states.append((name, pool.size(), pool.checkedout(), pool.checkedin(), max(pool.overflow(), 0)))
+    lines += [
+        "# HELP db_pool_connections Pooled connections by state.",
+        "# TYPE db_pool_connections gauge",
+    ]
+    for name, size, checked_out, idle, overflow in states:
+        lines.append(f"db_pool_connections{_labels((('pool', name), ('state', 'checked_out')))} {checked_out}")
+        lines.append(f"db_pool_connections{_labels((('pool', name), ('state', 'idle')))} {idle}")
+        lines.append(f"db_pool_connections{_labels((('pool', name), ('state', 'overflow')))} {overflow}")
+    lines += [
+        "# HELP db_pool_saturation Checked out connections relative to pool size (above 1 means overflow is in use).",
+        "# TYPE db_pool_saturation gauge",
+    ]
+    for name, size, checked_out, idle, overflow in states:
+        lines.append(f"db_pool_saturation{_labels((('pool', name),))} {_number(checked_out / size if size else 0)}")
+    return lines
+
+
+def render(cache_stats: Optional[dict] = None) -> str:
+    """
+    Все метрики в текстовом формате Prometheus 0.0.4.
+    :param cache_stats: Счетчики кэша (app.cache.Cache.stats), если нужно их включить.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    for counter in COUNTERS:
+        lines += counter.render()
+    lines += _pool_lines()
+    if cache_stats is not None:
+        lines += [
+            "# HELP cache_hits_total Read-through cache hits.",
+            "# TYPE cache_hits_total counter",
+            f"cache_hits_total {cache_stats['hits']}",
+            "# HELP cache_misses_total Read-through cache misses.",
+            "# TYPE cache_misses_total counter",
+            f"cache_misses_total {cache_stats['misses']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: замеряет запрос, собирает статистику SQL через contextvars
+    и добавляет заголовок Server-Timing (app, db, pool).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                timing = (
+                    f"app;dur={elapsed * 1000:.2f}, "
+                    f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", '
+                    f"pool;dur={stats.pool_wait * 1000:.2f}"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": route.path if route is not None else "unmatched"}
+            REQUEST_DURATION.observe(time.perf_counter() - started, status=status, **labels)
+            REQUEST_DB_QUERIES.observe(stats.queries, **labels)
+            REQUEST_DB_DURATION.observe(stats.db_time, **labels)
@@ -1,8 +1,25 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import DDL, JSON, Column, Integer, String, Date, DateTime, ForeignKey, Index, event, func, literal_column, text
+from sqlalchemy.orm import declared_attr, relationship
 from app.database import Base
 
-class Author(Base):
+
+class Versioned:
+    """
+    Версия строки и время последнего изменения для ETag/Last-Modified.
+    version увеличивается при каждом UPDATE, в том числе в запросах без ORM
+    (onupdate), а ORM проверяет его при сохранении объекта (version_id_col),
+    что дает оптимистичную блокировку для If-Match.
+    """
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"), onupdate=text("version + 1"))
+    updated_at = Column(
+        DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.version}
+
+class Author(Versioned, Base):
     """
     Модель для таблицы "authors".
     Содержит информацию об авторах книг.
@@ -15,7 +32,7 @@ class Author(Base):
 
     books = relationship("Book", back_populates="author")
 
-class Book(Base):
+class Book(Versioned, Base):
     """
     Модель для таблицы "books".
     Содержит информацию о книгах, включая описание, автора и доступные копии.
@@ -24,20 +41,164 @@ class Book(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     description = Column(String)
-    author_id = Column(Integer, ForeignKey("authors.id"), nullable=False)
+    author_id = Column(Integer, ForeignKey("authors.id"), nullable=False, index=True)
     available_copies = Column(Integer, default=1)
 
     author = relationship("Author", back_populates="books")
     borrows = relationship("Borrow", backref="book")
 
-class Borrow(Base):
+    __table_args__ = (
+        # GIN-индекс полнотекстового поиска; выражение совпадает с BOOK_SEARCH_DOCUMENT.
+        Index(
+            "ix_books_search_document",
+            text("to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+class Reader(Versioned, Base):
+    """
+    Модель для таблицы "readers".
+    Читатели библиотеки. active_loans - число незакрытых выдач читателя,
+    которое app.crud поддерживает в тех же транзакциях, что и выдачи и возвраты;
+    лимит max_active_loans (NULL - общий MAX_ACTIVE_LOANS) проверяется по нему.
+    """
+    __tablename__ = "readers"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, unique=True, index=True)
+    max_active_loans = Column(Integer)
+    active_loans = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+class Borrow(Versioned, Base):
     """
     Модель для таблицы "borrows".
     Отображает информацию о выдаче книг читателям.
     """
     __tablename__ = "borrows"
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
-    reader_name = Column(String, nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False, index=True)
+    reader_id = Column(Integer, ForeignKey("readers.id"), nullable=False)
+    reader_name = Column(String, nullable=False, index=True)
+    borrow_date = Column(Date, nullable=False)
+    return_date = Column(Date, nullable=True, index=True)
+
+    __table_args__ = (
+        # Частичный индекс по незакрытым выдачам: активные займы составляют
+        # малую часть таблицы, и индекс остается компактным.
+        Index(
+            "ix_borrows_open_book_id",
+            "book_id",
+            postgresql_where=text("return_date IS NULL"),
+            sqlite_where=text("return_date IS NULL"),
+        ),
+        # Просроченные выдачи (app.stats) ищутся среди незакрытых по дате выдачи.
+        Index(
+            "ix_borrows_open_borrow_date",
+            "borrow_date",
+            postgresql_where=text("return_date IS NULL"),
+            sqlite_where=text("return_date IS NULL"),
+        ),
+        # Выдачи читателя в порядке keyset-пагинации (GET /readers/{id}/borrows):
+        # все и только незакрытые (?active=true).
+        Index("ix_borrows_reader_id", "reader_id", "id"),
+        Index(
+            "ix_borrows_open_reader_id",
+            "reader_id",
+            "id",
+            postgresql_where=text("return_date IS NULL"),
+            sqlite_where=text("return_date IS NULL"),
+        ),
+    )
+
+class BorrowArchive(Base):
+    """
+    Модель для таблицы "borrows_archive".
+    Закрытые выдачи, перенесенные из borrows заданием app.archive; строки
+    не изменяются, version и updated_at сохраняются на момент переноса.
+    """
+    __tablename__ = "borrows_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False, index=True)
+    reader_id = Column(Integer, ForeignKey("readers.id"), nullable=False, index=True)
+    reader_name = Column(String, nullable=False, index=True)
     borrow_date = Column(Date, nullable=False)
-    return_date = Column(Date, nullable=True)
+    return_date = Column(Date, nullable=False)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class BookCirculation(Base):
+    """
+    Модель для таблицы "book_circulation".
+    Агрегаты выдач по книге, которые app.stats обновляет в тех же транзакциях,
+    что и выдачи: число выданных сейчас копий и всего выдач.
+    """
+    __tablename__ = "book_circulation"
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    copies_out = Column(Integer, nullable=False, default=0)
+    total_borrows = Column(Integer, nullable=False, default=0)
+
+class MonthlyCirculation(Base):
+    """
+    Модель для таблицы "monthly_circulation".
+    Число выдач книги за календарный месяц (month - первое число месяца).
+    """
+    __tablename__ = "monthly_circulation"
+    month = Column(Date, primary_key=True)
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True, index=True)
+    borrows = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_monthly_circulation_month_borrows", "month", "borrows"),
+    )
+
+class OutboxEvent(Base):
+    """
+    Модель для таблицы "outbox_events".
+    События выдач и удалений (transactional outbox): записываются в той же
+    транзакции, что и изменение, а app.events публикует их и присваивает
+    position - сквозной номер в порядке публикации, по которому потребители
+    продолжают чтение потока.
+    """
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True)
+    type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    position = Column(Integer)
+    published_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_outbox_events_position", "position", unique=True),
+        # Очередь публикации: неопубликованных событий мало, индекс остается компактным.
+        Index(
+            "ix_outbox_events_unpublished",
+            "id",
+            postgresql_where=text("position IS NULL"),
+            sqlite_where=text("position IS NULL"),
+        ),
+    )
+
+
+# Выражения для поиска. app.search строит запросы из этих же объектов:
+# PostgreSQL использует индекс по выражению, только если выражение в запросе
+# совпадает с индексным. Литералы встроены в SQL (literal_column), а не
+# передаются параметрами, чтобы совпадение не зависело от драйвера.
+BOOK_SEARCH_DOCUMENT = func.to_tsvector(
+    literal_column("'simple'"),
+    func.coalesce(Book.title, literal_column("''")) + literal_column("' '") + func.coalesce(Book.description, literal_column("''")),
+)
+AUTHOR_SEARCH_NAME = func.lower(Author.first_name + literal_column("' '") + Author.last_name)
+
+Index(
+    "ix_authors_search_name_trgm",
+    AUTHOR_SEARCH_NAME.label("search_name"),
+    postgresql_using="gin",
+    postgresql_ops={"search_name": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
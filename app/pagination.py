@@ -0,0 +1,177 @@
+import base64
+import binascii
+import json
+from typing import Callable, Iterator, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Query, Session
+
+from app import serialization
+from app.database import SessionLocal
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+STREAM_BATCH_SIZE = 1000
+
+
+def _dump_cursor(position: dict) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _load_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def encode_cursor(value: int, key: str = "id") -> str:
+    """
+    Кодирует позицию в выборке в непрозрачный курсор.
+    :param value: ID последней выданной записи.
+    :param key: Вид позиции (id для keyset-пагинации по первичному ключу).
+    :return: Строка курсора (urlsafe base64 без выравнивания).
+    """
+    return _dump_cursor({key: value})
+
+
+def decode_cursor(cursor: str, key: str = "id") -> int:
+    """
+    Декодирует курсор, полученный от клиента.
+    :param cursor: Строка курсора из параметра after.
+    :param key: Ожидаемый вид позиции (см. encode_cursor).
+    :return: Позиция, после которой продолжается выборка.
+    :raises HTTPException: Если курсор поврежден или выдан другим видом пагинации.
+    """
+    value = _load_cursor(cursor).get(key)
+    if not _is_id(value):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    """
+    Курсор ранжированной выдачи (app.search): релевантность и ID последней записи.
+    :param rank: Релевантность последней выданной записи.
+    :param last_id: ID последней выданной записи.
+    :return: Строка курсора.
+    """
+    return _dump_cursor({"rank": rank, "id": last_id})
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Декодирует курсор encode_rank_cursor.
+    :param cursor: Строка курсора из параметра after.
+    :return: Релевантность и ID, после которых продолжается выборка.
+    :raises HTTPException: Если курсор поврежден или выдан другим видом пагинации.
+    """
+    position = _load_cursor(cursor)
+    rank, last_id = position.get("rank"), position.get("id")
+    if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not _is_id(last_id):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return rank, last_id
+
+
+def paginate(query: Query, id_column, limit: int, after: Optional[str] = None) -> dict:
+    """
+    Keyset-пагинация по столбцу id.
+    Выбирает limit + 1 строку, чтобы узнать, есть ли следующая страница,
+    не выполняя COUNT(*). Новые записи получают больший id и не сдвигают
+    уже выданные страницы.
+    :param query: Запрос SQLAlchemy по модели.
+    :param id_column: Столбец первичного ключа модели.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь с ключами items и next_cursor (Pydantic-модель Page).
+    """
+    if after is not None:
+        query = query.filter(id_column > decode_cursor(after))
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+def paginate_rows(db: Session, model, schema: Type[BaseModel], limit: int, after: Optional[str] = None) -> dict:
+    """
+    Keyset-пагинация, читающая только столбцы схемы ответа (см. app.serialization).
+    :param db: Сессия базы данных.
+    :param model: Модель SQLAlchemy.
+    :param schema: Pydantic-модель строки ответа.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь Pydantic-модели Page, элементы - словари полей схемы.
+    """
+    fields = list(schema.model_fields)
+    stmt = select(*serialization.columns(model, schema)).order_by(model.id).limit(limit + 1)
+    if after is not None:
+        stmt = stmt.where(model.id > decode_cursor(after))
+    rows = db.execute(stmt).all()
+    items = [dict(zip(fields, row)) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["id"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def iter_rows(build_query: Callable[[Session], Query], id_column, last_id: Optional[int] = None) -> Iterator:
+    """
+    Построчно читает выборку пачками через yield_per (серверный курсор в PostgreSQL).
+    Генератор открывает собственную сессию: зависимость get_db закрывается
+    раньше, чем будет отправлено тело потокового ответа.
+    :param build_query: Функция, строящая запрос по переданной сессии.
+    :param id_column: Столбец первичного ключа модели.
+    :param last_id: Идентификатор, после которого продолжить чтение.
+    :return: Генератор объектов модели в порядке возрастания ID.
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db)
+        if last_id is not None:
+            query = query.filter(id_column > last_id)
+        yield from query.order_by(id_column).yield_per(STREAM_BATCH_SIZE)
+    finally:
+        db.close()
+
+
+def stream_ndjson(
+    build_query: Callable[[Session], Query],
+    id_column,
+    schema: Type[BaseModel],
+    after: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Отдает всю выборку в формате NDJSON, не загружая ее в память целиком.
+    :param build_query: Функция, строящая запрос по переданной сессии.
+    :param id_column: Столбец первичного ключа модели.
+    :param schema: Pydantic-модель строки: из базы читаются только ее поля.
+    :param after: Курсор, после которого продолжить выгрузку.
+    :return: Потоковый ответ application/x-ndjson.
+    """
+    last_id = decode_cursor(after) if after is not None else None
+    fields = list(schema.model_fields)
+    row_columns = serialization.columns(id_column.class_, schema)
+
+    def generate():
+        # Строки отдаются пачками: каждый элемент синхронного генератора
+        # StreamingResponse забирает отдельным переходом в пул потоков.
+        lines = []
+        rows = iter_rows(lambda session: build_query(session).with_entities(*row_columns), id_column, last_id)
+        for row in rows:
+            lines.append(serialization.dumps(dict(zip(fields, row))))
+            if len(lines) >= STREAM_BATCH_SIZE:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
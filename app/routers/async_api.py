@@ -0,0 +1,86 @@
+# Асинхронный режим (DB_ASYNC=true, см. app.main.create_app): маршруты роутеров
+# получают AsyncSession вместо сессий get_db и get_read_db.
+import inspect
+from typing import Optional
+from fastapi import APIRouter, Depends, params
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db, get_db, get_read_db
+
+ASYNC_DEPENDENCIES = {get_db: get_async_db, get_read_db: get_async_read_db}
+
+def _session_parameter(endpoint) -> Optional[inspect.Parameter]:
+    for parameter in inspect.signature(endpoint).parameters.values():
+        if isinstance(parameter.default, params.Depends) and parameter.default.dependency in ASYNC_DEPENDENCIES:
+            return parameter
+    return None
+
+def asynchronous(endpoint):
+    """
+    Версия эндпоинта с асинхронной сессией той же базы (основной или реплики).
+    Синхронный эндпоинт целиком выполняется через AsyncSession.run_sync: запросы
+    идут через асинхронный драйвер и не занимают поток пула, а код эндпоинта и
+    app.crud остается общим для обоих режимов. Асинхронные эндпоинты (пакетный
+    импорт) получают AsyncSession напрямую.
+    :param endpoint: Эндпоинт с параметром-сессией Depends(get_db) или Depends(get_read_db).
+    :return: Асинхронный эндпоинт с тем же описанием и параметрами.
+    """
+    session = _session_parameter(endpoint)
+    signature = inspect.signature(endpoint)
+    async_session = session.replace(annotation=AsyncSession, default=Depends(ASYNC_DEPENDENCIES[session.default.dependency]))
+
+    if inspect.iscoroutinefunction(endpoint):
+        async def call(**kwargs):
+            return await endpoint(**kwargs)
+    else:
+        async def call(**kwargs):
+            db = kwargs.pop(session.name)
+            return await db.run_sync(lambda sync_session: endpoint(**kwargs, **{session.name: sync_session}))
+
+    call.__name__, call.__qualname__, call.__doc__ = endpoint.__name__, endpoint.__qualname__, endpoint.__doc__
+    call.__signature__ = signature.replace(
+        parameters=[async_session if parameter.name == session.name else parameter for parameter in signature.parameters.values()]
+    )
+    return call
+
+def convert(router: APIRouter) -> APIRouter:
+    """
+    Копия роутера, в которой маршруты с сессией базы заменены асинхронными
+    (asynchronous). Порядок маршрутов и описание OpenAPI сохраняются;
+    маршруты без сессии (выгрузки, поток событий) переносятся как есть.
+    :param router: Синхронный роутер из app.routers.
+    :return: Роутер для асинхронного режима.
+    """
+    converted = APIRouter()
+    for route in router.routes:
+        if not isinstance(route, APIRoute) or _session_parameter(route.endpoint) is None:
+            converted.routes.append(route)
+            continue
+        converted.add_api_route(
+            route.path,
+            asynchronous(route.endpoint),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            response_description=route.response_description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            methods=route.methods,
+            operation_id=route.operation_id,
+            response_model_include=route.response_model_include,
+            response_model_exclude=route.response_model_exclude,
+            response_model_by_alias=route.response_model_by_alias,
+            response_model_exclude_unset=route.response_model_exclude_unset,
+            response_model_exclude_defaults=route.response_model_exclude_defaults,
+            response_model_exclude_none=route.response_model_exclude_none,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+            callbacks=route.callbacks,
+            openapi_extra=route.openapi_extra,
+            generate_unique_id_function=route.generate_unique_id_function,
+        )
+    return converted
@@ -1,21 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from app import schemas, crud
-from app.database import SessionLocal
+from app import schemas, crud, pagination, bulk, conditional, serialization, search, expand as expansion
+from app.database import get_db, get_read_db
 
 router = APIRouter()
 
-def get_db():
-    """
-    Создает сессию базы данных для работы с запросами.
-    Сессия автоматически закрывается после выполнения запроса.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.Author)
 def create_author(author: schemas.AuthorCreate, db: Session = Depends(get_db)):
     """
@@ -26,46 +16,130 @@ def create_author(author: schemas.AuthorCreate, db: Session = Depends(get_db)):
     """
     return crud.create_author(db, author)
 
-@router.get("/", response_model=list[schemas.Author])
-def list_authors(db: Session = Depends(get_db)):
+@router.get("/", response_model=schemas.Page[schemas.AuthorExpanded], response_model_exclude_unset=True)
+def list_authors(
+    request: Request,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    stream: bool = False,
+    expand: Optional[str] = Query(None, description="books,borrows"),
+    db: Session = Depends(get_read_db),
+):
     """
-    Возвращает список всех авторов из базы данных.
+    Возвращает страницу авторов с курсорной пагинацией по ID.
+    При stream=true вся выборка отдается потоком в формате NDJSON.
+    Страница без expand отдается с ETag; при совпадении If-None-Match возвращается 304.
+    :param request: Запрос (If-None-Match).
+    :param response: Ответ (заголовок ETag).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param stream: Отдать все записи потоком NDJSON вместо страницы.
+    :param expand: Встраиваемые связи через запятую (books,borrows).
     :param db: Сессия базы данных (генерируется автоматически).
-    :return: Список авторов (Pydantic-модель Author).
+    :return: Список авторов и курсор следующей страницы (Pydantic-модель Page).
+    """
+    fields = expansion.parse_expand(expand, expansion.AUTHOR_EXPAND)
+    if stream:
+        if fields:
+            raise HTTPException(status_code=400, detail="expand is not supported with stream")
+        return pagination.stream_ndjson(
+            lambda session: session.query(crud.models.Author), crud.models.Author.id, schemas.Author, after
+        )
+    page = crud.list_authors(db, limit, after, fields)
+    if fields:
+        return page
+    # Строки страницы уже совпадают со схемой: ответ кодируется без проверки response_model.
+    not_modified = conditional.respond(request, response, conditional.page_tag(page))
+    return not_modified or serialization.json_response(page, response)
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def bulk_create_authors(request: Request, db: Session = Depends(get_db)):
+    """
+    Пакетный импорт авторов: JSON-массив, NDJSON (application/x-ndjson) или CSV (text/csv).
+    Строки записываются пачками, по одной транзакции на пачку.
+    :param request: Запрос с данными в теле.
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Число вставленных строк и ошибки по номерам строк (Pydantic-модель BulkResult).
+    """
+    return await bulk.import_records(request, db, schemas.AuthorCreate, crud.bulk_create_authors)
+
+@router.get("/export")
+def export_authors(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    after: Optional[str] = None,
+):
+    """
+    Потоковая выгрузка всех авторов в формате NDJSON или CSV.
+    :param fmt: Формат выгрузки (параметр format).
+    :param after: Курсор, после которого продолжить выгрузку.
+    :return: Потоковый ответ с записями (Pydantic-модель Author).
     """
-    return db.query(crud.models.Author).all()
+    return bulk.export_records(
+        lambda session: session.query(crud.models.Author), crud.models.Author.id, schemas.Author, fmt, after
+    )
 
-@router.get("/{author_id}", response_model=schemas.Author)
-def get_author(author_id: int, db: Session = Depends(get_db)):
+@router.get("/search", response_model=schemas.Page[schemas.Author])
+def search_authors(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Поиск авторов по началу имени или фамилии, результаты упорядочены по релевантности.
+    :param q: Поисковый запрос.
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Найденные записи и курсор следующей страницы (Pydantic-модель Page).
+    """
+    return search.search_authors(db, q, limit, after)
+
+@router.get("/{author_id}", response_model=schemas.AuthorExpanded, response_model_exclude_unset=True)
+def get_author(author_id: int, request: Request, response: Response, expand: Optional[str] = Query(None, description="books,borrows"), db: Session = Depends(get_read_db)):
     """
     Возвращает автора по его ID.
     :param author_id: Идентификатор автора.
+    :param request: Запрос (If-None-Match / If-Modified-Since).
+    :param response: Ответ (заголовки ETag и Last-Modified).
+    :param expand: Встраиваемые связи через запятую (books,borrows).
     :param db: Сессия базы данных (генерируется автоматически).
-    :return: Данные автора (Pydantic-модель Author).
+    :return: Данные автора (Pydantic-модель AuthorExpanded).
     :raises HTTPException: Если автор с указанным ID не найден.
     """
-    author = db.query(crud.models.Author).filter(crud.models.Author.id == author_id).first()
+    fields = expansion.parse_expand(expand, expansion.AUTHOR_EXPAND)
+    author = crud.get_author(db, author_id, fields)
     if not author:
         raise HTTPException(status_code=404, detail="Author not found")
+    if not fields:
+        not_modified = conditional.respond(
+            request, response, conditional.entity_tag(author), conditional.last_modified(author)
+        )
+        if not_modified:
+            return not_modified
     return author
 
 @router.put("/{author_id}", response_model=schemas.Author)
-def update_author(author_id: int, updated_author: schemas.AuthorCreate, db: Session = Depends(get_db)):
+def update_author(author_id: int, updated_author: schemas.AuthorCreate, request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Обновляет данные автора по его ID.
     :param author_id: Идентификатор автора.
     :param updated_author: Обновленные данные автора (Pydantic-модель AuthorCreate).
+    :param request: Запрос (заголовок If-Match для оптимистичной блокировки).
+    :param response: Ответ (в заголовок ETag записывается новая версия).
     :param db: Сессия базы данных (генерируется автоматически).
     :return: Обновленный автор (Pydantic-модель Author).
-    :raises HTTPException: Если автор с указанным ID не найден.
+    :raises HTTPException: Если автор с указанным ID не найден
+        или заголовок If-Match не совпадает с текущим ETag (412).
     """
-    author = db.query(crud.models.Author).filter(crud.models.Author.id == author_id).first()
+    try:
+        author = crud.update_author(db, author_id, updated_author, conditional.if_match(request))
+    except conditional.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Author has been modified")
     if not author:
         raise HTTPException(status_code=404, detail="Author not found")
-    for key, value in updated_author.dict().items():
-        setattr(author, key, value)
-    db.commit()
-    db.refresh(author)
+    response.headers["ETag"] = conditional.entity_tag(author)
     return author
 
 @router.delete("/{author_id}")
@@ -77,18 +151,6 @@ def delete_author(author_id: int, db: Session = Depends(get_db)):
     :return: Сообщение об успешном удалении.
     :raises HTTPException: Если автор с указанным ID не найден.
     """
-    author = db.query(crud.models.Author).filter(crud.models.Author.id == author_id).first()
-    if not author:
+    if not crud.delete_author(db, author_id):
         raise HTTPException(status_code=404, detail="Author not found")
-
-    borrows = db.query(crud.models.Borrow).filter(crud.models.Borrow.book_id.in_(db.query(crud.models.Book.id).filter(crud.models.Book.author_id == author_id))).all()
-    for borrow in borrows:
-        db.delete(borrow)
-
-    books = db.query(crud.models.Book).filter(crud.models.Book.author_id == author_id).all()
-    for book in books:
-        db.delete(book)
-
-    db.delete(author)
-    db.commit()
     return {"message": "Author and related books and borrow records deleted successfully"}
@@ -1,21 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from app import schemas, crud
-from app.database import SessionLocal
+from app import schemas, crud, pagination, bulk, conditional, serialization, search, expand as expansion
+from app.database import get_db, get_read_db
 
 router = APIRouter()
 
-def get_db():
-    """
-    Создает сессию базы данных для работы с запросами.
-    Сессия автоматически закрывается после выполнения запроса.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.Book)
 def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
     """
@@ -26,46 +16,130 @@ def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
     """
     return crud.create_book(db, book)
 
-@router.get("/", response_model=list[schemas.Book])
-def list_books(db: Session = Depends(get_db)):
+@router.get("/", response_model=schemas.Page[schemas.BookExpanded], response_model_exclude_unset=True)
+def list_books(
+    request: Request,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    stream: bool = False,
+    expand: Optional[str] = Query(None, description="author,borrows"),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу книг с курсорной пагинацией по ID.
+    При stream=true вся выборка отдается потоком в формате NDJSON.
+    Страница без expand отдается с ETag; при совпадении If-None-Match возвращается 304.
+    :param request: Запрос (If-None-Match).
+    :param response: Ответ (заголовок ETag).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param stream: Отдать все записи потоком NDJSON вместо страницы.
+    :param expand: Встраиваемые связи через запятую (author,borrows).
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Список книг и курсор следующей страницы (Pydantic-модель Page).
+    """
+    fields = expansion.parse_expand(expand, expansion.BOOK_EXPAND)
+    if stream:
+        if fields:
+            raise HTTPException(status_code=400, detail="expand is not supported with stream")
+        return pagination.stream_ndjson(
+            lambda session: session.query(crud.models.Book), crud.models.Book.id, schemas.Book, after
+        )
+    page = crud.list_books(db, limit, after, fields)
+    if fields:
+        return page
+    # Строки страницы уже совпадают со схемой: ответ кодируется без проверки response_model.
+    not_modified = conditional.respond(request, response, conditional.page_tag(page))
+    return not_modified or serialization.json_response(page, response)
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def bulk_create_books(request: Request, db: Session = Depends(get_db)):
+    """
+    Пакетный импорт книг: JSON-массив, NDJSON (application/x-ndjson) или CSV (text/csv).
+    Строки записываются пачками, по одной транзакции на пачку.
+    :param request: Запрос с данными в теле.
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Число вставленных строк и ошибки по номерам строк (Pydantic-модель BulkResult).
+    """
+    return await bulk.import_records(request, db, schemas.BookCreate, crud.bulk_create_books)
+
+@router.get("/export")
+def export_books(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    after: Optional[str] = None,
+):
+    """
+    Потоковая выгрузка всех книг в формате NDJSON или CSV.
+    :param fmt: Формат выгрузки (параметр format).
+    :param after: Курсор, после которого продолжить выгрузку.
+    :return: Потоковый ответ с записями (Pydantic-модель Book).
+    """
+    return bulk.export_records(
+        lambda session: session.query(crud.models.Book), crud.models.Book.id, schemas.Book, fmt, after
+    )
+
+@router.get("/search", response_model=schemas.Page[schemas.Book])
+def search_books(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
     """
-    Возвращает список всех книг из базы данных.
+    Поиск книг по названию и описанию, результаты упорядочены по релевантности.
+    :param q: Поисковый запрос.
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
     :param db: Сессия базы данных (генерируется автоматически).
-    :return: Список книг (Pydantic-модель Book).
+    :return: Найденные записи и курсор следующей страницы (Pydantic-модель Page).
     """
-    return db.query(crud.models.Book).all()
+    return search.search_books(db, q, limit, after)
 
-@router.get("/{book_id}", response_model=schemas.Book)
-def get_book(book_id: int, db: Session = Depends(get_db)):
+@router.get("/{book_id}", response_model=schemas.BookExpanded, response_model_exclude_unset=True)
+def get_book(book_id: int, request: Request, response: Response, expand: Optional[str] = Query(None, description="author,borrows"), db: Session = Depends(get_read_db)):
     """
     Возвращает информацию о книге по её ID.
     :param book_id: Идентификатор книги.
+    :param request: Запрос (If-None-Match / If-Modified-Since).
+    :param response: Ответ (заголовки ETag и Last-Modified).
+    :param expand: Встраиваемые связи через запятую (author,borrows).
     :param db: Сессия базы данных (генерируется автоматически).
-    :return: Данные книги (Pydantic-модель Book).
+    :return: Данные книги (Pydantic-модель BookExpanded).
     :raises HTTPException: Если книга с указанным ID не найдена.
     """
-    book = db.query(crud.models.Book).filter(crud.models.Book.id == book_id).first()
+    fields = expansion.parse_expand(expand, expansion.BOOK_EXPAND)
+    book = crud.get_book(db, book_id, fields)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
+    if not fields:
+        not_modified = conditional.respond(
+            request, response, conditional.entity_tag(book), conditional.last_modified(book)
+        )
+        if not_modified:
+            return not_modified
     return book
 
 @router.put("/{book_id}", response_model=schemas.Book)
-def update_book(book_id: int, updated_book: schemas.BookCreate, db: Session = Depends(get_db)):
+def update_book(book_id: int, updated_book: schemas.BookCreate, request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Обновляет информацию о книге по её ID.
     :param book_id: Идентификатор книги.
     :param updated_book: Обновленные данные книги (Pydantic-модель BookCreate).
+    :param request: Запрос (заголовок If-Match для оптимистичной блокировки).
+    :param response: Ответ (в заголовок ETag записывается новая версия).
     :param db: Сессия базы данных (генерируется автоматически).
     :return: Обновленная книга (Pydantic-модель Book).
-    :raises HTTPException: Если книга с указанным ID не найдена.
+    :raises HTTPException: Если книга с указанным ID не найдена
+        или заголовок If-Match не совпадает с текущим ETag (412).
     """
-    book = db.query(crud.models.Book).filter(crud.models.Book.id == book_id).first()
+    try:
+        book = crud.update_book(db, book_id, updated_book, conditional.if_match(request))
+    except conditional.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Book has been modified")
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    for key, value in updated_book.dict().items():
-        setattr(book, key, value)
-    db.commit()
-    db.refresh(book)
+    response.headers["ETag"] = conditional.entity_tag(book)
     return book
 
 @router.delete("/{book_id}")
@@ -77,14 +151,6 @@ def delete_book(book_id: int, db: Session = Depends(get_db)):
     :return: Сообщение об успешном удалении.
     :raises HTTPException: Если книга с указанным ID не найдена.
     """
-    book = db.query(crud.models.Book).filter(crud.models.Book.id == book_id).first()
-    if not book:
+    if not crud.delete_book(db, book_id):
         raise HTTPException(status_code=404, detail="Book not found")
-
-    db.query(crud.models.Borrow).filter(crud.models.Borrow.book_id == book_id).delete()
-
-    db.delete(book)
-    db.commit()
-
-
     return {"message": "Book and associated borrow records deleted successfully"}
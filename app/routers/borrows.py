@@ -1,23 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from app import schemas, crud
-from app.database import SessionLocal
-import logging
-from app import models
+from app import schemas, crud, pagination, bulk, conditional, serialization, expand as expansion
+from app.database import get_db, get_read_db
 
 router = APIRouter()
 
-def get_db():
-    """
-    Создает сессию базы данных для обработки запросов.
-    Автоматически закрывает сессию после выполнения.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.Borrow)
 def create_borrow(borrow: schemas.BorrowCreate, db: Session = Depends(get_db)):
     """
@@ -25,60 +13,167 @@ def create_borrow(borrow: schemas.BorrowCreate, db: Session = Depends(get_db)):
     :param borrow: Данные о выдаче книги (Pydantic-модель BorrowCreate).
     :param db: Сессия базы данных.
     :return: Созданная запись о выдаче книги (Pydantic-модель Borrow).
-    :raises HTTPException: Если недоступны копии книги для выдачи.
+    :raises HTTPException: Если недоступны копии книги для выдачи, читатель
+        не найден или превышен его лимит выдач.
     """
     try:
         return crud.create_borrow(db, borrow)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/", response_model=list[schemas.Borrow])
-def list_borrows(db: Session = Depends(get_db)):
+@router.get("/", response_model=schemas.Page[schemas.BorrowExpanded], response_model_exclude_unset=True)
+def list_borrows(
+    request: Request,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    stream: bool = False,
+    expand: Optional[str] = Query(None, description="book,author"),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу записей о выдаче книг с курсорной пагинацией по ID.
+    При stream=true вся выборка отдается потоком в формате NDJSON.
+    Страница без expand отдается с ETag; при совпадении If-None-Match возвращается 304.
+    :param request: Запрос (If-None-Match).
+    :param response: Ответ (заголовок ETag).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param stream: Отдать все записи потоком NDJSON вместо страницы.
+    :param expand: Встраиваемые связи через запятую (book,author).
+    :param db: Сессия базы данных.
+    :return: Список записей о выдаче и курсор следующей страницы (Pydantic-модель Page).
+    """
+    fields = expansion.parse_expand(expand, expansion.BORROW_EXPAND)
+    if stream:
+        if fields:
+            raise HTTPException(status_code=400, detail="expand is not supported with stream")
+        return pagination.stream_ndjson(
+            lambda session: session.query(crud.models.Borrow), crud.models.Borrow.id, schemas.Borrow, after
+        )
+    page = crud.list_borrows(db, limit, after, fields)
+    if fields:
+        return page
+    # Строки страницы уже совпадают со схемой: ответ кодируется без проверки response_model.
+    not_modified = conditional.respond(request, response, conditional.page_tag(page))
+    return not_modified or serialization.json_response(page, response)
+
+@router.get("/archive", response_model=schemas.Page[schemas.Borrow])
+def list_archived_borrows(
+    request: Request,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу архивных (давно закрытых) выдач с курсорной пагинацией по ID.
+    :param request: Запрос (If-None-Match).
+    :param response: Ответ (заголовок ETag).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param db: Сессия базы данных.
+    :return: Список архивных выдач и курсор следующей страницы (Pydantic-модель Page).
+    """
+    page = crud.list_archived_borrows(db, limit, after)
+    not_modified = conditional.respond(request, response, conditional.page_tag(page))
+    return not_modified or serialization.json_response(page, response)
+
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def bulk_create_borrows(request: Request, db: Session = Depends(get_db)):
+    """
+    Пакетный импорт записей о выдаче: JSON-массив, NDJSON (application/x-ndjson) или CSV (text/csv).
+    Строки записываются пачками, по одной транзакции на пачку.
+    :param request: Запрос с данными в теле.
+    :param db: Сессия базы данных.
+    :return: Число вставленных строк и ошибки по номерам строк (Pydantic-модель BulkResult).
+    """
+    return await bulk.import_records(request, db, schemas.BorrowCreate, crud.bulk_create_borrows)
+
+@router.post("/batch", response_model=schemas.BatchResult)
+def create_borrows_batch(batch: schemas.BorrowBatchCreate, db: Session = Depends(get_db)):
     """
-    Возвращает список всех записей о выдаче книг.
+    Выдает читателю несколько книг одной транзакцией.
+    :param batch: ID книг, читатель, дата выдачи и режим (Pydantic-модель BorrowBatchCreate).
     :param db: Сессия базы данных.
-    :return: Список записей о выдаче (Pydantic-модель Borrow).
+    :return: Результат по каждой книге (Pydantic-модель BatchResult).
+    :raises HTTPException: 409 с результатами по книгам, если в режиме all_or_nothing
+        хотя бы одну книгу выдать нельзя.
+    """
+    result = crud.create_borrows_batch(db, batch)
+    if not result["committed"]:
+        raise HTTPException(status_code=409, detail=schemas.BatchResult(**result).model_dump(mode="json"))
+    return result
+
+@router.post("/return-batch", response_model=schemas.BatchResult)
+def return_borrows_batch(batch: schemas.BorrowBatchReturn, db: Session = Depends(get_db)):
+    """
+    Обрабатывает возврат нескольких выдач одной транзакцией.
+    :param batch: ID выдач, дата возврата и режим (Pydantic-модель BorrowBatchReturn).
+    :param db: Сессия базы данных.
+    :return: Результат по каждой выдаче (Pydantic-модель BatchResult).
+    :raises HTTPException: 409 с результатами по выдачам, если в режиме all_or_nothing
+        хотя бы одна выдача не найдена или уже закрыта.
+    """
+    result = crud.return_borrows_batch(db, batch)
+    if not result["committed"]:
+        raise HTTPException(status_code=409, detail=schemas.BatchResult(**result).model_dump(mode="json"))
+    return result
+
+@router.get("/export")
+def export_borrows(
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    after: Optional[str] = None,
+):
+    """
+    Потоковая выгрузка всех записей о выдаче в формате NDJSON или CSV.
+    :param fmt: Формат выгрузки (параметр format).
+    :param after: Курсор, после которого продолжить выгрузку.
+    :return: Потоковый ответ с записями (Pydantic-модель Borrow).
     """
-    return db.query(crud.models.Borrow).all()
+    return bulk.export_records(
+        lambda session: session.query(crud.models.Borrow), crud.models.Borrow.id, schemas.Borrow, fmt, after
+    )
 
-@router.get("/{borrow_id}", response_model=schemas.Borrow)
-def get_borrow(borrow_id: int, db: Session = Depends(get_db)):
+@router.get("/{borrow_id}", response_model=schemas.BorrowExpanded, response_model_exclude_unset=True)
+def get_borrow(borrow_id: int, request: Request, response: Response, expand: Optional[str] = Query(None, description="book,author"), db: Session = Depends(get_read_db)):
     """
     Возвращает информацию о выдаче книги по её ID.
     :param borrow_id: Идентификатор выдачи.
+    :param request: Запрос (If-None-Match / If-Modified-Since).
+    :param response: Ответ (заголовки ETag и Last-Modified).
+    :param expand: Встраиваемые связи через запятую (book,author).
     :param db: Сессия базы данных.
-    :return: Данные о выдаче книги (Pydantic-модель Borrow).
+    :return: Данные о выдаче книги (Pydantic-модель BorrowExpanded).
     :raises HTTPException: Если запись о выдаче не найдена.
     """
-    borrow = db.query(crud.models.Borrow).filter(crud.models.Borrow.id == borrow_id).first()
+    fields = expansion.parse_expand(expand, expansion.BORROW_EXPAND)
+    borrow = crud.get_borrow(db, borrow_id, fields)
     if not borrow:
         raise HTTPException(status_code=404, detail="Borrow not found")
+    if not fields:
+        not_modified = conditional.respond(
+            request, response, conditional.entity_tag(borrow), conditional.last_modified(borrow)
+        )
+        if not_modified:
+            return not_modified
     return borrow
 
 @router.patch("/{borrow_id}/return", response_model=schemas.Borrow)
 def return_borrow(borrow_id: int, return_date: schemas.BorrowReturn, db: Session = Depends(get_db)):
     """
     Обрабатывает возврат книги.
+    Повторный запрос с той же датой возврата возвращает ту же запись.
     :param borrow_id: Идентификатор записи о выдаче книги.
     :param return_date: Дата возврата (Pydantic-модель BorrowReturn).
     :param db: Сессия базы данных.
     :return: Обновленная запись о выдаче книги с датой возврата.
-    :raises HTTPException: Если запись о выдаче не найдена или книга уже возвращена.
+    :raises HTTPException: Если запись о выдаче не найдена или книга уже возвращена другой датой.
     """
-    borrow = db.query(models.Borrow).filter(models.Borrow.id == borrow_id).first()
+    try:
+        borrow = crud.return_borrow(db, borrow_id, return_date.return_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not borrow:
         raise HTTPException(status_code=404, detail="Borrow not found")
-
-    if borrow.return_date:
-        borrow.return_date = return_date.return_date
-        db.commit()
-        db.refresh(borrow)
-        book = db.query(models.Book).filter(models.Book.id == borrow.book_id).first()
-
-        if book:
-            book.available_copies += 1
-            db.commit()
-            db.refresh(book)
-        raise HTTPException(status_code=400, detail="Borrow already returned")
-    
     return borrow
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from app import schemas, pagination, events, serialization
+from app.database import SessionLocal
+
+router = APIRouter()
+
+def _read(after: int, limit: int) -> list[dict]:
+    db = SessionLocal()
+    try:
+        return events.read_events(db, after, limit)
+    finally:
+        db.close()
+
+async def _event_stream(request: Request, after: int, limit: int, timeout: float):
+    loop = asyncio.get_running_loop()
+    deadline = last_write = loop.time()
+    deadline += timeout
+    # Клиент EventSource переподключается через retry мс и передает Last-Event-ID.
+    yield b"retry: 1000\n\n"
+    while True:
+        items = await asyncio.to_thread(_read, after, limit)
+        for item in items:
+            yield b"id: %d\nevent: %s\ndata: %s\n\n" % (item["offset"], item["type"].encode(), serialization.dumps(item))
+        if items:
+            after = items[-1]["offset"]
+            last_write = loop.time()
+            if len(items) == limit:
+                continue
+        now = loop.time()
+        if now >= deadline or await request.is_disconnected():
+            return
+        if now - last_write >= events.EVENTS_KEEPALIVE_SECONDS:
+            yield b": keepalive\n\n"
+            last_write = now
+        await events.published.wait(min(deadline - now, events.EVENTS_POLL_SECONDS))
+
+@router.get(
+    "/",
+    response_model=schemas.EventBatch,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def read_events(
+    request: Request,
+    after: int = Query(0, ge=0, description="Номер (offset) последнего полученного события"),
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    timeout: float = Query(events.EVENTS_WAIT_SECONDS, ge=0, le=events.EVENTS_MAX_WAIT_SECONDS),
+    last_event_id: Optional[int] = Header(None),
+):
+    """
+    Поток событий выдач и удалений, начиная с номера after.
+    С заголовком Accept: text/event-stream события отдаются как Server-Sent Events
+    в течение timeout секунд, после чего клиент переподключается с Last-Event-ID.
+    Иначе - long-poll: ответ приходит, как только есть события после after,
+    или через timeout секунд с пустым списком.
+    :param request: Запрос (Accept, отключение клиента).
+    :param after: Номер последнего полученного события.
+    :param limit: Наибольшее число событий в ответе.
+    :param timeout: Время ожидания событий (длительность потока SSE) в секундах.
+    :param last_event_id: Заголовок Last-Event-ID; при переподключении SSE заменяет after.
+    :return: События и номер последнего из них (Pydantic-модель EventBatch) или поток SSE.
+    """
+    if last_event_id is not None:
+        after = last_event_id
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            _event_stream(request, after, limit, timeout),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        items = await asyncio.to_thread(_read, after, limit)
+        remaining = deadline - loop.time()
+        if items or remaining <= 0:
+            return {"items": items, "last_offset": items[-1]["offset"] if items else after}
+        await events.published.wait(min(remaining, events.EVENTS_POLL_SECONDS))
@@ -0,0 +1,108 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+from app import schemas, crud, pagination, conditional, serialization
+from app.database import get_db, get_read_db
+
+router = APIRouter()
+
+@router.post("/", response_model=schemas.Reader)
+def create_reader(reader: schemas.ReaderCreate, db: Session = Depends(get_db)):
+    """
+    Создает нового читателя.
+    :param reader: Данные нового читателя (Pydantic-модель ReaderCreate).
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Созданный читатель (Pydantic-модель Reader).
+    :raises HTTPException: Если читатель с таким именем уже есть (409).
+    """
+    try:
+        return crud.create_reader(db, reader)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/", response_model=schemas.Page[schemas.Reader])
+def list_readers(
+    request: Request,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу читателей с курсорной пагинацией по ID.
+    :param request: Запрос (If-None-Match).
+    :param response: Ответ (заголовок ETag).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Список читателей и курсор следующей страницы (Pydantic-модель Page).
+    """
+    page = crud.list_readers(db, limit, after)
+    not_modified = conditional.respond(request, response, conditional.page_tag(page))
+    return not_modified or serialization.json_response(page, response)
+
+@router.get("/{reader_id}", response_model=schemas.Reader)
+def get_reader(reader_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    """
+    Возвращает читателя по его ID вместе с числом незакрытых выдач.
+    :param reader_id: Идентификатор читателя.
+    :param request: Запрос (If-None-Match / If-Modified-Since).
+    :param response: Ответ (заголовки ETag и Last-Modified).
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Данные читателя (Pydantic-модель Reader).
+    :raises HTTPException: Если читатель с указанным ID не найден.
+    """
+    reader = crud.get_reader(db, reader_id)
+    if not reader:
+        raise HTTPException(status_code=404, detail="Reader not found")
+    not_modified = conditional.respond(
+        request, response, conditional.entity_tag(reader), conditional.last_modified(reader)
+    )
+    return not_modified or reader
+
+@router.get("/{reader_id}/borrows", response_model=schemas.Page[schemas.Borrow])
+def list_reader_borrows(
+    reader_id: int,
+    active: bool = False,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает выдачи читателя с курсорной пагинацией по ID.
+    :param reader_id: Идентификатор читателя.
+    :param active: Только незакрытые выдачи (книги, которые сейчас у читателя).
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Список выдач и курсор следующей страницы (Pydantic-модель Page).
+    :raises HTTPException: Если читатель с указанным ID не найден.
+    """
+    page = crud.list_reader_borrows(db, reader_id, active, limit, after)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Reader not found")
+    return page
+
+@router.put("/{reader_id}", response_model=schemas.Reader)
+def update_reader(reader_id: int, updated_reader: schemas.ReaderCreate, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Обновляет имя и лимит выдач читателя по его ID.
+    :param reader_id: Идентификатор читателя.
+    :param updated_reader: Обновленные данные читателя (Pydantic-модель ReaderCreate).
+    :param request: Запрос (заголовок If-Match для оптимистичной блокировки).
+    :param response: Ответ (в заголовок ETag записывается новая версия).
+    :param db: Сессия базы данных (генерируется автоматически).
+    :return: Обновленный читатель (Pydantic-модель Reader).
+    :raises HTTPException: Если читатель не найден, заголовок If-Match
+        не совпадает с текущим ETag (412) или имя уже занято (409).
+    """
+    try:
+        reader = crud.update_reader(db, reader_id, updated_reader, conditional.if_match(request))
+    except conditional.PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Reader has been modified")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not reader:
+        raise HTTPException(status_code=404, detail="Reader not found")
+    response.headers["ETag"] = conditional.entity_tag(reader)
+    return reader
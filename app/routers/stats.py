@@ -0,0 +1,50 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app import schemas, pagination, stats
+from app.database import get_read_db
+
+router = APIRouter()
+
+@router.get("/top-books", response_model=list[schemas.BookBorrowCount])
+def top_books(
+    month: Optional[date] = Query(None, description="Любой день месяца; по умолчанию текущий месяц"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает самые выдаваемые книги за месяц.
+    :param month: Любой день нужного месяца.
+    :param limit: Число книг.
+    :param db: Сессия базы данных.
+    :return: Книги и число их выдач (Pydantic-модель BookBorrowCount).
+    """
+    return stats.top_books(db, month or date.today(), limit)
+
+@router.get("/overdue", response_model=schemas.Page[schemas.Borrow])
+def overdue_borrows(
+    days: int = Query(stats.LOAN_DAYS, ge=0, description="Срок выдачи в днях"),
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу незакрытых выдач, срок которых истек.
+    :param days: Срок выдачи в днях.
+    :param limit: Размер страницы.
+    :param after: Курсор next_cursor из предыдущей страницы.
+    :param db: Сессия базы данных.
+    :return: Просроченные выдачи и курсор следующей страницы (Pydantic-модель Page).
+    """
+    return stats.overdue_borrows(db, days, limit, after)
+
+@router.get("/authors", response_model=list[schemas.AuthorUtilization])
+def author_utilization(limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_read_db)):
+    """
+    Возвращает авторов с наибольшим числом выданных копий и загрузку их фонда.
+    :param limit: Число авторов.
+    :param db: Сессия базы данных.
+    :return: Выданные копии, копии на полке и доля выданных (Pydantic-модель AuthorUtilization).
+    """
+    return stats.author_utilization(db, limit)
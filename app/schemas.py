@@ -1,7 +1,11 @@
-from pydantic import BaseModel
-from datetime import date
-from pydantic import Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from datetime import date, datetime
+from pydantic import Field, field_validator, model_validator
+from typing import Generic, Literal, Optional, TypeVar
+
+T = TypeVar("T")
+
+BATCH_MAX_ITEMS = 100
 
 class AuthorBase(BaseModel):
     first_name: str
@@ -13,9 +17,10 @@ class AuthorCreate(AuthorBase):
 
 class Author(AuthorBase):
     id: int
+    version: int
+    updated_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class BookBase(BaseModel):
     title: str
@@ -23,17 +28,36 @@ class BookBase(BaseModel):
     author_id: int
     available_copies: int = Field(default=1, ge=0)
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class BookCreate(BookBase):
     pass
 
 class Book(BookBase):
     id: int
+    version: int
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ReaderBase(BaseModel):
+    name: str
+    max_active_loans: Optional[int] = Field(default=None, ge=0)
 
-    class Config:
-        orm_mode = True
+class ReaderCreate(ReaderBase):
+    pass
+
+class Reader(ReaderBase):
+    """
+    Читатель; active_loans - число незакрытых выдач. Если max_active_loans
+    не задан, действует общий лимит MAX_ACTIVE_LOANS.
+    """
+    id: int
+    active_loans: int
+    version: int
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
 
 class BorrowBase(BaseModel):
     book_id: int
@@ -41,16 +65,161 @@ class BorrowBase(BaseModel):
     borrow_date: date
     return_date: Optional[date] = None
 
+def _require_reader(model):
+    if model.reader_id is None and model.reader_name is None:
+        raise ValueError("reader_id or reader_name is required")
+    return model
+
 class BorrowCreate(BorrowBase):
-    pass
+    """
+    Читатель задается reader_id или именем reader_name (если указаны оба,
+    используется reader_id); читатель с новым именем создается при выдаче.
+    """
+    reader_name: Optional[str] = None
+    reader_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def reader_required(self):
+        return _require_reader(self)
 
 class Borrow(BorrowBase):
     id: int
-    return_date: date
+    reader_id: int
+    version: int
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+
+class BookExpanded(Book):
+    """
+    Книга со встроенными связями (?expand=author,borrows).
+    """
+    author: Optional[Author] = None
+    borrows: Optional[list[Borrow]] = None
+
+
+class AuthorExpanded(Author):
+    """
+    Автор со встроенными книгами (?expand=books,borrows).
+    """
+    books: Optional[list[BookExpanded]] = None
+
+
+class BorrowExpanded(Borrow):
+    """
+    Выдача со встроенной книгой (?expand=book,author).
+    """
+    book: Optional[BookExpanded] = None
 
 
 class BorrowReturn(BaseModel):
     return_date: date
+
+
+class Page(BaseModel, Generic[T]):
+    """
+    Страница списка при keyset-пагинации.
+    next_cursor передается в параметр after для получения следующей страницы.
+    """
+    items: list[T]
+    next_cursor: Optional[str] = None
+
+
+class BulkError(BaseModel):
+    row: int
+    detail: str
+
+
+class BulkResult(BaseModel):
+    """
+    Отчет о пакетном импорте: число вставленных строк и ошибки по номерам строк.
+    """
+    inserted: int
+    errors: list[BulkError]
+
+
+class BorrowBatchCreate(BaseModel):
+    """
+    Выдача нескольких книг одному читателю.
+    all_or_nothing - при любой ошибке ничего не выдается;
+    partial - выдаются доступные книги, по остальным возвращаются ошибки.
+    Читатель задается как в BorrowCreate.
+    """
+    reader_name: Optional[str] = None
+    reader_id: Optional[int] = None
+    borrow_date: date
+    book_ids: list[int] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    mode: Literal["all_or_nothing", "partial"] = "all_or_nothing"
+
+    @model_validator(mode="after")
+    def reader_required(self):
+        return _require_reader(self)
+
+
+class BorrowBatchReturn(BaseModel):
+    """
+    Возврат нескольких выдач одной датой; режимы как в BorrowBatchCreate.
+    """
+    borrow_ids: list[int] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+    return_date: date
+    mode: Literal["all_or_nothing", "partial"] = "all_or_nothing"
+
+    @field_validator("borrow_ids")
+    @classmethod
+    def unique_borrow_ids(cls, borrow_ids: list[int]) -> list[int]:
+        if len(set(borrow_ids)) != len(borrow_ids):
+            raise ValueError("borrow_ids must be unique")
+        return borrow_ids
+
+
+class BatchItem(BaseModel):
+    """
+    Результат по одному элементу пакета: id - переданный ID книги или выдачи,
+    borrow - созданная или закрытая выдача, detail - причина отказа.
+    """
+    id: int
+    borrow: Optional[Borrow] = None
+    detail: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    committed: bool
+    items: list[BatchItem]
+
+
+class BookBorrowCount(BaseModel):
+    book_id: int
+    title: str
+    borrows: int
+
+
+class AuthorUtilization(BaseModel):
+    """
+    Загрузка фонда автора: utilization - доля выданных копий среди всех копий его книг.
+    """
+    author_id: int
+    first_name: str
+    last_name: str
+    copies_out: int
+    available_copies: int
+    utilization: float
+
+
+class Event(BaseModel):
+    """
+    Событие из outbox; offset - сквозной номер в порядке публикации.
+    """
+    offset: int
+    type: str
+    payload: dict
+    created_at: datetime
+
+
+class EventBatch(BaseModel):
+    """
+    События после запрошенного номера; last_offset передается в параметр after
+    следующего запроса (если событий нет, он равен запрошенному номеру).
+    """
+    items: list[Event]
+    last_offset: int
@@ -0,0 +1,98 @@
+"""
+Поиск книг и авторов.
+В PostgreSQL книги ищутся полнотекстово (to_tsvector + GIN-индекс, ранжирование ts_rank),
+авторы - по префиксу слов имени с триграммным GIN-индексом (pg_trgm, ранжирование similarity).
+На остальных СУБД (SQLite в тестах) используется LIKE с упрощенным ранжированием.
+Результаты упорядочены по релевантности и разбиты на страницы keyset-курсором
+(релевантность, id): следующая страница не перечитывает предыдущие.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import REAL, and_, case, cast, func, literal_column, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from app import models, pagination
+
+
+LIKE_ESCAPE = "!"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def _normalize(q: str) -> str:
+    """
+    Приводит запрос к нижнему регистру и схлопывает пробелы.
+    :raises HTTPException: Если в запросе нет ни одного слова.
+    """
+    normalized = " ".join(q.lower().split())
+    if not normalized:
+        raise HTTPException(status_code=400, detail="Empty search query")
+    return normalized
+
+
+def _page(db: Session, model, rank, where: list, limit: int, after: Optional[str]) -> dict:
+    """
+    Страница ранжированной выдачи по (rank DESC, id DESC). Значение rank из
+    курсора приводится к типу выражения, иначе REAL в PostgreSQL сравнивался бы
+    с double precision и строки с той же релевантностью терялись или повторялись.
+    """
+    query = select(model, rank.label("rank")).where(*where)
+    if after is not None:
+        after_rank, after_id = pagination.decode_rank_cursor(after)
+        query = query.where(tuple_(rank, model.id) < tuple_(cast(after_rank, rank.type), after_id))
+    rows = db.execute(query.order_by(rank.desc(), model.id.desc()).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = pagination.encode_rank_cursor(last.rank, last[0].id)
+    return {"items": [row[0] for row in rows[:limit]], "next_cursor": next_cursor}
+
+
+def search_books(db: Session, q: str, limit: int, after: Optional[str] = None) -> dict:
+    """
+    Полнотекстовый поиск книг по названию и описанию.
+    :param db: Сессия базы данных.
+    :param q: Поисковый запрос (синтаксис websearch_to_tsquery в PostgreSQL).
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь с ключами items и next_cursor (Pydantic-модель Page[Book]).
+    :raises HTTPException: Если запрос состоит только из пробелов.
+    """
+    normalized = _normalize(q)
+    if db.get_bind().dialect.name == "postgresql":
+        query_vector = func.websearch_to_tsquery(literal_column("'simple'"), q)
+        rank = func.ts_rank(models.BOOK_SEARCH_DOCUMENT, query_vector, type_=REAL)
+        where = [models.BOOK_SEARCH_DOCUMENT.op("@@")(query_vector)]
+    else:
+        terms = [f"%{_escape_like(term)}%" for term in normalized.split()]
+        title = func.lower(models.Book.title)
+        description = func.lower(func.coalesce(models.Book.description, ""))
+        where = [or_(title.like(term, escape=LIKE_ESCAPE), description.like(term, escape=LIKE_ESCAPE)) for term in terms]
+        in_title = and_(*(title.like(term, escape=LIKE_ESCAPE) for term in terms))
+        rank = case((in_title, 1), else_=0)
+    return _page(db, models.Book, rank, where, limit, after)
+
+
+def search_authors(db: Session, q: str, limit: int, after: Optional[str] = None) -> dict:
+    """
+    Поиск авторов по началу имени или фамилии.
+    :param db: Сессия базы данных.
+    :param q: Начало имени или фамилии.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :return: Словарь с ключами items и next_cursor (Pydantic-модель Page[Author]).
+    :raises HTTPException: Если запрос состоит только из пробелов.
+    """
+    normalized = _normalize(q)
+    prefix = _escape_like(normalized)
+    name = models.AUTHOR_SEARCH_NAME
+    starts_name = name.like(f"{prefix}%", escape=LIKE_ESCAPE)
+    starts_word = name.like(f"% {prefix}%", escape=LIKE_ESCAPE)
+    if db.get_bind().dialect.name == "postgresql":
+        rank = func.similarity(name, normalized, type_=REAL)
+    else:
+        rank = case((starts_name, 1), else_=0)
+    return _page(db, models.Author, rank, [or_(starts_name, starts_word)], limit, after)
@@ -0,0 +1,44 @@
+"""
+Быстрая сериализация ответов.
+JSON кодируется через orjson (ORJSONResponse - класс ответа по умолчанию).
+Страницы списков и потоковые выгрузки без expand читают из базы только
+столбцы схемы ответа в виде кортежей и превращают их в словари напрямую,
+без ORM-объектов и проверки каждой строки Pydantic: состав и типы полей
+совпадают со схемой, потому что столбцы берутся по ее полям.
+"""
+from typing import Type
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_UTC_Z
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, option=OPTIONS)
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """
+    Ответ JSON через orjson; даты в UTC записываются с суффиксом Z, как у Pydantic.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def columns(model, schema: Type[BaseModel]) -> list:
+    """
+    Столбцы таблицы модели, соответствующие полям схемы ответа.
+    """
+    return [model.__table__.c[name] for name in schema.model_fields]
+
+
+def json_response(content, response: Response) -> ORJSONResponse:
+    """
+    Готовый ответ без проверки response_model; заголовки (ETag и т.п.)
+    переносятся из ответа, переданного эндпоинту.
+    """
+    return ORJSONResponse(content, headers=dict(response.headers))
@@ -0,0 +1,194 @@
+"""
+Статистика выдач: самые выдаваемые книги за месяц, просроченные выдачи и
+загрузка фонда по авторам.
+Агрегаты (models.BookCirculation и models.MonthlyCirculation) обновляются
+инкрементно в тех же транзакциях, что и выдачи и возвраты в app.crud, поэтому
+запросы статистики не читают историю выдач и не зависят от ее размера.
+Счетчики по авторам не хранятся: строка автора стала бы общей точкой
+блокировки для всех выдач его книг, а сумма по его книгам читает только их агрегаты.
+"""
+import os
+from collections import Counter
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import Date, case, cast, delete, func, insert, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models, pagination
+
+LOAN_DAYS = int(os.getenv("LOAN_DAYS", "14"))
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _upsert(db: Session, model, rows: list[dict], key: list[str], counters: list[str]):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters},
+    )
+    db.execute(stmt, rows)
+
+
+def record_borrows(db: Session, borrows: Iterable[tuple[int, date, bool]]):
+    """
+    Учитывает новые выдачи в агрегатах. Изменения не фиксируются,
+    транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    :param borrows: Тройки (ID книги, дата выдачи, выдача не закрыта).
+    """
+    total, out, monthly = Counter(), Counter(), Counter()
+    for book_id, borrow_date, is_open in borrows:
+        total[book_id] += 1
+        out[book_id] += is_open
+        monthly[month_start(borrow_date), book_id] += 1
+    if not total:
+        return
+    # Строки упорядочены по ключу, чтобы параллельные транзакции блокировали их в одном порядке.
+    _upsert(
+        db,
+        models.BookCirculation,
+        [{"book_id": book_id, "copies_out": out[book_id], "total_borrows": total[book_id]} for book_id in sorted(total)],
+        ["book_id"],
+        ["copies_out", "total_borrows"],
+    )
+    _upsert(
+        db,
+        models.MonthlyCirculation,
+        [{"month": month, "book_id": book_id, "borrows": count} for (month, book_id), count in sorted(monthly.items())],
+        ["month", "book_id"],
+        ["borrows"],
+    )
+
+
+def record_returns(db: Session, counts: dict[int, int]):
+    """
+    Учитывает возвраты: уменьшает число выданных копий книг.
+    :param db: Сессия базы данных.
+    :param counts: Количество возвращенных копий по ID книги.
+    """
+    if not counts:
+        return
+    db.execute(
+        update(models.BookCirculation)
+        .where(models.BookCirculation.book_id.in_(counts))
+        .values(copies_out=models.BookCirculation.copies_out - case(counts, value=models.BookCirculation.book_id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def forget_books(db: Session, book_ids):
+    """
+    Удаляет агрегаты книг перед удалением самих книг.
+    :param db: Сессия базы данных.
+    :param book_ids: ID книг или подзапрос, возвращающий ID.
+    """
+    for model in (models.BookCirculation, models.MonthlyCirculation):
+        db.execute(
+            delete(model).where(model.book_id.in_(book_ids)),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def rebuild(db: Session):
+    """
+    Пересчитывает агрегаты по выдачам и их архиву (после импорта данных в обход API).
+    Изменения не фиксируются, транзакцию завершает вызывающий код.
+    :param db: Сессия базы данных.
+    """
+    columns = ("book_id", "borrow_date", "return_date")
+    borrow = union_all(
+        select(*(models.Borrow.__table__.c[name] for name in columns)),
+        select(*(models.BorrowArchive.__table__.c[name] for name in columns)),
+    ).subquery().c
+    if db.get_bind().dialect.name == "postgresql":
+        month = cast(func.date_trunc("month", borrow.borrow_date), Date)
+    else:
+        month = func.date(borrow.borrow_date, "start of month")
+    db.execute(delete(models.MonthlyCirculation))
+    db.execute(delete(models.BookCirculation))
+    db.execute(insert(models.BookCirculation).from_select(
+        ["book_id", "copies_out", "total_borrows"],
+        select(
+            borrow.book_id,
+            func.count().filter(borrow.return_date.is_(None)),
+            func.count(),
+        ).group_by(borrow.book_id),
+    ))
+    db.execute(insert(models.MonthlyCirculation).from_select(
+        ["month", "book_id", "borrows"],
+        select(month, borrow.book_id, func.count()).group_by(month, borrow.book_id),
+    ))
+
+
+def top_books(db: Session, month: date, limit: int) -> list[dict]:
+    """
+    Самые выдаваемые книги за месяц.
+    :param db: Сессия базы данных.
+    :param month: Любой день нужного месяца.
+    :param limit: Число книг.
+    :return: Список словарей Pydantic-модели BookBorrowCount.
+    """
+    rows = db.execute(
+        select(models.MonthlyCirculation.book_id, models.Book.title, models.MonthlyCirculation.borrows)
+        .join(models.Book, models.Book.id == models.MonthlyCirculation.book_id)
+        .where(models.MonthlyCirculation.month == month_start(month))
+        .order_by(models.MonthlyCirculation.borrows.desc(), models.MonthlyCirculation.book_id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in rows]
+
+
+def overdue_borrows(db: Session, days: int, limit: int, after: Optional[str] = None, today: Optional[date] = None) -> dict:
+    """
+    Незакрытые выдачи старше days дней (частичный индекс ix_borrows_open_borrow_date).
+    :param db: Сессия базы данных.
+    :param days: Срок выдачи в днях.
+    :param limit: Размер страницы.
+    :param after: Курсор предыдущей страницы.
+    :param today: Текущая дата (для тестов).
+    :return: Словарь Pydantic-модели Page[Borrow].
+    """
+    cutoff = (today or date.today()) - timedelta(days=days)
+    query = db.query(models.Borrow).filter(
+        models.Borrow.return_date.is_(None),
+        models.Borrow.borrow_date < cutoff,
+    )
+    return pagination.paginate(query, models.Borrow.id, limit, after)
+
+
+def author_utilization(db: Session, limit: int) -> list[dict]:
+    """
+    Загрузка фонда по авторам: выданные копии и копии на полке по всем книгам автора.
+    :param db: Сессия базы данных.
+    :param limit: Число авторов (по убыванию числа выданных копий).
+    :return: Список словарей Pydantic-модели AuthorUtilization.
+    """
+    copies_out = func.coalesce(func.sum(models.BookCirculation.copies_out), 0).label("copies_out")
+    available = func.coalesce(func.sum(models.Book.available_copies), 0).label("available_copies")
+    rows = db.execute(
+        select(
+            models.Author.id.label("author_id"),
+            models.Author.first_name,
+            models.Author.last_name,
+            copies_out,
+            available,
+        )
+        .join(models.Book, models.Book.author_id == models.Author.id)
+        .outerjoin(models.BookCirculation, models.BookCirculation.book_id == models.Book.id)
+        .group_by(models.Author.id, models.Author.first_name, models.Author.last_name)
+        .order_by(copies_out.desc(), models.Author.id)
+        .limit(limit)
+    )
+    result = []
+    for row in rows:
+        item = row._asdict()
+        total = item["copies_out"] + item["available_copies"]
+        item["utilization"] = item["copies_out"] / total if total else 0.0
+        result.append(item)
+    return result
@@ -0,0 +1,33 @@
+"""
+Сравнение двух файлов результатов benchmarks.run.
+
+Запуск:
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(before: dict, after: dict) -> list[str]:
+    lines = [f"{'scenario':>15} {'metric':>8} {before['commit']:>12} {after['commit']:>12} {'change':>9}"]
+    for scenario in before["endpoints"].keys() & after["endpoints"].keys():
+        for metric in METRICS:
+            old, new = before["endpoints"][scenario][metric], after["endpoints"][scenario][metric]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"{scenario:>15} {metric:>8} {old:>12} {new:>12} {change:>9}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+    print("\n".join(compare(json.loads(args.before.read_text()), json.loads(args.after.read_text()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Наполнение базы синтетическим каталогом для бенчмарков.
+
+Запуск:
+    python -m benchmarks.seed --url sqlite:///bench.db --authors 10000 --books 100000 --borrows 1000000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+CHUNK_SIZE = 10_000
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(engine, authors: int, books: int, borrows: int, open_ratio: float = 0.1, random_seed: int = 42) -> dict:
+    """
+    Пересоздает схему и заполняет ее пачками по CHUNK_SIZE строк.
+    available_copies - остаток на полке, уже за вычетом открытых выдач.
+    :param engine: Движок SQLAlchemy целевой базы.
+    :param authors: Число авторов.
+    :param books: Число книг (распределяются по авторам равномерно).
+    :param borrows: Число записей о выдаче.
+    :param open_ratio: Доля незакрытых выдач.
+    :param random_seed: Начальное значение генератора для воспроизводимости.
+    :return: Параметры наполнения и затраченное время.
+    """
+    from sqlalchemy import insert, text
+    from sqlalchemy.orm import Session
+    from app import crud, models, stats
+    from app.database import Base
+
+    rng = random.Random(random_seed)
+    started = time.perf_counter()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    first_day = date(2020, 1, 1)
+    readers = max(borrows // 10, 1)
+    open_borrows = 0
+
+    def borrow_rows():
+        nonlocal open_borrows
+        for _ in range(borrows):
+            borrow_date = first_day + timedelta(days=rng.randrange(1800))
+            is_open = rng.random() < open_ratio
+            open_borrows += is_open
+            reader = rng.randrange(readers)
+            yield {
+                "book_id": rng.randrange(books) + 1,
+                "reader_id": reader + 1,
+                "reader_name": f"Reader {reader}",
+                "borrow_date": borrow_date,
+                "return_date": None if is_open else borrow_date + timedelta(days=rng.randrange(1, 60)),
+            }
+
+    with engine.begin() as conn:
+        for chunk in _chunks({
+            "id": i + 1,
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "birth_date": date(1900, 1, 1) + timedelta(days=rng.randrange(36500)),
+        } for i in range(authors)):
+            conn.execute(insert(models.Author), chunk)
+        for chunk in _chunks({
+            "id": i + 1,
+            "title": f"Book {i}",
+            "description": f"Description of book {i}",
+            "author_id": i % authors + 1,
+            "available_copies": rng.randrange(1, 5),
+        } for i in range(books)):
+            conn.execute(insert(models.Book), chunk)
+        for chunk in _chunks({"id": i + 1, "name": f"Reader {i}"} for i in range(readers)):
+            conn.execute(insert(models.Reader), chunk)
+        for chunk in _chunks(borrow_rows()):
+            conn.execute(insert(models.Borrow), chunk)
+        session = Session(bind=conn)
+        stats.rebuild(session)
+        crud.rebuild_loans(session)
+        if engine.dialect.name == "postgresql":
+            for table in ("authors", "books", "readers", "borrows"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+
+    return {
+        "authors": authors,
+        "books": books,
+        "readers": readers,
+        "borrows": borrows,
+        "open_borrows": open_borrows,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"))
+    parser.add_argument("--authors", type=int, default=10_000)
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--borrows", type=int, default=100_000)
+    parser.add_argument("--open-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.url
+    from sqlalchemy import create_engine
+
+    print(seed(create_engine(args.url), args.authors, args.books, args.borrows, args.open_ratio))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+Схема в том виде, в каком ее создавал Base.metadata.create_all при импорте
+app.main. Для существующей базы выполните `alembic stamp 0001`, затем
+`alembic upgrade head`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'authors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('first_name', sa.String(), nullable=False),
+        sa.Column('last_name', sa.String(), nullable=False),
+        sa.Column('birth_date', sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_authors_id', 'authors', ['id'])
+    op.create_table(
+        'books',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('available_copies', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['author_id'], ['authors.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_books_id', 'books', ['id'])
+    op.create_table(
+        'borrows',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('reader_name', sa.String(), nullable=False),
+        sa.Column('borrow_date', sa.Date(), nullable=False),
+        sa.Column('return_date', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_borrows_id', 'borrows', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrows_id', table_name='borrows')
+    op.drop_table('borrows')
+    op.drop_index('ix_books_id', table_name='books')
+    op.drop_table('books')
+    op.drop_index('ix_authors_id', table_name='authors')
+    op.drop_table('authors')
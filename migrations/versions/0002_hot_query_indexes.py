@@ -0,0 +1,40 @@
+"""indexes for foreign keys and open borrows
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_books_author_id', 'books', ['author_id'])
+    op.create_index('ix_borrows_book_id', 'borrows', ['book_id'])
+    op.create_index('ix_borrows_reader_name', 'borrows', ['reader_name'])
+    op.create_index('ix_borrows_return_date', 'borrows', ['return_date'])
+    op.create_index(
+        'ix_borrows_open_book_id',
+        'borrows',
+        ['book_id'],
+        postgresql_where=sa.text('return_date IS NULL'),
+        sqlite_where=sa.text('return_date IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrows_open_book_id', table_name='borrows')
+    op.drop_index('ix_borrows_return_date', table_name='borrows')
+    op.drop_index('ix_borrows_reader_name', table_name='borrows')
+    op.drop_index('ix_borrows_book_id', table_name='borrows')
+    op.drop_index('ix_books_author_id', table_name='books')
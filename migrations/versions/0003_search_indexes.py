@@ -0,0 +1,44 @@
+"""full-text and trigram search indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+Только для PostgreSQL: на других СУБД app.search использует LIKE без индексов.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_books_search_document',
+        'books',
+        [sa.text("to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))")],
+        postgresql_using='gin',
+    )
+    op.create_index(
+        'ix_authors_search_name_trgm',
+        'authors',
+        [sa.text("lower(first_name || ' ' || last_name) gin_trgm_ops")],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_authors_search_name_trgm', table_name='authors')
+    op.drop_index('ix_books_search_document', table_name='books')
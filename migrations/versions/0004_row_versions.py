@@ -0,0 +1,47 @@
+"""row version and updated_at columns for ETags
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:00:00.000000
+
+В PostgreSQL столбцы добавляются с DEFAULT без перезаписи таблиц (now()
+вычисляется один раз). SQLite не допускает непостоянный DEFAULT в ADD COLUMN,
+поэтому updated_at заполняется отдельно, а таблица пересоздается (batch).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('authors', 'books', 'borrows')
+
+
+def upgrade() -> None:
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+        if postgresql:
+            op.add_column(
+                table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+            )
+            continue
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+        op.execute(f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'updated_at', existing_type=sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+            )
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('version')
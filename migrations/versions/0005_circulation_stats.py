@@ -0,0 +1,62 @@
+"""circulation aggregates for /stats
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 13:00:00.000000
+
+Агрегаты заполняются по существующим выдачам; дальше их ведет app.stats.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'book_circulation',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id'), primary_key=True),
+        sa.Column('copies_out', sa.Integer(), nullable=False),
+        sa.Column('total_borrows', sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        'monthly_circulation',
+        sa.Column('month', sa.Date(), primary_key=True),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id'), primary_key=True),
+        sa.Column('borrows', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_monthly_circulation_book_id', 'monthly_circulation', ['book_id'])
+    op.create_index('ix_monthly_circulation_month_borrows', 'monthly_circulation', ['month', 'borrows'])
+    op.create_index(
+        'ix_borrows_open_borrow_date',
+        'borrows',
+        ['borrow_date'],
+        postgresql_where=sa.text('return_date IS NULL'),
+        sqlite_where=sa.text('return_date IS NULL'),
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "date_trunc('month', borrow_date)::date"
+    else:
+        month = "date(borrow_date, 'start of month')"
+    op.execute(
+        'INSERT INTO book_circulation (book_id, copies_out, total_borrows) '
+        'SELECT book_id, count(*) FILTER (WHERE return_date IS NULL), count(*) FROM borrows GROUP BY book_id'
+    )
+    op.execute(
+        f'INSERT INTO monthly_circulation (month, book_id, borrows) '
+        f'SELECT {month}, book_id, count(*) FROM borrows GROUP BY {month}, book_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrows_open_borrow_date', table_name='borrows')
+    op.drop_table('monthly_circulation')
+    op.drop_table('book_circulation')
@@ -0,0 +1,41 @@
+"""archive table for closed borrows
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 14:00:00.000000
+
+Таблицу заполняет задание app.archive; миграция строки не переносит.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'borrows_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id'), nullable=False),
+        sa.Column('reader_name', sa.String(), nullable=False),
+        sa.Column('borrow_date', sa.Date(), nullable=False),
+        sa.Column('return_date', sa.Date(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_borrows_archive_book_id', 'borrows_archive', ['book_id'])
+    op.create_index('ix_borrows_archive_reader_name', 'borrows_archive', ['reader_name'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrows_archive_reader_name', table_name='borrows_archive')
+    op.drop_index('ix_borrows_archive_book_id', table_name='borrows_archive')
+    op.drop_table('borrows_archive')
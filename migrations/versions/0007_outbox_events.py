@@ -0,0 +1,46 @@
+"""transactional outbox for borrow events
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 15:00:00.000000
+
+Таблицу заполняет app.crud, публикует app.events; миграция событий по
+существующим выдачам не создает.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=True),
+        sa.Column('published_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_outbox_events_position', 'outbox_events', ['position'], unique=True)
+    op.create_index(
+        'ix_outbox_events_unpublished',
+        'outbox_events',
+        ['id'],
+        postgresql_where=sa.text('position IS NULL'),
+        sqlite_where=sa.text('position IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_events_unpublished', table_name='outbox_events')
+    op.drop_index('ix_outbox_events_position', table_name='outbox_events')
+    op.drop_table('outbox_events')
@@ -0,0 +1,82 @@
+"""readers with active loan counters
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 16:00:00.000000
+
+Читатели создаются по различным reader_name выдач и архива, borrows.reader_id
+и borrows_archive.reader_id заполняются по имени, active_loans - по числу
+незакрытых выдач. Лимит max_active_loans у перенесенных читателей не задан
+(действует MAX_ACTIVE_LOANS); читатели, у которых выдач уже больше лимита,
+не получат новые книги, пока не вернут лишние.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('borrows', 'borrows_archive')
+
+
+def upgrade() -> None:
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    op.create_table(
+        'readers',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('max_active_loans', sa.Integer(), nullable=True),
+        sa.Column('active_loans', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_readers_id', 'readers', ['id'])
+    op.create_index('ix_readers_name', 'readers', ['name'], unique=True)
+    op.execute(
+        'INSERT INTO readers (name) '
+        'SELECT reader_name FROM borrows UNION SELECT reader_name FROM borrows_archive'
+    )
+
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('reader_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table}_reader_id', 'readers', ['reader_id'], ['id'])
+        if postgresql:
+            op.execute(f'UPDATE {table} SET reader_id = readers.id FROM readers WHERE readers.name = {table}.reader_name')
+        else:
+            op.execute(f'UPDATE {table} SET reader_id = (SELECT id FROM readers WHERE readers.name = {table}.reader_name)')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('reader_id', existing_type=sa.Integer(), nullable=False)
+
+    op.create_index('ix_borrows_reader_id', 'borrows', ['reader_id', 'id'])
+    op.create_index(
+        'ix_borrows_open_reader_id',
+        'borrows',
+        ['reader_id', 'id'],
+        postgresql_where=sa.text('return_date IS NULL'),
+        sqlite_where=sa.text('return_date IS NULL'),
+    )
+    op.create_index('ix_borrows_archive_reader_id', 'borrows_archive', ['reader_id'])
+    op.execute(
+        'UPDATE readers SET active_loans = ('
+        'SELECT count(*) FROM borrows WHERE borrows.reader_id = readers.id AND borrows.return_date IS NULL)'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_borrows_archive_reader_id', table_name='borrows_archive')
+    op.drop_index('ix_borrows_open_reader_id', table_name='borrows')
+    op.drop_index('ix_borrows_reader_id', table_name='borrows')
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'fk_{table}_reader_id', type_='foreignkey')
+            batch_op.drop_column('reader_id')
+    op.drop_index('ix_readers_name', table_name='readers')
+    op.drop_index('ix_readers_id', table_name='readers')
+    op.drop_table('readers')
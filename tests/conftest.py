@@ -0,0 +1,70 @@
+import os
+import pytest
+from sqlalchemy.engine import make_url
+from app import database, models  # noqa: F401
+from app.cache import cache
+
+# По умолчанию тесты идут на SQLite в памяти; TEST_DATABASE_URL - например, отдельная база PostgreSQL.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite://")
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="run tests marked slow (parallel threads, committed database)")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: parallel tests that take seconds; run with --run-slow")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow test, run with --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+@pytest.fixture(scope="session", autouse=True)
+def database_engine():
+    """
+    Приложение не создает таблицы (схемой управляет Alembic),
+    поэтому тестовая база создается по метаданным моделей.
+    """
+    engine = database.configure(TEST_DATABASE_URL)
+    database.Base.metadata.create_all(bind=engine)
+    yield engine
+    database.Base.metadata.drop_all(bind=engine)
+    database.dispose()
+
+@pytest.fixture(autouse=True)
+def rollback_transaction(database_engine):
+    """
+    Каждый тест выполняется во внешней транзакции, которая откатывается после него:
+    commit в коде приложения фиксирует только точку сохранения (SAVEPOINT).
+    Кэш очищается, чтобы в нем не оставались откаченные строки.
+    """
+    connection = database_engine.connect()
+    transaction = connection.begin()
+    database.SessionLocal.configure(bind=connection, join_transaction_mode="create_savepoint")
+    cache.reset()
+    yield connection
+    database.SessionLocal.configure(bind=database_engine, join_transaction_mode="conditional_savepoint")
+    transaction.rollback()
+    connection.close()
+    cache.reset()
+
+@pytest.fixture
+def committed_database(tmp_path, monkeypatch):
+    """
+    Отдельная база без отката для тестов с параллельными соединениями и
+    асинхронным движком: файл SQLite или TEST_DATABASE_URL, если база не в памяти.
+    """
+    in_memory = make_url(TEST_DATABASE_URL).database in (None, "", ":memory:")
+    url = f"sqlite:///{tmp_path / 'committed.db'}" if in_memory else TEST_DATABASE_URL
+    engine = database.make_engine(url)
+    database.Base.metadata.create_all(bind=engine)
+    previous = dict(database.SessionLocal.kw)
+    monkeypatch.setattr(database, "engine", engine)
+    database.SessionLocal.configure(bind=engine, join_transaction_mode="conditional_savepoint")
+    database.forget_async_engines()
+    yield engine
+    database.forget_async_engines()
+    database.SessionLocal.configure(**previous)
+    engine.dispose()
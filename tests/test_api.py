@@ -1,6 +1,19 @@
+import csv
+import functools
+import io
+import json
+import time
+import fakeredis
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from fastapi.testclient import TestClient
-from app.main import app
+from sqlalchemy import create_engine, event, func, insert, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from app import admission, archive, database, events, metrics, models, pagination, stats
+from app.cache import Cache, LRUBackend, RedisBackend, book_key
+from app.main import app, create_app
 
 client = TestClient(app)
 
@@ -13,11 +26,11 @@ def test_borrow_book_with_available_copies():
     assert response_book.status_code == 200
     book_id = response_book.json()["id"]
 
-    response_borrow_1 = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 1", "borrow_date": "2024-12-11", "return_date": "2024-12-12"})
+    response_borrow_1 = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 1", "borrow_date": "2024-12-11"})
     assert response_borrow_1.status_code == 200
     assert response_borrow_1.json()["reader_name"] == "Reader 1"
 
-    response_borrow_2 = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 2", "borrow_date": "2024-12-12", "return_date": "2024-12-13"})
+    response_borrow_2 = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 2", "borrow_date": "2024-12-12"})
     assert response_borrow_2.status_code == 200
     assert response_borrow_2.json()["reader_name"] == "Reader 2"
 
@@ -34,6 +47,727 @@ def test_borrow_unavailable_book():
     assert response_book.status_code == 200
     book_id = response_book.json()["id"]
 
-    response_borrow = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 3", "borrow_date": "2024-12-12", "return_date": "2024-12-13"})
+    response_borrow = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 3", "borrow_date": "2024-12-12"})
     assert response_borrow.status_code == 400
     assert response_borrow.json()["detail"] == "No available copies"
+
+def test_closed_borrow_is_recorded_without_taking_a_copy():
+    response_author = client.post("/authors", json={"first_name": "History", "last_name": "Author", "birth_date": "1985-05-15"})
+    author_id = response_author.json()["id"]
+    book_id = client.post("/books", json={"title": "History Book", "description": "Description", "author_id": author_id, "available_copies": 1}).json()["id"]
+
+    for copies in (1, 0):
+        response_borrow = client.post("/borrows", json={"book_id": book_id, "reader_name": "History Reader", "borrow_date": "2024-12-01", "return_date": "2024-12-05"})
+        assert response_borrow.status_code == 200
+        assert client.get(f"/books/{book_id}").json()["available_copies"] == copies
+        if copies:
+            client.post("/borrows", json={"book_id": book_id, "reader_name": "Open Reader", "borrow_date": "2024-12-11"})
+    reader_id = response_borrow.json()["reader_id"]
+    assert client.get(f"/readers/{reader_id}").json()["active_loans"] == 0
+
+    response_missing = client.post("/borrows", json={"book_id": 999999, "reader_name": "History Reader", "borrow_date": "2024-12-01", "return_date": "2024-12-05"})
+    assert response_missing.status_code == 400
+    assert response_missing.json()["detail"] == "Book not found"
+
+def test_return_borrow_restocks_once():
+    response_author = client.post("/authors", json={"first_name": "Return", "last_name": "Author", "birth_date": "1985-05-15"})
+    author_id = response_author.json()["id"]
+    response_book = client.post("/books", json={"title": "Returned Book", "description": "Description", "author_id": author_id, "available_copies": 1})
+    book_id = response_book.json()["id"]
+    borrow_id = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader 4", "borrow_date": "2024-12-11"}).json()["id"]
+    assert client.get(f"/books/{book_id}").json()["available_copies"] == 0
+
+    for _ in range(2):
+        response_return = client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-20"})
+        assert response_return.status_code == 200
+        assert response_return.json()["return_date"] == "2024-12-20"
+    assert client.get(f"/books/{book_id}").json()["available_copies"] == 1
+
+    response_other_date = client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-21"})
+    assert response_other_date.status_code == 400
+    assert response_other_date.json()["detail"] == "Borrow already returned"
+    assert client.patch("/borrows/999999/return", json={"return_date": "2024-12-20"}).status_code == 404
+
+def test_list_books_keyset_pagination():
+    response_author = client.post("/authors", json={"first_name": "Paged", "last_name": "Author", "birth_date": "1970-01-01"})
+    assert response_author.status_code == 200
+    author_id = response_author.json()["id"]
+
+    created_ids = []
+    for i in range(5):
+        response_book = client.post("/books", json={"title": f"Paged Book {i}", "description": "Description", "author_id": author_id})
+        assert response_book.status_code == 200
+        created_ids.append(response_book.json()["id"])
+
+    seen_ids = []
+    after = None
+    while True:
+        params = {"limit": 2}
+        if after:
+            params["after"] = after
+        response_page = client.get("/books", params=params)
+        assert response_page.status_code == 200
+        page = response_page.json()
+        assert len(page["items"]) <= 2
+        seen_ids.extend(item["id"] for item in page["items"])
+        after = page["next_cursor"]
+        if after is None:
+            break
+
+    assert seen_ids == sorted(seen_ids)
+    assert set(created_ids) <= set(seen_ids)
+
+    response_invalid = client.get("/books", params={"after": "not-a-cursor"})
+    assert response_invalid.status_code == 400
+
+def test_list_books_ndjson_stream():
+    response_author = client.post("/authors", json={"first_name": "Stream", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    response_book = client.post("/books", json={"title": "Streamed Book", "description": "Description", "author_id": author_id})
+    book_id = response_book.json()["id"]
+
+    response_stream = client.get("/books", params={"stream": "true"})
+    assert response_stream.status_code == 200
+    assert response_stream.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response_stream.text.splitlines()]
+    assert book_id in [row["id"] for row in rows]
+
+def test_list_rows_match_item_representation():
+    response_author = client.post("/authors", json={"first_name": "Fast", "last_name": "Path", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book_id = client.post("/books", json={"title": "Fast Book", "description": "Description", "author_id": author_id}).json()["id"]
+
+    response_page = client.get("/books", params={"after": pagination.encode_cursor(book_id - 1), "limit": 1})
+    assert response_page.headers["content-type"] == "application/json"
+    assert response_page.json()["items"] == [client.get(f"/books/{book_id}").json()]
+    stream_lines = client.get("/authors", params={"stream": "true", "after": pagination.encode_cursor(author_id - 1)}).text.splitlines()
+    assert json.loads(stream_lines[0]) == client.get(f"/authors/{author_id}").json()
+
+def test_async_mode_serves_requests_through_async_session(committed_database, monkeypatch):
+    monkeypatch.setattr(database, "DB_ASYNC", True)
+    monkeypatch.setattr(events, "EVENTS_DISPATCH", False)
+    statements = {"sync": [], "async": []}
+    event.listen(committed_database, "before_cursor_execute", lambda conn, cursor, sql, *args: statements["sync"].append(sql))
+    event.listen(database.get_async_engine().sync_engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements["async"].append(sql))
+
+    with TestClient(create_app()) as async_client:
+        author_id = async_client.post("/authors", json={"first_name": "Async", "last_name": "Author", "birth_date": "1990-01-01"}).json()["id"]
+        assert async_client.get(f"/authors/{author_id}").json()["first_name"] == "Async"
+        book_id = async_client.post("/books", json={"title": "Async Book", "description": "Description", "author_id": author_id, "available_copies": 3}).json()["id"]
+        response_borrow = async_client.post("/borrows", json={"book_id": book_id, "reader_name": "Async Reader", "borrow_date": "2024-12-11"})
+        assert response_borrow.status_code == 200
+        response_book = async_client.get(f"/books/{book_id}")
+        assert response_book.json()["available_copies"] == 2
+        assert async_client.get(f"/books/{book_id}", headers={"If-None-Match": response_book.headers["ETag"]}).status_code == 304
+        assert async_client.put(f"/books/{book_id}", json={"title": "Async Book 2", "description": "Description", "author_id": author_id, "available_copies": 2}, headers={"If-Match": response_book.headers["ETag"]}).status_code == 200
+        borrow_id = response_borrow.json()["id"]
+        assert async_client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-20"}).json()["return_date"] == "2024-12-20"
+        assert async_client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-21"}).status_code == 400
+        assert async_client.get("/books/999999").status_code == 404
+        assert async_client.post("/borrows/batch", json={"book_ids": [book_id], "reader_name": "Async Reader", "borrow_date": "2024-12-21"}).json()["committed"]
+
+        assert [item["id"] for item in async_client.get("/authors", params={"expand": "books"}).json()["items"]] == [author_id]
+        assert async_client.get("/books").json()["items"][0]["title"] == "Async Book 2"
+        assert async_client.get("/books/search", params={"q": "async"}).json()["items"][0]["id"] == book_id
+        assert async_client.get(f"/borrows/{borrow_id}", params={"expand": "book"}).json()["book"]["id"] == book_id
+        reader_id = response_borrow.json()["reader_id"]
+        assert async_client.get(f"/readers/{reader_id}").json()["active_loans"] == 1
+        assert len(async_client.get(f"/readers/{reader_id}/borrows").json()["items"]) == 2
+        assert async_client.get("/stats/authors").json()[0]["author_id"] == author_id
+        response_bulk = async_client.post("/authors/bulk", content='{"first_name": "Bulk", "last_name": "Async", "birth_date": "1970-01-01"}\n{}', headers={"Content-Type": "application/x-ndjson"})
+        assert response_bulk.json()["inserted"] == 1 and len(response_bulk.json()["errors"]) == 1
+        assert statements["sync"] == []
+        assert any(sql.startswith("UPDATE borrows") for sql in statements["async"])
+
+        # Потоковые выгрузки открывают свои синхронные сессии.
+        assert async_client.get("/books/export").status_code == 200
+        assert statements["sync"]
+        async_paths = async_client.get("/openapi.json").json()["paths"]
+    assert not database._async_engines
+    monkeypatch.setattr(database, "DB_ASYNC", False)
+    assert async_paths == create_app().openapi()["paths"]
+
+def test_bulk_import_books_reports_row_errors():
+    response_author = client.post("/authors", json={"first_name": "Bulk", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+
+    books = [
+        {"title": "Bulk Book 1", "description": "Description", "author_id": author_id, "available_copies": 2},
+        {"title": "Bulk Book 2", "description": "Description", "author_id": 10**9},
+        {"title": "Bulk Book 3", "author_id": author_id},
+        {"title": "Bulk Book 4", "description": "Description", "author_id": author_id},
+    ]
+    response_bulk = client.post("/books/bulk", json=books)
+    assert response_bulk.status_code == 200
+    result = response_bulk.json()
+    assert result["inserted"] == 2
+    assert [error["row"] for error in result["errors"]] == [1, 2]
+    assert result["errors"][0]["detail"] == "Author not found"
+
+def test_bulk_import_ndjson_and_csv_export():
+    lines = "\n".join(json.dumps({"first_name": f"Ndjson{i}", "last_name": "Author", "birth_date": "1970-01-01"}) for i in range(3))
+    response_bulk = client.post("/authors/bulk", content=lines + "\nnot json\n", headers={"content-type": "application/x-ndjson"})
+    assert response_bulk.status_code == 200
+    assert response_bulk.json()["inserted"] == 3
+    assert [error["row"] for error in response_bulk.json()["errors"]] == [3]
+
+    response_export = client.get("/authors/export", params={"format": "csv"})
+    assert response_export.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response_export.text)))
+    assert {"Ndjson0", "Ndjson1", "Ndjson2"} <= {row["first_name"] for row in rows}
+
+def test_bulk_import_borrows_reserves_copies():
+    response_author = client.post("/authors", json={"first_name": "Bulk", "last_name": "Borrow", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    response_book = client.post("/books", json={"title": "Bulk Borrow Book", "description": "Description", "author_id": author_id, "available_copies": 1})
+    book_id = response_book.json()["id"]
+
+    payload = "book_id,reader_name,borrow_date,return_date\n" + "\n".join([
+        f"{book_id},\"Reader, History\",2024-01-01,2024-01-10",
+        f"{book_id},Reader Active,2024-12-01,",
+    ])
+    response_bulk = client.post("/borrows/bulk", content=payload, headers={"content-type": "text/csv"})
+    assert response_bulk.status_code == 200
+    assert response_bulk.json() == {"inserted": 2, "errors": []}
+    assert client.get(f"/books/{book_id}").json()["available_copies"] == 0
+
+def test_book_cache_hits_and_invalidation():
+    response_author = client.post("/authors", json={"first_name": "Cached", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    response_book = client.post("/books", json={"title": "Cached Book", "description": "Description", "author_id": author_id, "available_copies": 2})
+    book_id = response_book.json()["id"]
+
+    client.get(f"/books/{book_id}")
+    hits_before = client.get("/cache/stats").json()["hits"]
+    assert client.get(f"/books/{book_id}").json()["title"] == "Cached Book"
+    assert client.get("/cache/stats").json()["hits"] == hits_before + 1
+
+    client.put(f"/books/{book_id}", json={"title": "Renamed Book", "description": "Description", "author_id": author_id, "available_copies": 2})
+    assert client.get(f"/books/{book_id}").json()["title"] == "Renamed Book"
+
+    client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader", "borrow_date": "2024-12-11"})
+    assert client.get(f"/books/{book_id}").json()["available_copies"] == 1
+
+def test_book_cache_skips_value_loaded_before_concurrent_update():
+    local = Cache(LRUBackend())
+
+    def load_then_update():
+        # Изменение фиксируется, пока читатель еще держит загруженную строку.
+        local.invalidate_namespace("books")
+        local.invalidate(book_key(1))
+        return {"id": 1, "title": "Stale"}
+
+    assert local.get_or_load(book_key(1), load_then_update, namespace="books")["title"] == "Stale"
+    assert local.backend.get(book_key(1)) is None
+    assert local.get_or_load(book_key(1), lambda: {"id": 1, "title": "Fresh"}, namespace="books")["title"] == "Fresh"
+    assert local.backend.get(book_key(1)) == {"id": 1, "title": "Fresh"}
+
+    class UpdateBeforeSet(LRUBackend):
+        def set(self, key, value):
+            if key == book_key(2):
+                # Изменение успело между проверкой поколения и записью значения.
+                self.delete("books:generation", key)
+            super().set(key, value)
+
+    racing = Cache(UpdateBeforeSet())
+    assert racing.get_or_load(book_key(2), lambda: {"id": 2, "title": "Stale"}, namespace="books")["title"] == "Stale"
+    assert racing.backend.get(book_key(2)) is None
+
+def test_redis_cache_backend_with_stand_in_client():
+    class StandInRedis:
+        def __init__(self):
+            self.data = {}
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def set(self, key, value, ex=None):
+            self.data[key] = value
+
+        def delete(self, *keys):
+            for key in keys:
+                self.data.pop(key, None)
+
+    stand_in = StandInRedis()
+    redis_cache = Cache(RedisBackend(stand_in))
+    assert redis_cache.get_or_load("book:1", lambda: {"id": 1}) == {"id": 1}
+    assert redis_cache.get_or_load("book:1", lambda: None) == {"id": 1}
+    assert redis_cache.stats()["hits"] == 1
+
+    page_key = redis_cache.namespace_key("books", 50, None)
+    redis_cache.get_or_load(page_key, lambda: {"items": [], "next_cursor": None})
+    redis_cache.invalidate_namespace("books")
+    assert redis_cache.namespace_key("books", 50, None) != page_key
+
+def test_delete_author_cascades_to_books_and_borrows():
+    response_author = client.post("/authors", json={"first_name": "Deleted", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    response_book = client.post("/books", json={"title": "Deleted Book", "description": "Description", "author_id": author_id, "available_copies": 2})
+    book_id = response_book.json()["id"]
+    response_borrow = client.post("/borrows", json={"book_id": book_id, "reader_name": "Reader", "borrow_date": "2024-12-11"})
+    borrow_id = response_borrow.json()["id"]
+    assert client.get(f"/books/{book_id}").status_code == 200
+
+    response_delete = client.delete(f"/authors/{author_id}")
+    assert response_delete.status_code == 200
+    assert client.get(f"/authors/{author_id}").status_code == 404
+    assert client.get(f"/books/{book_id}").status_code == 404
+    assert client.get(f"/borrows/{borrow_id}").status_code == 404
+    assert client.delete(f"/authors/{author_id}").status_code == 404
+
+def test_search_books_and_authors():
+    response_author = client.post("/authors", json={"first_name": "Searchable", "last_name": "Writerson", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    response_title = client.post("/books", json={"title": "Quasar Navigation", "description": "Stars", "author_id": author_id})
+    response_description = client.post("/books", json={"title": "Other", "description": "A quasar in the margin", "author_id": author_id})
+
+    response_search = client.get("/books/search", params={"q": "quasar", "limit": 1})
+    assert response_search.status_code == 200
+    page = response_search.json()
+    assert [item["id"] for item in page["items"]] == [response_title.json()["id"]]
+    response_next = client.get("/books/search", params={"q": "quasar", "limit": 1, "after": page["next_cursor"]})
+    assert [item["id"] for item in response_next.json()["items"]] == [response_description.json()["id"]]
+
+    # Страницы идут keyset-курсором (релевантность, id) без OFFSET: ни одна книга не теряется и не повторяется.
+    more_titles = [client.post("/books", json={"title": f"Pulsar {i}", "description": "Sky", "author_id": author_id}).json()["id"] for i in range(3)]
+    more_descriptions = [client.post("/books", json={"title": f"Other {i}", "description": "pulsar notes", "author_id": author_id}).json()["id"] for i in range(2)]
+    statements = []
+    listener = lambda conn, cursor, sql, parameters, *args: statements.append((sql, parameters))
+    event.listen(database.engine, "before_cursor_execute", listener)
+    try:
+        found, after = [], None
+        while True:
+            response_page = client.get("/books/search", params={"q": "pulsar", "limit": 2, **({"after": after} if after else {})})
+            found += [item["id"] for item in response_page.json()["items"]]
+            after = response_page.json()["next_cursor"]
+            if after is None:
+                break
+    finally:
+        event.remove(database.engine, "before_cursor_execute", listener)
+    assert found == sorted(more_titles, reverse=True) + sorted(more_descriptions, reverse=True)
+    # SQLite всегда выводит OFFSET в запросе с LIMIT; смещение должно оставаться нулевым.
+    assert [parameters[-1] for sql, parameters in statements if sql.endswith("OFFSET ?")] == [0, 0, 0]
+    assert client.get("/books/search", params={"q": "pulsar", "after": pagination.encode_cursor(1)}).status_code == 400
+
+    response_authors = client.get("/authors/search", params={"q": "writers"})
+    assert response_authors.status_code == 200
+    assert author_id in [item["id"] for item in response_authors.json()["items"]]
+    assert client.get("/authors/search", params={"q": "riterson"}).json()["items"] == []
+    assert client.get("/authors/search", params={"q": "   "}).status_code == 400
+    assert client.get("/books/search", params={"q": " \t"}).status_code == 400
+
+def count_queries(request):
+    statements = []
+    # Управление транзакциями (в тестах - точки сохранения) запросами не считается.
+    listener = lambda *args: None if args[2].startswith(("SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN")) else statements.append(args[2])
+    event.listen(database.engine, "before_cursor_execute", listener)
+    try:
+        response = request()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", listener)
+    return response, len(statements)
+
+def test_expand_loads_relations_in_constant_queries():
+    author_ids = []
+    for i in range(2):
+        response_author = client.post("/authors", json={"first_name": f"Expand{i}", "last_name": "Author", "birth_date": "1970-01-01"})
+        author_ids.append(response_author.json()["id"])
+    for author_id in author_ids:
+        for j in range(3):
+            response_book = client.post("/books", json={"title": f"Expanded Book {j}", "description": "Description", "author_id": author_id, "available_copies": 2})
+            client.post("/borrows", json={"book_id": response_book.json()["id"], "reader_name": f"Reader {j}", "borrow_date": "2024-12-11"})
+
+    after = pagination.encode_cursor(author_ids[0] - 1)
+    response_small, queries_small = count_queries(lambda: client.get("/authors", params={"after": after, "limit": 1, "expand": "books,borrows"}))
+    response_large, queries_large = count_queries(lambda: client.get("/authors", params={"after": after, "limit": 2, "expand": "books,borrows"}))
+    assert response_large.status_code == 200
+    assert queries_small == queries_large == 3
+    authors = response_large.json()["items"]
+    assert [author["id"] for author in authors] == author_ids
+    assert all(len(author["books"]) == 3 for author in authors)
+    assert all(len(book["borrows"]) == 1 for author in authors for book in author["books"])
+
+    book_id = authors[0]["books"][0]["id"]
+    response_book, queries_book = count_queries(lambda: client.get(f"/books/{book_id}", params={"expand": "author"}))
+    assert queries_book == 1
+    assert response_book.json()["author"]["id"] == author_ids[0]
+    assert "borrows" not in response_book.json()
+
+    assert client.get("/books", params={"expand": "readers"}).status_code == 400
+
+def test_batch_checkout_and_return():
+    response_author = client.post("/authors", json={"first_name": "Batch", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book_ids = [
+        client.post("/books", json={"title": f"Batch Book {i}", "description": "Description", "author_id": author_id, "available_copies": 1}).json()["id"]
+        for i in range(3)
+    ]
+    batch = {"reader_name": "Kiosk Reader", "borrow_date": "2024-12-01", "book_ids": book_ids + [book_ids[0], 999999]}
+
+    response_strict = client.post("/borrows/batch", json=batch)
+    assert response_strict.status_code == 409
+    details = {item["id"]: item["detail"] for item in response_strict.json()["detail"]["items"]}
+    assert details[book_ids[0]] == "No available copies" and details[999999] == "Book not found"
+    assert all(client.get(f"/books/{book_id}").json()["available_copies"] == 1 for book_id in book_ids)
+
+    response_partial = client.post("/borrows/batch", json={**batch, "mode": "partial"})
+    assert response_partial.status_code == 200
+    items = response_partial.json()["items"]
+    borrow_ids = [item["borrow"]["id"] for item in items if item["borrow"]]
+    # Единственная копия book_ids[0] выдается по первому повтору, второй повтор отклоняется.
+    assert [item["detail"] for item in items] == [None, None, None, "No available copies", "Book not found"]
+    assert len(borrow_ids) == 3 and items[0]["borrow"]["book_id"] == book_ids[0]
+
+    response_return = client.post("/borrows/return-batch", json={"borrow_ids": borrow_ids + [999999], "return_date": "2024-12-10"})
+    assert response_return.status_code == 409
+    response_return = client.post("/borrows/return-batch", json={"borrow_ids": borrow_ids, "return_date": "2024-12-10"})
+    assert response_return.status_code == 200
+    assert all(item["borrow"]["return_date"] == "2024-12-10" for item in response_return.json()["items"])
+    assert all(client.get(f"/books/{book_id}").json()["available_copies"] == 1 for book_id in book_ids)
+
+    response_again = client.post("/borrows/return-batch", json={"borrow_ids": borrow_ids, "return_date": "2024-12-11", "mode": "partial"})
+    assert [item["detail"] for item in response_again.json()["items"]] == ["Borrow already returned"] * 3
+
+def test_batch_queries_do_not_depend_on_batch_size():
+    response_author = client.post("/authors", json={"first_name": "Sized", "last_name": "Author", "birth_date": "1970-01-01"})
+    book_ids = [
+        client.post("/books", json={"title": f"Sized Book {i}", "description": "Description", "author_id": response_author.json()["id"], "available_copies": 1}).json()["id"]
+        for i in range(22)
+    ]
+    reader_id = client.post("/readers", json={"name": "Sized Reader", "max_active_loans": 50}).json()["id"]
+
+    def checkout(ids):
+        # Несуществующая книга в каждом пакете: оба пакета проходят и ветку отказов.
+        batch = {"reader_id": reader_id, "borrow_date": "2024-12-01", "book_ids": ids + [999999], "mode": "partial"}
+        response, queries = count_queries(lambda: client.post("/borrows/batch", json=batch))
+        assert response.status_code == 200
+        return [item["borrow"]["id"] for item in response.json()["items"] if item["borrow"]], queries
+
+    small_ids, small_queries = checkout(book_ids[:2])
+    large_ids, large_queries = checkout(book_ids[2:])
+    assert len(small_ids) == 2 and len(large_ids) == 20
+    assert small_queries == large_queries
+
+    def return_batch(ids):
+        batch = {"borrow_ids": ids + [999999], "return_date": "2024-12-10", "mode": "partial"}
+        response, queries = count_queries(lambda: client.post("/borrows/return-batch", json=batch))
+        assert response.status_code == 200
+        return queries
+
+    assert return_batch(small_ids) == return_batch(large_ids)
+
+def test_conditional_reads_and_if_match_updates():
+    response_author = client.post("/authors", json={"first_name": "Etag", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book = {"title": "Etag Book", "description": "Description", "author_id": author_id, "available_copies": 2}
+    book_id = client.post("/books", json=book).json()["id"]
+
+    response_book = client.get(f"/books/{book_id}")
+    etag = response_book.headers["etag"]
+    assert response_book.json()["version"] == 1
+    response_cached = client.get(f"/books/{book_id}", headers={"If-None-Match": etag})
+    assert response_cached.status_code == 304 and response_cached.content == b""
+    assert client.get(f"/books/{book_id}", headers={"If-Modified-Since": response_book.headers["last-modified"]}).status_code == 304
+
+    response_page = client.get("/books", params={"limit": 500})
+    assert client.get("/books", params={"limit": 500}, headers={"If-None-Match": response_page.headers["etag"]}).status_code == 304
+
+    client.post("/borrows", json={"book_id": book_id, "reader_name": "Etag Reader", "borrow_date": "2024-12-01"})
+    response_changed = client.get(f"/books/{book_id}", headers={"If-None-Match": etag})
+    assert response_changed.status_code == 200 and response_changed.json()["version"] == 2
+    assert client.get("/books", params={"limit": 500}, headers={"If-None-Match": response_page.headers["etag"]}).status_code == 200
+
+    response_stale = client.put(f"/books/{book_id}", json={**book, "title": "Lost Update"}, headers={"If-Match": etag})
+    assert response_stale.status_code == 412
+    response_update = client.put(f"/books/{book_id}", json={**book, "title": "Etag Book 2"}, headers={"If-Match": response_changed.headers["etag"]})
+    assert response_update.status_code == 200
+    assert response_update.json()["version"] == 3
+    assert response_update.headers["etag"] == client.get(f"/books/{book_id}").headers["etag"]
+
+def test_stats_follow_borrows_and_returns():
+    response_author = client.post("/authors", json={"first_name": "Stats", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book_ids = [
+        client.post("/books", json={"title": f"Stats Book {i}", "description": "Description", "author_id": author_id, "available_copies": 3}).json()["id"]
+        for i in range(2)
+    ]
+    borrow_ids = [
+        client.post("/borrows", json={"book_id": book_ids[0], "reader_name": "Stats Reader", "borrow_date": "1999-01-05"}).json()["id"]
+        for _ in range(2)
+    ]
+    client.post("/borrows/batch", json={"reader_name": "Stats Reader", "borrow_date": "1999-01-20", "book_ids": book_ids})
+    client.patch(f"/borrows/{borrow_ids[0]}/return", json={"return_date": "1999-01-10"})
+
+    response_top = client.get("/stats/top-books", params={"month": "1999-01-31"})
+    assert response_top.status_code == 200
+    assert [(item["book_id"], item["borrows"]) for item in response_top.json()] == [(book_ids[0], 3), (book_ids[1], 1)]
+
+    response_overdue = client.get("/stats/overdue", params={"days": 14, "limit": 500})
+    overdue_ids = {item["id"] for item in response_overdue.json()["items"]}
+    assert borrow_ids[1] in overdue_ids and borrow_ids[0] not in overdue_ids
+
+    response_authors = client.get("/stats/authors", params={"limit": 100})
+    utilization = next(item for item in response_authors.json() if item["author_id"] == author_id)
+    assert utilization["copies_out"] == 3 and utilization["available_copies"] == 3
+    assert utilization["utilization"] == 0.5
+
+    db = database.SessionLocal()
+    try:
+        incremental = db.execute(select(models.BookCirculation.book_id, models.BookCirculation.copies_out, models.BookCirculation.total_borrows).order_by(models.BookCirculation.book_id)).all()
+        stats.rebuild(db)
+        rebuilt = db.execute(select(models.BookCirculation.book_id, models.BookCirculation.copies_out, models.BookCirculation.total_borrows).order_by(models.BookCirculation.book_id)).all()
+        db.rollback()
+    finally:
+        db.close()
+    assert incremental == rebuilt
+
+def test_archive_moves_old_closed_borrows():
+    response_author = client.post("/authors", json={"first_name": "Archive", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book_id = client.post("/books", json={"title": "Archived Book", "description": "Description", "author_id": author_id, "available_copies": 5}).json()["id"]
+    old_id = client.post("/borrows", json={"book_id": book_id, "reader_name": "Old Reader", "borrow_date": "1990-01-01", "return_date": "1990-01-15"}).json()["id"]
+    open_id = client.post("/borrows", json={"book_id": book_id, "reader_name": "Open Reader", "borrow_date": "1990-01-01"}).json()["id"]
+
+    db = database.SessionLocal()
+    try:
+        assert archive.archive_borrows(db, older_than_days=365, batch_size=1) >= 1
+        incremental = db.execute(select(models.BookCirculation.total_borrows).where(models.BookCirculation.book_id == book_id)).scalar_one()
+        stats.rebuild(db)
+        assert db.execute(select(models.BookCirculation.total_borrows).where(models.BookCirculation.book_id == book_id)).scalar_one() == incremental == 2
+        db.rollback()
+    finally:
+        db.close()
+
+    listed = {item["id"] for item in client.get("/borrows", params={"limit": 500}).json()["items"]}
+    assert open_id in listed and old_id not in listed
+    archived = {item["id"] for item in client.get("/borrows/archive", params={"limit": 500}).json()["items"]}
+    assert old_id in archived and open_id not in archived
+    assert client.get(f"/borrows/{old_id}").json()["return_date"] == "1990-01-15"
+
+    assert client.delete(f"/books/{book_id}").status_code == 200
+    assert client.get(f"/borrows/{old_id}").status_code == 404
+
+def test_reads_use_replica_until_own_write_or_lag(tmp_path, monkeypatch):
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    database.Base.metadata.create_all(bind=replica)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(bind=replica, expire_on_commit=False, info={"replica": True}))
+    monkeypatch.setattr(database, "replica_lag", lambda: 0.0)
+
+    writer = TestClient(app)
+    response_author = writer.post("/authors", json={"first_name": "Primary", "last_name": "Author", "birth_date": "1970-01-01"})
+    assert database.READ_PRIMARY_COOKIE in response_author.cookies
+    author_id = response_author.json()["id"]
+    with replica.begin() as conn:
+        conn.execute(insert(models.Author).values(id=author_id, first_name="Replica", last_name="Author", birth_date=date(1970, 1, 1)))
+
+    reader = TestClient(app)
+    assert reader.get(f"/authors/{author_id}").json()["first_name"] == "Replica"
+    monkeypatch.setattr(database, "replica_lag", lambda: database.REPLICA_MAX_LAG_SECONDS + 1)
+    assert reader.get(f"/authors/{author_id}").json()["first_name"] == "Primary"
+    monkeypatch.setattr(database, "replica_lag", lambda: 0.0)
+    assert writer.get(f"/authors/{author_id}").json()["first_name"] == "Primary"
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.events = []
+        self.fail = fail
+
+    def publish(self, batch):
+        if self.fail:
+            raise ConnectionError("sink unavailable")
+        self.events.extend(batch)
+
+def test_outbox_events_published_and_streamed_from_offset():
+    db = database.SessionLocal()
+    try:
+        events.publish_pending(db, ListSink(), batch_size=100000)
+        after = db.scalar(select(func.coalesce(func.max(models.OutboxEvent.position), 0)))
+    finally:
+        db.close()
+
+    response_author = client.post("/authors", json={"first_name": "Evented", "last_name": "Author", "birth_date": "1970-01-01"})
+    author_id = response_author.json()["id"]
+    book_id = client.post("/books", json={"title": "Evented Book", "description": "Description", "author_id": author_id}).json()["id"]
+    borrow = client.post("/borrows", json={"book_id": book_id, "reader_name": "Evented Reader", "borrow_date": "2024-12-11"}).json()
+    borrow_id, reader_id = borrow["id"], borrow["reader_id"]
+    client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-20"})
+    client.patch(f"/borrows/{borrow_id}/return", json={"return_date": "2024-12-20"})
+    client.delete(f"/books/{book_id}")
+    assert client.get("/events", params={"after": after, "timeout": 0}).json() == {"items": [], "last_offset": after}
+
+    db = database.SessionLocal()
+    try:
+        with pytest.raises(ConnectionError):
+            events.publish_pending(db, ListSink(fail=True))
+        sink = ListSink()
+        assert events.publish_pending(db, sink) == 3
+    finally:
+        db.close()
+    assert [(item["offset"], item["type"]) for item in sink.events] == [
+        (after + 1, "borrow.created"), (after + 2, "borrow.returned"), (after + 3, "book.deleted"),
+    ]
+    assert sink.events[1]["payload"] == {"id": borrow_id, "book_id": book_id, "reader_id": reader_id, "reader_name": "Evented Reader", "borrow_date": "2024-12-11", "return_date": "2024-12-20"}
+
+    response_poll = client.get("/events", params={"after": after, "limit": 2, "timeout": 0})
+    assert [item["offset"] for item in response_poll.json()["items"]] == [after + 1, after + 2]
+    assert response_poll.json()["last_offset"] == after + 2
+
+    response_stream = client.get("/events", params={"timeout": 0}, headers={"Accept": "text/event-stream", "Last-Event-ID": str(after + 2)})
+    assert response_stream.headers["content-type"].startswith("text/event-stream")
+    assert f"id: {after + 3}\nevent: book.deleted\n" in response_stream.text
+    assert "borrow.returned" not in response_stream.text
+
+def test_in_memory_database_serves_concurrent_requests_under_lifespan(monkeypatch):
+    # Приложение само настраивает базу в памяти при запуске; параллельные запросы
+    # и фоновая публикация событий делят одно соединение.
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(metrics, "_engines", dict(metrics._engines))
+    # Событие, записанное во время публикации пачки, диспетчер заметит только при следующем опросе.
+    monkeypatch.setattr(events, "Dispatcher", functools.partial(events.Dispatcher, poll_seconds=0.05))
+    with TestClient(create_app("sqlite://")) as lifespan_client:
+        database.Base.metadata.create_all(bind=database.engine)
+        author_id = lifespan_client.post("/authors", json={"first_name": "Shared", "last_name": "Author", "birth_date": "1970-01-01"}).json()["id"]
+        book_id = lifespan_client.post("/books", json={"title": "Shared Book", "description": "Description", "author_id": author_id, "available_copies": 16}).json()["id"]
+
+        def borrow(number):
+            return lifespan_client.post("/borrows", json={"book_id": book_id, "reader_name": f"Shared Reader {number}", "borrow_date": "2024-12-11"})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(borrow, range(16)))
+        assert [response.status_code for response in responses] == [200] * 16
+        assert lifespan_client.get(f"/books/{book_id}").json()["available_copies"] == 0
+
+        deadline = time.monotonic() + 5
+        published = []
+        while len(published) < 16 and time.monotonic() < deadline:
+            published = lifespan_client.get("/events", params={"limit": 100, "timeout": 0}).json()["items"]
+            time.sleep(0.01)
+        assert [item["type"] for item in published] == ["borrow.created"] * 16
+    assert database.engine is None
+
+def test_reader_loans_limited_by_counter():
+    response_author = client.post("/authors", json={"first_name": "Reader", "last_name": "Author", "birth_date": "1970-01-01"})
+    book_ids = [
+        client.post("/books", json={"title": f"Loan Book {i}", "description": "Description", "author_id": response_author.json()["id"], "available_copies": 3}).json()["id"]
+        for i in range(3)
+    ]
+    response_reader = client.post("/readers", json={"name": "Limited Reader", "max_active_loans": 2})
+    assert response_reader.status_code == 200
+    reader_id = response_reader.json()["id"]
+    assert client.post("/readers", json={"name": "Limited Reader"}).status_code == 409
+
+    borrow_ids = [
+        client.post("/borrows", json={"book_id": book_id, "reader_id": reader_id, "borrow_date": "2024-12-01"}).json()["id"]
+        for book_id in book_ids[:2]
+    ]
+    response_limit = client.post("/borrows", json={"book_id": book_ids[2], "reader_name": "Limited Reader", "borrow_date": "2024-12-01"})
+    assert response_limit.status_code == 400 and response_limit.json()["detail"] == "Loan limit reached"
+    assert client.get(f"/books/{book_ids[2]}").json()["available_copies"] == 3
+    assert client.post("/borrows", json={"book_id": book_ids[2], "reader_id": 999999, "borrow_date": "2024-12-01"}).json()["detail"] == "Reader not found"
+
+    client.patch(f"/borrows/{borrow_ids[0]}/return", json={"return_date": "2024-12-05"})
+    response_active = client.get(f"/readers/{reader_id}/borrows", params={"active": True})
+    assert [item["id"] for item in response_active.json()["items"]] == borrow_ids[1:]
+    assert [item["id"] for item in client.get(f"/readers/{reader_id}/borrows").json()["items"]] == borrow_ids
+    assert client.get(f"/readers/{reader_id}").json()["active_loans"] == 1
+    assert client.get("/readers/999999/borrows").status_code == 404
+
+    batch = {"reader_id": reader_id, "borrow_date": "2024-12-06", "book_ids": book_ids, "mode": "partial"}
+    response_batch = client.post("/borrows/batch", json=batch)
+    assert response_batch.status_code == 409
+    assert {item["detail"] for item in response_batch.json()["detail"]["items"]} == {"Loan limit reached"}
+    assert client.get(f"/readers/{reader_id}").json()["active_loans"] == 1
+
+    response_new = client.post("/borrows", json={"book_id": book_ids[0], "reader_name": "Walk-in Reader", "borrow_date": "2024-12-06"})
+    walk_in = client.get(f"/readers/{response_new.json()['reader_id']}").json()
+    assert walk_in["name"] == "Walk-in Reader" and walk_in["active_loans"] == 1 and walk_in["max_active_loans"] is None
+
+    client.delete(f"/books/{book_ids[1]}")
+    assert client.get(f"/readers/{reader_id}").json()["active_loans"] == 0
+
+    db = database.SessionLocal()
+    try:
+        plan = " ".join(row[-1] for row in db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM borrows WHERE reader_id = :reader_id AND return_date IS NULL ORDER BY id"
+        ), {"reader_id": reader_id}))
+    finally:
+        db.close()
+    assert "ix_borrows_open_reader_id" in plan and "TEMP B-TREE" not in plan
+
+def test_metrics_endpoint_and_server_timing():
+    response_author = client.post("/authors", json={"first_name": "Metered", "last_name": "Author", "birth_date": "1970-01-01"})
+    assert "db;dur=" in response_author.headers["server-timing"]
+
+    response_metrics = client.get("/metrics")
+    assert response_metrics.status_code == 200
+    assert response_metrics.headers["content-type"].startswith("text/plain")
+    body = response_metrics.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/authors/",status="200"}' in body
+    assert 'http_request_db_queries_bucket{method="POST",route="/authors/",le="+Inf"}' in body
+    assert "db_query_duration_seconds_count" in body
+    assert "cache_hits_total" in body
+
+def test_failed_statement_is_not_timed(rollback_transaction):
+    connection = rollback_transaction
+    if connection.dialect.name != "sqlite":
+        pytest.skip("slow failing statement is built from a SQLite function")
+
+    def fail_slowly():
+        time.sleep(0.2)
+        raise ValueError("statement failed")
+
+    connection.connection.driver_connection.create_function("fail_slowly", 0, fail_slowly)
+    request_stats = metrics.RequestStats()
+    token = metrics._request_stats.set(request_stats)
+    try:
+        with pytest.raises(DBAPIError):
+            with connection.begin_nested():
+                connection.exec_driver_sql("SELECT fail_slowly()")
+        queries = request_stats.queries
+        assert connection.exec_driver_sql("SELECT 1").scalar() == 1
+    finally:
+        metrics._request_stats.reset(token)
+    # Следующий запрос учтен, а 0.2 с упавшего не попали ни в его время, ни в общее.
+    assert request_stats.queries == queries + 1
+    assert request_stats.db_time < 0.1
+
+def test_admission_rate_limits_and_sheds_load(monkeypatch):
+    groups = {
+        **admission.GROUPS,
+        "reads": admission.GroupLimits(rate=0, burst=0, concurrency=0, max_pool_wait_ms=500),
+        "borrows": admission.GroupLimits(rate=1, burst=2, concurrency=0, max_pool_wait_ms=0),
+        "writes": admission.GroupLimits(rate=0, burst=0, concurrency=1, max_pool_wait_ms=0),
+    }
+    limited = admission.AdmissionMiddleware(app, backend=admission.MemoryBackend(), groups=groups)
+    limited_client = TestClient(limited)
+    monkeypatch.setattr(admission, "ADMISSION_CLIENT_HEADER", "X-API-Key")
+    borrow = {"book_id": 999999, "reader_name": "Eager Reader", "borrow_date": "2024-12-11"}
+
+    assert [limited_client.post("/borrows/", json=borrow).status_code for _ in range(2)] == [400, 400]
+    response_limited = limited_client.post("/borrows/", json=borrow)
+    assert response_limited.status_code == 429 and response_limited.headers["retry-after"] == "1"
+    assert limited_client.post("/borrows/", json=borrow, headers={"X-API-Key": "other"}).status_code == 400
+    assert limited_client.get("/books/", params={"limit": 1}).status_code == 200
+    assert metrics.ADMISSION_REJECTED.count(group="borrows", reason="rate_limit") >= 1
+
+    monkeypatch.setattr(metrics, "pool_wait", lambda name="primary": 1.0)
+    response_shed = limited_client.get("/books/", params={"limit": 1})
+    assert response_shed.status_code == 503 and "retry-after" in response_shed.headers
+    assert limited_client.post("/borrows/", json=borrow, headers={"X-API-Key": "third"}).status_code == 400
+
+    limited.in_flight["writes"] = 1
+    assert limited_client.post("/authors/", json={"first_name": "Shed", "last_name": "Author", "birth_date": "1970-01-01"}).status_code == 503
+
+def test_redis_rate_limit_backend_runs_gcra_script():
+    redis_client = fakeredis.FakeRedis()
+    backend = admission.RedisBackend(redis_client)
+    rate, burst = 20, 2
+    assert [backend.take("reads:client", rate, burst) for _ in range(burst)] == [0, 0]
+    retry_after = backend.take("reads:client", rate, burst)
+    assert 0 < retry_after <= 1 / rate
+    assert backend.take("reads:other", rate, burst) == 0
+    assert 0 < redis_client.pttl("library:ratelimit:reads:client") <= burst * 1000 / rate
+
+    time.sleep(retry_after)
+    assert backend.take("reads:client", rate, burst) == 0
+    assert backend.take("reads:client", rate, burst) > 0
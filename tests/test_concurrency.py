@@ -0,0 +1,154 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from app import crud, database, events, models, schemas
+from app.database import SessionLocal
+from app.main import app
+
+client = TestClient(app)
+
+# Параллельным потокам нужны отдельные соединения и настоящая фиксация транзакций.
+pytestmark = pytest.mark.usefixtures("committed_database")
+
+THREADS = 16
+ATTEMPTS = 64
+COPIES = 10
+
+# Малый вариант (копий меньше, чем попыток) идет в каждом прогоне и ловит возврат
+# к чтению-изменению-записи; полный идет секунды и запускается только с --run-slow.
+SIZES = pytest.mark.parametrize("threads, attempts, copies", [
+    pytest.param(4, 8, 3, id="small"),
+    pytest.param(THREADS, ATTEMPTS, COPIES, id="full", marks=pytest.mark.slow),
+])
+
+def create_book(copies):
+    response_author = client.post("/authors", json={"first_name": "Concurrent", "last_name": "Author", "birth_date": "1980-01-01"})
+    assert response_author.status_code == 200
+    response_book = client.post("/books", json={"title": "Contended Book", "description": "Description", "author_id": response_author.json()["id"], "available_copies": copies})
+    assert response_book.status_code == 200
+    return response_book.json()["id"]
+
+def borrow_once(book_id, n, reader_name=None):
+    db = SessionLocal()
+    try:
+        crud.create_borrow(db, schemas.BorrowCreate(book_id=book_id, reader_name=reader_name or f"Reader {n}", borrow_date="2024-12-11"))
+        return True
+    except ValueError:
+        return False
+    finally:
+        db.close()
+
+def borrow_and_return(book_id, n):
+    db = SessionLocal()
+    try:
+        try:
+            borrow = crud.create_borrow(db, schemas.BorrowCreate(book_id=book_id, reader_name=f"Reader {n}", borrow_date="2024-12-11"))
+        except ValueError:
+            return 0
+        # Повтор возврата (например, после таймаута клиента) не должен вернуть копию дважды.
+        for _ in range(2):
+            crud.return_borrow(db, borrow.id, borrow.borrow_date)
+        return 1
+    finally:
+        db.close()
+
+@SIZES
+def test_concurrent_borrows_never_oversell(threads, attempts, copies):
+    book_id = create_book(copies)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda n: borrow_once(book_id, n), range(attempts)))
+    elapsed = time.perf_counter() - started
+    print(f"\n{attempts} borrow attempts from {threads} threads: {attempts / elapsed:.1f} req/s")
+
+    assert results.count(True) == copies
+
+    db = SessionLocal()
+    try:
+        book = db.get(models.Book, book_id)
+        borrows = db.query(models.Borrow).filter(models.Borrow.book_id == book_id).count()
+    finally:
+        db.close()
+    assert book.available_copies == 0
+    assert borrows == copies
+
+@SIZES
+def test_parallel_borrow_and_return_keep_copies_consistent(threads, attempts, copies):
+    book_id = create_book(copies // 2)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        completed = sum(pool.map(lambda n: borrow_and_return(book_id, n), range(attempts)))
+    elapsed = time.perf_counter() - started
+    print(f"\n{attempts} borrow/return cycles from {threads} threads: {attempts / elapsed:.1f} cycles/s")
+
+    db = SessionLocal()
+    try:
+        book = db.get(models.Book, book_id)
+        open_borrows = (
+            db.query(models.Borrow)
+            .filter(models.Borrow.book_id == book_id, models.Borrow.return_date.is_(None))
+            .count()
+        )
+    finally:
+        db.close()
+    assert completed >= copies // 2
+    assert open_borrows == 0
+    assert book.available_copies == copies // 2
+
+@pytest.mark.parametrize("threads, attempts", [
+    pytest.param(4, crud.MAX_ACTIVE_LOANS + 3, id="small"),
+    pytest.param(THREADS, ATTEMPTS, id="full", marks=pytest.mark.slow),
+])
+def test_concurrent_borrows_respect_loan_limit(threads, attempts):
+    book_id = create_book(COPIES)
+
+    # Читатель создается первой выдачей; параллельные выдачи не должны создать дубликаты или превысить лимит.
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda n: borrow_once(book_id, n, "Busy Reader"), range(attempts)))
+
+    db = SessionLocal()
+    try:
+        readers = db.query(models.Reader).filter(models.Reader.name == "Busy Reader").all()
+        borrows = db.query(models.Borrow).filter(models.Borrow.book_id == book_id).count()
+        book = db.get(models.Book, book_id)
+    finally:
+        db.close()
+    assert results.count(True) == crud.MAX_ACTIVE_LOANS == borrows
+    assert len(readers) == 1 and readers[0].active_loans == crud.MAX_ACTIVE_LOANS
+    assert book.available_copies == COPIES - crud.MAX_ACTIVE_LOANS
+
+@pytest.mark.slow
+def test_publish_waits_for_concurrent_writer():
+    db = SessionLocal()
+    try:
+        events.record(db, "borrow.created", [{"id": 1}])
+        db.commit()
+    finally:
+        db.close()
+
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_write_lock():
+        # Параллельная выдача, удерживающая блокировку SQLite на запись.
+        with database.engine.connect() as connection:
+            connection.execute(insert(models.Reader).values(name="Lock Holder"))
+            locked.set()
+            release.wait(5)
+            connection.commit()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        holder = pool.submit(hold_write_lock)
+        locked.wait(5)
+        threading.Timer(0.2, release.set).start()
+        db = SessionLocal()
+        try:
+            published = events.publish_pending(db, events.NullSink())
+        finally:
+            db.close()
+        holder.result()
+    assert published >= 1